@@ -0,0 +1,9 @@
+# coding=utf-8
+
+"""
+@Author: LiangChao
+@Email: nobody_team@outlook.com
+@File: __init__.py
+@Created: 2026/10/18
+@Desc: 性能基准
+"""
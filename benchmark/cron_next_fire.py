@@ -0,0 +1,90 @@
+# coding=utf-8
+
+"""
+@Author: LiangChao
+@Email: nobody_team@outlook.com
+@File: cron_next_fire
+@Created: 2026/10/18
+@Desc: cron 下次执行时间基准：编译吞吐、位集合逐字段跳转的 next_fire 吞吐，对比逐分钟扫描
+
+python -m benchmark.cron_next_fire [表达式数] [逐分钟扫描的表达式数]
+"""
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+from nobody.cron import Cron
+
+
+def _field(low, high, star=0.5):
+    r = random.random()
+    if r < star:
+        return '*'
+    if r < star + 0.15:
+        return f'*/{random.randint(2, (high - low + 1) // 2)}'
+    a = random.randint(low, high)
+    b = random.randint(a, high)
+    if r < star + 0.3:
+        return f'{a}-{b}'
+    return ','.join(str(v) for v in sorted(random.sample(range(low, high + 1), random.randint(1, 3))))
+
+
+def expressions(count, seed=0):
+    """
+    随机生成常见形态的表达式：分、时多为具体值或步长，日、月多为 *，周为 * 或工作日
+
+    :param count:
+    :param seed:
+    :return:
+    """
+    random.seed(seed)
+    return [' '.join((_field(0, 59, 0.1), _field(0, 23, 0.3), _field(1, 31, 0.8), _field(1, 12, 0.85),
+                      random.choice(('*', '*', '1-5', '0,6', _field(0, 6, 0)))))
+            for _ in range(count)]
+
+
+def _scan(cron, after, limit=timedelta(days=400)):
+    """
+    逐分钟扫描的基准实现
+
+    :return:
+    """
+    moment = after.replace(second=0, microsecond=0) + timedelta(minutes=1)
+    end = after + limit
+    while moment < end:
+        if cron.match(moment):
+            return moment
+        moment += timedelta(minutes=1)
+    return None
+
+
+def _report(name, count, seconds):
+    print(f'{name:<28} {count / seconds:12.0f} /s {seconds / count * 1e6:10.2f} us/call')
+
+
+def main(count=100000, scan_count=200):
+    texts = expressions(count)
+    after = datetime(2026, 10, 18, 12, 34, 56)
+
+    begin = time.perf_counter()
+    crons = [Cron(text) for text in texts]
+    _report('compile', count, time.perf_counter() - begin)
+
+    begin = time.perf_counter()
+    fires = [cron.next_fire(after) for cron in crons]
+    _report('next_fire (bitset jump)', count, time.perf_counter() - begin)
+
+    begin = time.perf_counter()
+    for cron, fire in zip(crons, fires):
+        cron.next_fire(fire)
+    _report('next_fire (chained)', count, time.perf_counter() - begin)
+
+    begin = time.perf_counter()
+    scanned = [_scan(cron, after) for cron in crons[:scan_count]]
+    _report('minute scan', scan_count, time.perf_counter() - begin)
+    assert scanned == fires[:scan_count], '逐分钟扫描与 next_fire 的结果不一致'
+
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:]))
@@ -0,0 +1,66 @@
+# coding=utf-8
+
+"""
+@Author: LiangChao
+@Email: nobody_team@outlook.com
+@File: task_checkpoint
+@Created: 2026/10/18
+@Desc: 检查点开销基准，对比旧的 pausable（每次调用 Event.wait）与 checkpoint 快速路径
+
+python -m benchmark.task_checkpoint [调用次数]
+"""
+import sys
+import timeit
+from functools import wraps
+
+from nobody.task import _TaskHandler, _ProcessTaskHandler, _current_handler, pausable, checkpoint
+
+
+def _legacy_pausable(func):
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        obj = args[0]
+        if hasattr(obj, 'task_handler') and obj.task_handler:
+            obj.task_handler.wait()
+        return func(*args, **kwargs)
+
+    return wrapper
+
+
+class _Worker:
+    def __init__(self, task_handler):
+        self.task_handler = task_handler
+
+    def step(self):
+        pass
+
+    legacy_step = _legacy_pausable(step)
+    pausable_step = pausable(step)
+
+
+def _report(name, statement, number):
+    seconds = min(timeit.repeat(statement, number=number, repeat=5))
+    print(f'{name:<32} {seconds / number * 1e9:8.1f} ns/call')
+
+
+def main(number=200000):
+    thread_handler = _TaskHandler()
+    process_handler = _ProcessTaskHandler()
+    worker = _Worker(thread_handler)
+    _current_handler.set(thread_handler)
+    try:
+        _report('baseline (no check)', worker.step, number)
+        _report('legacy pausable', worker.legacy_step, number)
+        _report('pausable', worker.pausable_step, number)
+        _report('checkpoint()', checkpoint, number)
+        _report('handler.checkpoint()', thread_handler.checkpoint, number)
+        _report('handler.checkpoint(every=64)', lambda: thread_handler.checkpoint(64), number)
+        _report('process handler.wait()', process_handler.wait, number)
+        _report('process handler.checkpoint()', process_handler.checkpoint, number)
+        _report('process checkpoint(every=64)', lambda: process_handler.checkpoint(64), number)
+    finally:
+        process_handler.close()
+
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:]))
@@ -0,0 +1,81 @@
+# coding=utf-8
+
+"""
+@Author: LiangChao
+@Email: nobody_team@outlook.com
+@File: task_dispatch
+@Created: 2026/10/18
+@Desc: 任务分发延迟基准，对比旧的 1 秒轮询分发与基于就绪堆 + 条件变量的分发
+
+python -m benchmark.task_dispatch [任务数]
+"""
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures.thread import ThreadPoolExecutor
+
+from nobody.task import task_service
+
+
+class _PollingDispatcher:
+    """
+    旧分发方式：每秒扫描一次全部任务
+    """
+
+    def __init__(self):
+        self._tasks = []
+        self._executor = ThreadPoolExecutor()
+        self._working = True
+        threading.Thread(target=self._work, daemon=True).start()
+
+    def submit(self, target, *args):
+        self._tasks.append([target, args, False])
+
+    def _work(self):
+        while self._working:
+            for item in list(self._tasks):
+                if not item[2]:
+                    item[2] = True
+                    self._executor.submit(item[0], *item[1])
+            time.sleep(1)
+
+    def stop(self):
+        self._working = False
+        self._executor.shutdown()
+
+
+def _measure(submit, count, interval=0.005):
+    latencies = []
+    done = threading.Semaphore(0)
+
+    def target(submitted):
+        latencies.append(time.perf_counter() - submitted)
+        done.release()
+
+    for _ in range(count):
+        submit(target, time.perf_counter())
+        time.sleep(interval)
+    for _ in range(count):
+        done.acquire()
+    return latencies
+
+
+def _report(name, latencies):
+    latencies = sorted(latencies)
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+    print(f'{name:<10} mean={statistics.mean(latencies) * 1000:9.3f}ms '
+          f'p50={statistics.median(latencies) * 1000:9.3f}ms '
+          f'p99={p99 * 1000:9.3f}ms max={latencies[-1] * 1000:9.3f}ms')
+
+
+def main(count=200):
+    polling = _PollingDispatcher()
+    _report('polling', _measure(polling.submit, count))
+    polling.stop()
+    _report('heap', _measure(task_service.submit, count))
+    task_service.stop()
+
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:]))
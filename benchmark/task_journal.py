@@ -0,0 +1,59 @@
+# coding=utf-8
+
+"""
+@Author: LiangChao
+@Email: nobody_team@outlook.com
+@File: task_journal
+@Created: 2026/10/18
+@Desc: 任务日志提交吞吐基准：不开日志、后台组提交、同步落盘（多个提交线程共享一次 fsync）
+
+python -m benchmark.task_journal [任务数] [提交线程数]
+"""
+import logging
+import os
+import sys
+import tempfile
+import threading
+import time
+
+from nobody.log import logger
+from nobody.task import task_service, join
+
+
+def noop():
+    pass
+
+
+def _measure(count, producers):
+    tasks = []
+
+    def produce(n):
+        tasks.extend(task_service.submit(noop) for _ in range(n))
+
+    threads = [threading.Thread(target=produce, args=(count // producers,)) for _ in range(producers)]
+    begin = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    submitted = time.perf_counter() - begin
+    join(tasks)
+    return len(tasks) / submitted
+
+
+def main(count=20000, producers=8):
+    logger.setLevel(logging.INFO)
+    task_service.set_retention(keep_last=0)
+    path = os.path.join(tempfile.mkdtemp(), 'task.journal')
+    print(f'{"no journal":<28} {_measure(count, producers):10.0f} submits/s')
+    task_service.enable_journal(path)
+    print(f'{"journal (group commit)":<28} {_measure(count, producers):10.0f} submits/s')
+    task_service.enable_journal(path, sync=True)
+    print(f'{"journal (sync, " + str(producers) + " threads)":<28} {_measure(count, producers):10.0f} submits/s')
+    task_service.disable_journal()
+    print(f'journal size after run: {os.path.getsize(path)} bytes')
+    task_service.stop()
+
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:]))
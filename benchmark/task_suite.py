@@ -0,0 +1,325 @@
+# coding=utf-8
+
+"""
+@Author: LiangChao
+@Email: nobody_team@outlook.com
+@File: task_suite
+@Created: 2026/10/18
+@Desc: 任务服务综合基准：提交/完成吞吐、提交到开始执行的延迟分位数、暂停恢复往返延迟、
+       排队任务的内存占用、监听器开销；按工作线程数 × 任务数组合运行，结果输出为 JSON，便于版本间对比
+
+python -m benchmark.task_suite --workers 8 32 --tasks 1000 100000 --output result.json
+python -m benchmark.task_suite --compare old.json new.json
+"""
+import argparse
+import gc
+import json
+import logging
+import os
+import platform
+import subprocess
+import sys
+import threading
+import time
+import tracemalloc
+from datetime import datetime
+
+from nobody.log import logger
+from nobody.task import task_service, event_bus, join, checkpoint, TaskListener
+
+# 对比时数值越小越好的指标，其余越大越好
+_LOWER_IS_BETTER = ('latency', 'bytes', 'overhead', 'seconds')
+_PARAMETERS = ('workers', 'tasks', 'listeners_per_task')  # 运行参数而非指标，不参与对比
+
+
+def noop():
+    pass
+
+
+def _percentiles(samples):
+    samples = sorted(samples)
+    if not samples:
+        return {}
+
+    def at(q):
+        return samples[min(len(samples) - 1, int(len(samples) * q))]
+
+    return {
+        'p50': at(0.5),
+        'p90': at(0.9),
+        'p99': at(0.99),
+        'p999': at(0.999),
+        'max': samples[-1],
+        'mean': sum(samples) / len(samples),
+    }
+
+
+def bench_throughput(count):
+    """
+    单线程逐个提交空任务，分别统计提交速率与从开始提交到全部完成的速率
+
+    :param count:
+    :return:
+    """
+    begin = time.perf_counter()
+    tasks = [task_service.submit(noop) for _ in range(count)]
+    submitted = time.perf_counter() - begin
+    join(tasks)
+    completed = time.perf_counter() - begin
+    return {
+        'submitted_per_second': count / submitted,
+        'completed_per_second': count / completed,
+        'seconds': completed,
+    }
+
+
+def bench_latency(count, interval=0.0005):
+    """
+    提交到开始执行的延迟，按固定间隔提交，避免只测到排队时间
+
+    :param count:
+    :param interval: 提交间隔秒数
+    :return: 各分位数，单位毫秒
+    """
+    latencies = [0.0] * count
+
+    def target(index, submitted):
+        latencies[index] = time.perf_counter() - submitted
+
+    tasks = []
+    for i in range(count):
+        tasks.append(task_service.submit(target, i, time.perf_counter()))
+        if interval:
+            time.sleep(interval)
+    join(tasks)
+    return {k: v * 1000 for k, v in _percentiles(latencies).items()}
+
+
+def bench_pause_resume(rounds):
+    """
+    暂停恢复往返延迟：
+    pause 为调用 pause_task 到任务在检查点停下（最后一次心跳）的时间，
+    resume 为调用 resume_task 到任务重新产生心跳的时间
+
+    :param rounds:
+    :return: 各分位数，单位毫秒
+    """
+    heartbeat = [0.0, 0]  # 最近一次心跳的时间, 心跳次数
+    stopping = threading.Event()
+
+    def spin():
+        while not stopping.is_set():
+            heartbeat[0] = time.perf_counter()
+            heartbeat[1] += 1
+            checkpoint()
+
+    task = task_service.submit(spin)
+    while not heartbeat[1]:
+        time.sleep(0.001)
+    pauses, resumes = [], []
+    for _ in range(rounds):
+        begin = time.perf_counter()
+        task_service.pause_task(task.id)
+        count = heartbeat[1]
+        time.sleep(0.002)
+        while heartbeat[1] != count:  # 等待任务在检查点停下
+            count = heartbeat[1]
+            time.sleep(0.002)
+        pauses.append(max(0.0, heartbeat[0] - begin))
+        begin = time.perf_counter()
+        task_service.resume_task(task.id)
+        while heartbeat[1] == count:
+            time.sleep(0)  # 让出 GIL，忙等会把恢复延迟拉长到线程切换间隔
+        resumes.append(heartbeat[0] - begin)
+    stopping.set()
+    join([task])
+    return {
+        'pause_latency': {k: v * 1000 for k, v in _percentiles(pauses).items()},
+        'resume_latency': {k: v * 1000 for k, v in _percentiles(resumes).items()},
+        'round_trip_latency': {k: v * 1000 for k, v in _percentiles([p + r for p, r in zip(pauses, resumes)]).items()},
+    }
+
+
+def bench_memory(count, workers):
+    """
+    排队任务的内存占用：占满全部工作线程后提交 count 个任务，统计新分配的内存
+
+    :param count:
+    :param workers: 工作线程数
+    :return:
+    """
+    release = threading.Event()
+    blockers = [task_service.submit(release.wait) for _ in range(workers)]
+    while task_service.count('running') < workers:
+        time.sleep(0.001)
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    tasks = [task_service.submit(noop) for _ in range(count)]
+    gc.collect()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    release.set()
+    join(blockers + tasks)
+    return {
+        'tasks': count,
+        'bytes_per_task': (after - before) / count,
+    }
+
+
+class _NoopListener(TaskListener):
+    pass
+
+
+class _NoopSyncListener(TaskListener):
+    synchronous = True
+
+
+def bench_listeners(count, listeners=4):
+    """
+    监听器开销：每个任务挂 listeners 个空监听器，对比不挂时的完成速率
+
+    :param count:
+    :param listeners: 每个任务的监听器数
+    :return:
+    """
+
+    def run(listener_type):
+        begin = time.perf_counter()
+        tasks = []
+        for _ in range(count):
+            task = task_service.submit(noop)
+            if listener_type:
+                for _ in range(listeners):
+                    task.add_listener(listener_type())
+            tasks.append(task)
+        join(tasks)
+        event_bus.flush()
+        return count / (time.perf_counter() - begin)
+
+    baseline = run(None)
+    asynchronous = run(_NoopListener)
+    synchronous = run(_NoopSyncListener)
+    return {
+        'listeners_per_task': listeners,
+        'baseline_per_second': baseline,
+        'async_per_second': asynchronous,
+        'sync_per_second': synchronous,
+        'async_overhead': 1 - asynchronous / baseline,
+        'sync_overhead': 1 - synchronous / baseline,
+    }
+
+
+def _environment():
+    try:
+        revision = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                  cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        revision = None
+    return {
+        'time': datetime.now().isoformat(timespec='seconds'),
+        'revision': revision,
+        'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+    }
+
+
+def run(workers, tasks, latency_tasks=2000, pause_rounds=200, memory_tasks=100000, listener_tasks=20000):
+    """
+    按工作线程数 × 任务数的组合运行全部基准
+
+    :param workers: 工作线程数列表
+    :param tasks: 任务数列表，用于吞吐
+    :param latency_tasks: 延迟基准的任务数
+    :param pause_rounds: 暂停恢复的轮数
+    :param memory_tasks: 内存基准的任务数上限，不超过当前任务数
+    :param listener_tasks: 监听器基准的任务数上限，不超过当前任务数
+    :return:
+    """
+    task_service.set_retention(keep_last=0)
+    results = []
+    for worker_count in workers:
+        task_service.configure(max_workers=worker_count)
+        pause_resume = bench_pause_resume(pause_rounds)
+        latency = bench_latency(latency_tasks)
+        for count in tasks:
+            logger.info(f'基准：workers={worker_count}, tasks={count}')
+            results.append({
+                'workers': worker_count,
+                'tasks': count,
+                'throughput': bench_throughput(count),
+                'submit_to_start_latency': latency,
+                'pause_resume': pause_resume,
+                'memory': bench_memory(min(count, memory_tasks), worker_count),
+                'listeners': bench_listeners(min(count, listener_tasks)),
+            })
+    task_service.stop()
+    return {'environment': _environment(), 'results': results}
+
+
+def _flatten(value, prefix=''):
+    if isinstance(value, dict):
+        for k, v in value.items():
+            yield from _flatten(v, f'{prefix}.{k}' if prefix else k)
+    elif isinstance(value, (int, float)):
+        yield prefix, value
+
+
+def compare(old, new, threshold=0.1):
+    """
+    对比两次结果，按 (workers, tasks) 对齐，打印变化超过 threshold 的指标
+
+    :param old: 旧结果文件
+    :param new: 新结果文件
+    :param threshold: 相对变化的阈值
+    :return: 变差的指标数
+    """
+    with open(old, encoding='utf-8') as f:
+        old = {(r['workers'], r['tasks']): dict(_flatten(r)) for r in json.load(f)['results']}
+    with open(new, encoding='utf-8') as f:
+        new = {(r['workers'], r['tasks']): dict(_flatten(r)) for r in json.load(f)['results']}
+    regressions = 0
+    for key in sorted(old.keys() & new.keys()):
+        for name, before in old[key].items():
+            after = new[key].get(name)
+            if after is None or not before or name.rpartition('.')[2] in _PARAMETERS:
+                continue
+            change = (after - before) / abs(before)
+            if abs(change) < threshold:
+                continue
+            worse = change > 0 if any(word in name for word in _LOWER_IS_BETTER) else change < 0
+            regressions += worse
+            print(f'workers={key[0]:<4} tasks={key[1]:<8} {name:<42} {before:14.3f} -> {after:14.3f} '
+                  f'{change:+8.1%} {"WORSE" if worse else "better"}')
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmark.task_suite', description='任务服务综合基准')
+    parser.add_argument('--workers', type=int, nargs='+', default=[os.cpu_count() or 1])
+    parser.add_argument('--tasks', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--latency-tasks', type=int, default=2000)
+    parser.add_argument('--pause-rounds', type=int, default=200)
+    parser.add_argument('--memory-tasks', type=int, default=100000)
+    parser.add_argument('--listener-tasks', type=int, default=20000)
+    parser.add_argument('--output', help='结果文件，默认输出到标准输出')
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'), help='对比两次结果，有指标变差时退出码为 1')
+    args = parser.parse_args(argv)
+    if args.compare:
+        return 1 if compare(*args.compare) else 0
+    logger.setLevel(logging.INFO)
+    result = run(args.workers, args.tasks, args.latency_tasks, args.pause_rounds, args.memory_tasks,
+                 args.listener_tasks)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+    else:
+        json.dump(result, sys.stdout, ensure_ascii=False, indent=2)
+        print()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
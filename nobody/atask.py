@@ -0,0 +1,426 @@
+# coding=utf-8
+
+"""
+@Author: LiangChao
+@Email: nobody_team@outlook.com
+@File: atask
+@Created: 2026/10/18
+@Desc: 基于 asyncio 的任务服务，用于大量 I/O 密集型的协程任务，生命周期与监听器同 nobody.task
+"""
+import asyncio
+import threading
+import traceback
+from datetime import datetime
+from functools import wraps
+
+from nobody.log import logger
+from nobody.task import _Task, _TaskRegistry, _current_handler, RUNNING, TERMINATED, PAUSED, FINISHED, CANCELED, FAILED, \
+    ALL_COMPLETED, TaskTerminatedError, TaskNotReadyError, TaskNotFoundError
+
+
+def pausable(func):
+    """
+    协程版 pausable，在调用被修饰的协程前检查暂停与终止
+
+    :param func:
+    :return:
+    """
+
+    @wraps(func)
+    async def wrapper(*args, **kwargs):
+        obj = args[0] if args else None
+        task_handler = getattr(obj, 'task_handler', None) or _current_handler.get()
+        if task_handler:
+            await task_handler.checkpoint()
+        return await func(*args, **kwargs)
+
+    return wrapper
+
+
+async def checkpoint(every=1):
+    """
+    协程版检查点，参见 nobody.task.checkpoint
+
+    :param every: 每调用 every 次才真正检查一次
+    :return:
+    """
+    task_handler = _current_handler.get()
+    if task_handler is not None:
+        await task_handler.checkpoint(every)
+
+
+async def join(tasks, timeout=None, return_when=ALL_COMPLETED):
+    """
+    在协程中等待一组任务结束
+
+    :param tasks:
+    :param timeout:
+    :param return_when: ALL_COMPLETED、FIRST_COMPLETED 或 FIRST_EXCEPTION
+    :return: (已结束的任务, 未结束的任务)
+    """
+    tasks = {asyncio.wrap_future(task._done): task for task in tasks}
+    if not tasks:
+        return set(), set()
+    done, not_done = await asyncio.wait(tasks, timeout=timeout, return_when=return_when)
+    return {tasks[f] for f in done}, {tasks[f] for f in not_done}
+
+
+class _AsyncTaskHandler(object):
+    """
+    协程任务控制器，暂停与恢复基于 asyncio.Event，可在任意线程调用
+    """
+
+    def __init__(self, loop=None):
+        self._loop = loop
+        self._event = asyncio.Event()
+        self._event.set()
+        self._force_stop = False
+        self._stop_reason = None
+        self._pause_timeout = None
+        self._signal = False
+        self._ticks = 0
+        self._children = None
+
+    def _call(self, func, *args):
+        """
+        在事件循环线程中调用，asyncio.Event 不是线程安全的
+
+        :return:
+        """
+        try:
+            running_loop = asyncio.get_running_loop()
+        except RuntimeError:
+            running_loop = None
+        if self._loop is None or running_loop is self._loop:
+            func(*args)
+        else:
+            self._loop.call_soon_threadsafe(func, *args)
+
+    async def wait(self, timeout=None):
+        if self._force_stop:
+            raise TaskTerminatedError(self._stop_reason)
+        if self._event.is_set():
+            return
+        try:
+            await asyncio.wait_for(self._event.wait(), timeout or self._pause_timeout)
+        except asyncio.TimeoutError:
+            pass
+        if self._force_stop:
+            raise TaskTerminatedError(self._stop_reason)
+
+    async def checkpoint(self, every=1):
+        """
+        检查点，未暂停且未终止时不进入 asyncio.Event
+
+        :param every: 每调用 every 次才真正检查一次
+        :return:
+        """
+        if every > 1:
+            self._ticks += 1
+            if self._ticks < every:
+                return
+            self._ticks = 0
+        if self._signal:
+            await self.wait()
+
+    def pause(self, timeout=None):
+        """
+        暂停执行
+
+        :return:
+        """
+        self._pause_timeout = timeout
+        self._signal = True
+        self._call(self._event.clear)
+
+    def resume(self):
+        """
+        恢复执行
+
+        :return:
+        """
+        self._signal = self._force_stop
+        self._call(self._event.set)
+
+    def force_stop(self, reason=None):
+        """
+        强行停止，同时终止关联的子任务
+
+        :return:
+        """
+        self._force_stop = True
+        self._stop_reason = reason
+        self._signal = True
+        self._call(self._event.set)
+        for child in self._children or ():
+            child.force_stop(reason)
+
+    def link(self, child):
+        """
+        关联子任务的控制器
+
+        :param child:
+        :return:
+        """
+        if self._children is None:
+            self._children = []
+        self._children.append(child)
+        if self._force_stop:
+            child.force_stop(self._stop_reason)
+
+    def handle(self, target, *args, **kwargs):
+        obj = target(*args, **kwargs) if isinstance(target, type) else target
+        setattr(obj, 'task_handler', self)
+        return obj
+
+
+class _AsyncTask(_Task):
+    """
+    协程任务，future 为 asyncio.Task，终止通过 Task.cancel 实现
+    """
+    __slots__ = ()
+
+    def __init__(self, target, *args, **kwargs):
+        super().__init__(target, *args, **kwargs)
+        self.task_handler = _AsyncTaskHandler()
+
+    async def run(self):
+        if self.status:
+            return
+        if not self.ready:
+            raise TaskNotReadyError(self.id)
+        if not self._transition(RUNNING):  # 刚被取消
+            return
+        _current_handler.set(self.task_handler)  # 每个 asyncio.Task 拥有独立的上下文
+        try:
+            self._result = await self._target(*self._args, **self._kwargs)
+            self.status = FINISHED
+        except TaskTerminatedError:
+            if self.status != TERMINATED:
+                self.status = TERMINATED
+        except asyncio.CancelledError:
+            if self.status != TERMINATED:
+                raise
+        except Exception as e:
+            logger.error(traceback.format_exc())
+            self._transition(FAILED, e)
+
+    def __await__(self):
+        """
+        在协程中等待任务结束并获取返回值，可跨事件循环
+
+        :return:
+        """
+        return asyncio.wrap_future(self._done).__await__()
+
+    def stop(self, reason=None, *args, **kwargs):
+        """
+        终止任务
+
+        :param reason:
+        :return:
+        """
+        assert self.status in (RUNNING, PAUSED), f'只能终止执行中的任务！'
+        self.task_handler.force_stop(reason)
+        if not self._transition(TERMINATED):  # 已经结束
+            return
+        if self.future:
+            self.task_handler._call(self.future.cancel)
+        self._emit('on_terminated', *args, **kwargs)
+
+    def cancel(self):
+        """
+        取消任务，只能取消尚未开始执行的任务
+
+        :return:
+        """
+        if self.status:
+            return self.status == CANCELED
+        self.status = CANCELED
+        if self.future:
+            self.task_handler._call(self.future.cancel)
+        return True
+
+
+class __AsyncTaskService(object):
+    def __init__(self):
+        self._registry = _TaskRegistry()
+        self._loop = None
+        self._thread = None
+        self._lock = threading.Lock()
+        self.daemon = True
+
+    @property
+    def working(self):
+        return bool(self._loop and self._loop.is_running())
+
+    @property
+    def loop(self):
+        return self._loop
+
+    @property
+    def tasks(self):
+        return self._registry.ids()
+
+    def get_tasks(self, status=None):
+        """
+        获取指定状态的任务
+
+        :param status: 任务状态，None 表示尚未开始执行的任务
+        :return:
+        """
+        return self._registry.get_tasks(status)
+
+    def count(self, status=None):
+        """
+        统计指定状态的任务数
+
+        :param status: 任务状态，None 表示尚未开始执行的任务
+        :return:
+        """
+        return self._registry.count(status)
+
+    def set_retention(self, keep_last=None, keep_for=None, on_evict=None):
+        """
+        设置已结束任务的保留策略，参见 task_service.set_retention
+
+        :return:
+        """
+        self._registry.set_retention(keep_last, keep_for, on_evict)
+
+    def get_task(self, task_id):
+        """
+        获取任务
+
+        :param task_id:
+        :return:
+        """
+        return self._registry.get(task_id)
+
+    def submit(self, target, *args, task_schedule=None, **kwargs):
+        """
+        提交协程任务，可在任意线程调用。服务的选项以 task_ 开头，其余参数原样传给协程函数
+
+        :param target: 协程函数
+        :param task_schedule: 执行计划，为空则立即执行
+        :return:
+        """
+        if not self.working:
+            self.start()
+        task = _AsyncTask(target, *args, **kwargs)
+        task.schedule = task_schedule
+        task.task_handler._loop = self._loop
+        self._registry.add(task)
+        self._loop.call_soon_threadsafe(self.__create_task, task)
+        return task
+
+    def __create_task(self, task):
+        if task.status:  # 已取消
+            return
+        delay = ((task.next_fire or task._arm()) - datetime.now()).total_seconds() if task.schedule else 0
+        task.future = self._loop.create_task(self.__run(task, delay))
+        task.future.add_done_callback(lambda f: self.__callback(task, f))
+
+    @staticmethod
+    async def __run(task, delay):
+        if delay > 0:
+            await asyncio.sleep(delay)
+        await task.run()
+
+    @staticmethod
+    def __callback(task, future):
+        if future.cancelled():
+            if not task.status:
+                task.status = CANCELED
+            elif task.status in (RUNNING, PAUSED):  # 执行中被 stop() 取消
+                task.task_handler.force_stop('service stopped')
+                if task._transition(TERMINATED):
+                    task._emit('on_terminated')
+        elif future.exception() is not None and task.status == RUNNING:
+            task._transition(FAILED, future.exception())
+
+    def pause_task(self, task_id, timeout=None):
+        """
+        暂停任务
+
+        :param task_id:
+        :param timeout:
+        :return:
+        """
+        return self.__get(task_id).pause(timeout)
+
+    def resume_task(self, task_id):
+        """
+        恢复任务
+
+        :param task_id:
+        :return:
+        """
+        return self.__get(task_id).resume()
+
+    def stop_task(self, task_id, reason=None):
+        """
+        终止任务
+
+        :param task_id:
+        :param reason:
+        :return:
+        """
+        self.__get(task_id).stop(reason)
+
+    def cancel_task(self, task_id):
+        """
+        取消任务
+
+        :param task_id:
+        :return:
+        """
+        return self.__get(task_id).cancel()
+
+    def __get(self, task_id):
+        task = self._registry.get(task_id)
+        if not task:
+            raise TaskNotFoundError(task_id)
+        return task
+
+    def start(self):
+        """
+        在独立线程中启动事件循环
+
+        :return:
+        """
+        with self._lock:
+            if self.working:
+                return
+            self._loop = asyncio.new_event_loop()
+            started = threading.Event()
+            self._loop.call_soon(started.set)
+            self._thread = threading.Thread(target=self._loop.run_forever, name='异步任务池', daemon=self.daemon)
+            self._thread.start()
+            started.wait()
+            logger.debug('开启线程：异步任务池')
+
+    def stop(self):
+        """
+        停止事件循环，尚未开始的任务被取消，执行中及暂停中的任务被终止
+
+        :return:
+        """
+        with self._lock:
+            if not self.working:
+                return
+
+            async def _cancel_all():
+                pending = [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
+                for t in pending:
+                    t.cancel()
+                await asyncio.gather(*pending, return_exceptions=True)
+
+            asyncio.run_coroutine_threadsafe(_cancel_all(), self._loop).result()
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join()
+            self._loop.close()
+            self._loop = None
+
+
+async_task_service = __AsyncTaskService()
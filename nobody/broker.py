@@ -0,0 +1,470 @@
+# coding=utf-8
+
+"""
+@Author: LiangChao
+@Email: nobody_team@outlook.com
+@File: broker
+@Created: 2026/10/18
+@Desc: 基于 SQLite 的任务代理，多个工作进程（可在不同主机上）从共享队列领取任务执行
+
+生产者：
+    broker = Broker('/data/tasks.db')
+    task_id = broker.submit(func, *args, **kwargs)
+    broker.result(task_id)
+
+工作进程：
+    BrokerWorker(Broker('/data/tasks.db'), max_workers=8).run()
+
+跨主机时由一台主机提供服务，其他主机通过 socket 连接，默认只监听本机，authkey 必须指定：
+    serve(Broker('/data/tasks.db'), ('0.0.0.0', 50000), authkey=b'secret')
+    BrokerWorker(connect(('broker-host', 50000), b'secret')).run()
+"""
+import os
+import pickle
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from multiprocessing.managers import BaseManager
+
+from nobody.log import logger
+from nobody.task import task_service, TaskListener, TaskError, TaskNotFoundError, THREAD, RUNNING, PAUSED, \
+    FINISHED, FAILED, TERMINATED, CANCELED, DONE_STATUSES
+
+# 下发给任务所属工作进程的指令
+PAUSE = 'pause'
+RESUME = 'resume'
+STOP = 'stop'
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS tasks (
+    id TEXT PRIMARY KEY,
+    payload BLOB NOT NULL,
+    priority INTEGER NOT NULL DEFAULT 0,
+    status TEXT,
+    owner TEXT,
+    lease_until REAL,
+    command TEXT,
+    reason TEXT,
+    result BLOB,
+    error TEXT,
+    created REAL NOT NULL,
+    updated REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS tasks_queue ON tasks (status, priority DESC, created);
+CREATE INDEX IF NOT EXISTS tasks_owner ON tasks (owner);
+"""
+
+
+class Broker(object):
+    """
+    任务代理，任务保存在 SQLite 中：
+
+    * status 为空表示排队中，工作进程领取后为 running，并持有租约 lease_until；
+    * 工作进程定期续租，租约过期（工作进程已死）的任务重新排队，由其他工作进程领取；
+    * 暂停、恢复、终止指令写在任务上，只有持有任务的工作进程会读取并执行
+    """
+
+    def __init__(self, path, lease_time=30):
+        self.path = path
+        self.lease_time = lease_time  # 租约秒数
+        self._local = threading.local()
+        self._db().executescript(_SCHEMA)
+
+    def _db(self):
+        """
+        每个线程一个连接
+
+        :return:
+        """
+        db = getattr(self._local, 'db', None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            db.execute('PRAGMA journal_mode=WAL')
+            self._local.db = db
+        return db
+
+    # region 生产者
+
+    def submit(self, target, *args, task_priority=0, **kwargs):
+        """
+        提交任务，目标及参数必须可以 pickle；选项以 task_ 开头，其余参数原样传给目标
+
+        :param target:
+        :param task_priority: 优先级，越大越先领取
+        :return: 任务ID
+        """
+        task_id = str(uuid.uuid4())
+        now = time.time()
+        self._db().execute('INSERT INTO tasks (id, payload, priority, created, updated) VALUES (?, ?, ?, ?, ?)',
+                           (task_id, pickle.dumps((target, args, kwargs)), task_priority, now, now))
+        return task_id
+
+    def status(self, task_id):
+        """
+        任务状态，排队中为 None
+
+        :param task_id:
+        :return:
+        """
+        row = self._db().execute('SELECT status FROM tasks WHERE id = ?', (task_id,)).fetchone()
+        if row is None:
+            raise TaskNotFoundError(task_id)
+        return row[0]
+
+    def result(self, task_id, timeout=None, poll_interval=0.2):
+        """
+        等待并获取任务返回值，任务出错或被终止时抛出 TaskError
+
+        :param task_id:
+        :param timeout:
+        :param poll_interval:
+        :return:
+        """
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        while True:
+            row = self._db().execute('SELECT status, result, error FROM tasks WHERE id = ?', (task_id,)).fetchone()
+            if row is None:
+                raise TaskNotFoundError(task_id)
+            status, result, error = row
+            if status == FINISHED:
+                return pickle.loads(result) if result is not None else None
+            if status in DONE_STATUSES:
+                raise TaskError(f'{status}: {error}')
+            if deadline is not None and time.monotonic() >= deadline:
+                raise TimeoutError(task_id)
+            time.sleep(poll_interval)
+
+    def pause(self, task_id):
+        """
+        暂停任务，由持有任务的工作进程执行
+
+        :param task_id:
+        :return:
+        """
+        self._command(task_id, PAUSE)
+
+    def resume(self, task_id):
+        """
+        恢复任务
+
+        :param task_id:
+        :return:
+        """
+        self._command(task_id, RESUME)
+
+    def stop(self, task_id, reason=None):
+        """
+        终止任务，排队中的任务直接取消
+
+        :param task_id:
+        :param reason:
+        :return:
+        """
+        db = self._db()
+        now = time.time()
+        cursor = db.execute('UPDATE tasks SET status = ?, error = ?, updated = ? WHERE id = ? AND status IS NULL',
+                            (CANCELED, reason, now, task_id))
+        if not cursor.rowcount:
+            self._command(task_id, STOP, reason)
+
+    def _command(self, task_id, command, reason=None):
+        cursor = self._db().execute('UPDATE tasks SET command = ?, reason = ?, updated = ? WHERE id = ?',
+                                    (command, reason, time.time(), task_id))
+        if not cursor.rowcount:
+            raise TaskNotFoundError(task_id)
+
+    def stats(self):
+        """
+        各状态的任务数，排队中的键为 None
+
+        :return:
+        """
+        return dict(self._db().execute('SELECT status, COUNT(*) FROM tasks GROUP BY status').fetchall())
+
+    # endregion
+
+    # region 工作进程
+
+    def lease(self, owner, count):
+        """
+        领取排队中的任务
+
+        :param owner: 工作进程名
+        :param count: 最多领取数
+        :return: [(任务ID, payload)]
+        """
+        db = self._db()
+        now = time.time()
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            rows = db.execute('SELECT id, payload FROM tasks WHERE status IS NULL '
+                              'ORDER BY priority DESC, created LIMIT ?', (count,)).fetchall()
+            db.executemany('UPDATE tasks SET status = ?, owner = ?, lease_until = ?, updated = ? WHERE id = ?',
+                           [(RUNNING, owner, now + self.lease_time, now, row[0]) for row in rows])
+            db.execute('COMMIT')
+        except:
+            db.execute('ROLLBACK')
+            raise
+        return rows
+
+    def renew(self, owner, task_ids):
+        """
+        续租，只续给定的任务，该工作进程领取后未在执行的任务租约到期后被收回
+
+        :param owner:
+        :param task_ids: 工作进程正在执行的任务ID
+        :return: 仍由该工作进程持有的任务ID，不在其中的任务已被收回
+        """
+        db = self._db()
+        task_ids = list(task_ids)
+        lease_until = time.time() + self.lease_time
+        kept = []
+        for i in range(0, len(task_ids), 500):  # SQLite 限制单条语句的参数个数
+            chunk = task_ids[i:i + 500]
+            marks = ', '.join('?' * len(chunk))
+            db.execute(f'UPDATE tasks SET lease_until = ? WHERE owner = ? AND id IN ({marks})',
+                       (lease_until, owner, *chunk))
+            kept.extend(row[0] for row in db.execute(f'SELECT id FROM tasks WHERE owner = ? AND id IN ({marks})',
+                                                     (owner, *chunk)))
+        return kept
+
+    def commands(self, owner):
+        """
+        取出下发给该工作进程的指令
+
+        :param owner:
+        :return: [(任务ID, 指令, 原因)]
+        """
+        db = self._db()
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            rows = db.execute('SELECT id, command, reason FROM tasks WHERE owner = ? AND command IS NOT NULL',
+                              (owner,)).fetchall()
+            db.execute('UPDATE tasks SET command = NULL WHERE owner = ? AND command IS NOT NULL', (owner,))
+            db.execute('COMMIT')
+        except:
+            db.execute('ROLLBACK')
+            raise
+        return rows
+
+    def report(self, owner, task_id, status, result=None, error=None):
+        """
+        工作进程上报任务状态，任务结束时释放租约；任务已不归该工作进程所有时忽略
+
+        :param owner:
+        :param task_id:
+        :param status:
+        :param result: pickle 后的返回值
+        :param error:
+        :return: 是否上报成功
+        """
+        now = time.time()
+        if status in DONE_STATUSES:
+            sql = ('UPDATE tasks SET status = ?, result = ?, error = ?, owner = NULL, lease_until = NULL, '
+                   'command = NULL, updated = ? WHERE id = ? AND owner = ?')
+            params = (status, result, error, now, task_id, owner)
+        else:
+            sql = 'UPDATE tasks SET status = ?, updated = ? WHERE id = ? AND owner = ?'
+            params = (status, now, task_id, owner)
+        return bool(self._db().execute(sql, params).rowcount)
+
+    def reclaim(self):
+        """
+        收回租约已过期的任务：待终止的直接记为终止，其余重新排队
+
+        :return: 收回的任务数
+        """
+        db = self._db()
+        now = time.time()
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            db.execute('UPDATE tasks SET status = ?, owner = NULL, lease_until = NULL, command = NULL, '
+                       'error = reason, updated = ? WHERE owner IS NOT NULL AND lease_until < ? AND command = ?',
+                       (TERMINATED, now, now, STOP))
+            cursor = db.execute('UPDATE tasks SET status = NULL, owner = NULL, lease_until = NULL, command = NULL, '
+                                'updated = ? WHERE owner IS NOT NULL AND lease_until < ?', (now, now))
+            db.execute('COMMIT')
+        except:
+            db.execute('ROLLBACK')
+            raise
+        if cursor.rowcount:
+            logger.warning(f'收回 {cursor.rowcount} 个租约过期的任务')
+        return cursor.rowcount
+
+    # endregion
+
+
+class BrokerWorker(TaskListener):
+    """
+    工作进程，从代理领取任务交给本进程的 task_service 执行，并定期续租、执行指令、上报状态。
+    租约被收回的任务（例如本进程曾长时间失联）在本地强行停止
+    """
+
+    def __init__(self, broker, name=None, max_workers=None, executor=THREAD, poll_interval=0.5):
+        self.broker = broker
+        self.name = name or f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}'
+        self.max_workers = max_workers or task_service.max_workers
+        self.executor = executor
+        self.poll_interval = poll_interval
+        self._tasks = {}  # 远程任务ID -> 本地任务
+        self._broker_ids = {}  # 本地任务ID -> 远程任务ID
+        self._lock = threading.Lock()
+        self._working = False
+        self._event = threading.Event()
+
+    def start(self):
+        """
+        在后台线程中运行
+
+        :return:
+        """
+        threading.Thread(target=self.run, name=f'工作进程 {self.name}', daemon=True).start()
+
+    def run(self):
+        """
+        运行直到 stop()
+
+        :return:
+        """
+        self._working = True
+        self._event.clear()
+        logger.info(f'工作进程启动：{self.name}')
+        while self._working:
+            try:
+                self._tick()
+            except Exception as e:
+                logger.error(f'工作进程出错：{self.name}, {e}')
+            self._event.wait(self.poll_interval)
+        logger.info(f'工作进程停止：{self.name}')
+
+    def stop(self):
+        self._working = False
+        self._event.set()
+
+    def _tick(self):
+        self.broker.reclaim()
+        with self._lock:
+            owned = list(self._tasks)
+        if owned:
+            kept = set(self.broker.renew(self.name, owned))
+            for task_id in owned:
+                if task_id not in kept:
+                    self._lost(task_id)
+        for task_id, command, reason in self.broker.commands(self.name):
+            self._apply(task_id, command, reason)
+        free = self.max_workers - len(self._tasks)
+        if free > 0:
+            for task_id, payload in self.broker.lease(self.name, free):
+                try:
+                    self._execute(task_id, payload)
+                except Exception as e:  # 一个任务出错不影响同批领取的其他任务
+                    logger.error(f'无法执行任务：{task_id}, {e!r}')
+                    self.broker.report(self.name, task_id, FAILED, error=repr(e))
+
+    def _execute(self, task_id, payload):
+        target, args, kwargs = pickle.loads(payload)
+        # 参数原样交给目标，不会被当作 task_service.submit 的选项
+        task = task_service.submit(_call, target, args, kwargs, task_executor=self.executor)
+        with self._lock:
+            self._tasks[task_id] = task
+            self._broker_ids[task.id] = task_id
+        task.add_listener(self)
+        task.add_done_callback(self._done)
+
+    def _apply(self, task_id, command, reason):
+        task = self._tasks.get(task_id)
+        if task is None:
+            return
+        logger.debug(f'执行指令：{task_id}, {command}')
+        if command == PAUSE:
+            task.pause()
+        elif command == RESUME:
+            task.resume()
+        elif command == STOP:
+            if task.status == RUNNING:
+                task.stop(reason)
+            elif task.status == PAUSED:
+                task.task_handler.force_stop(reason)
+                task.status = TERMINATED
+            else:
+                task.cancel()
+
+    def _lost(self, task_id):
+        with self._lock:
+            task = self._tasks.pop(task_id, None)
+        if task is not None and task.status in (RUNNING, PAUSED):
+            logger.warning(f'任务租约已被收回，本地停止：{task_id}')
+            task.task_handler.force_stop('lease lost')
+
+    def on_status_changed(self, task, status, *args, **kwargs):
+        task_id = self._broker_ids.get(task.id)
+        if status in (RUNNING, PAUSED) and task_id is not None:
+            self.broker.report(self.name, task_id, status)
+
+    def _done(self, task):
+        with self._lock:
+            task_id = self._broker_ids.pop(task.id)
+            if self._tasks.pop(task_id, None) is None:  # 租约已被收回
+                return
+        result = error = None
+        if task.status == FINISHED:
+            try:
+                result = pickle.dumps(task.result())
+            except Exception as e:
+                error = f'返回值无法序列化：{e!r}'
+        elif task.status == FAILED:
+            error = repr(task.exception())
+        elif task.status == TERMINATED:
+            error = task.stop_reason
+        self.broker.report(self.name, task_id, FAILED if task.status == FINISHED and error else task.status,
+                           result, error)
+        self._event.set()  # 有空闲，立即领取新任务
+
+
+def _call(target, args, kwargs):
+    return target(*args, **kwargs)
+
+
+class _BrokerServer(BaseManager):
+    """"""
+
+
+class _BrokerClient(BaseManager):
+    """"""
+
+
+_BrokerClient.register('broker')
+
+
+def serve(broker, address=('127.0.0.1', 50000), *, authkey):
+    """
+    通过 socket 提供代理服务，阻塞运行。
+    连接方可以提交任意 pickle 数据，即可以在本机执行任意代码：默认只监听本机，
+    对外提供服务时须使用足够长的随机 authkey，并限制可以访问该端口的主机
+
+    :param broker:
+    :param address: 监听地址，默认只监听本机
+    :param authkey: 连接密钥，不能为空
+    :return:
+    """
+    if not authkey:
+        raise ValueError('authkey 不能为空')
+    _BrokerServer.register('broker', callable=lambda: broker)
+    server = _BrokerServer(address=address, authkey=authkey).get_server()
+    logger.info(f'任务代理服务：{address}')
+    server.serve_forever()
+
+
+def connect(address, authkey):
+    """
+    连接远程代理，返回的代理对象与 Broker 用法相同
+
+    :param address:
+    :param authkey:
+    :return:
+    """
+    client = _BrokerClient(address=address, authkey=authkey)
+    client.connect()
+    return client.broker()
@@ -0,0 +1,241 @@
+# coding=utf-8
+
+"""
+@Author: LiangChao
+@Email: nobody_team@outlook.com
+@File: cron
+@Created: 2026/10/18
+@Desc: cron 表达式：解析一次编译为各字段的位集合，下次执行时间逐字段跳转计算，不逐分钟扫描
+"""
+import calendar
+from datetime import datetime, timedelta
+from functools import lru_cache
+
+MONTHS = ('jan', 'feb', 'mar', 'apr', 'may', 'jun', 'jul', 'aug', 'sep', 'oct', 'nov', 'dec')
+WEEKDAYS = ('sun', 'mon', 'tue', 'wed', 'thu', 'fri', 'sat')
+ALIASES = {
+    '@yearly': '0 0 1 1 *',
+    '@annually': '0 0 1 1 *',
+    '@monthly': '0 0 1 * *',
+    '@weekly': '0 0 * * 0',
+    '@daily': '0 0 * * *',
+    '@midnight': '0 0 * * *',
+    '@hourly': '0 * * * *',
+}
+MAX_YEARS = 28  # 日历以 28 年为周期重复，超过仍找不到则表达式不会再触发（如 2 月 30 日）
+
+# 字段名, 最小值, 最大值, 名称表（名称序号加上最小值即为取值）
+_FIELDS = (
+    ('second', 0, 59, None),
+    ('minute', 0, 59, None),
+    ('hour', 0, 23, None),
+    ('day', 1, 31, None),
+    ('month', 1, 12, MONTHS),
+    ('weekday', 0, 7, WEEKDAYS),
+)
+
+
+def _lowest(bits, start):
+    """
+    位集合中不小于 start 的最小值，没有则返回 None
+
+    :param bits:
+    :param start:
+    :return:
+    """
+    bits >>= start
+    if not bits:
+        return None
+    return start + (bits & -bits).bit_length() - 1
+
+
+def _parse_value(value, low, names):
+    if names:
+        try:
+            return names.index(value.lower()) + low
+        except ValueError:
+            pass
+    return int(value)
+
+
+def _parse_field(text, name, low, high, names):
+    """
+    解析单个字段为位集合，支持 *、?、a、a-b、*/n、a/n、a-b/n 及逗号分隔的列表
+
+    :return: 位集合，第 i 位表示取值 i
+    """
+    bits = 0
+    for part in text.split(','):
+        body, slash, step = part.partition('/')
+        try:
+            step = int(step) if slash else 1
+            if body in ('*', '?'):
+                start, stop = low, high
+            elif '-' in body:
+                start, stop = (_parse_value(v, low, names) for v in body.split('-', 1))
+            else:
+                start = _parse_value(body, low, names)
+                stop = high if slash else start
+        except ValueError:
+            raise CronError(f'无法解析 {name} 字段：{text}') from None
+        if step < 1 or not low <= start <= high or not low <= stop <= high or start > stop:
+            raise CronError(f'{name} 字段超出范围 {low}-{high}：{text}')
+        for value in range(start, stop + 1, step):
+            bits |= 1 << value
+    return bits
+
+
+class Cron(object):
+    """
+    编译后的 cron 表达式，不可变，相同的表达式共享同一个实例，见 parse。
+
+    5 个字段依次为：分 时 日 月 周；6 个字段时最前面加一个秒字段。
+    周字段 0 和 7 都表示周日。日与周字段都受限（都不以 * 开头）时，满足其一即可，与 Vixie cron 相同
+    """
+
+    __slots__ = ('expression', 'seconds', 'minutes', 'hours', 'days', 'months', 'weekdays', 'day_or')
+
+    def __init__(self, expression):
+        self.expression = expression
+        text = ALIASES.get(expression.strip().lower(), expression)
+        fields = text.split()
+        if len(fields) == 5:
+            fields.insert(0, '0')
+        if len(fields) != 6:
+            raise CronError(f'cron 表达式应有 5 或 6 个字段：{expression}')
+        self.seconds, self.minutes, self.hours, self.days, self.months, weekdays = (
+            _parse_field(text, *field) for text, field in zip(fields, _FIELDS))
+        if weekdays & 1 << 7:
+            weekdays = (weekdays | 1) & 0x7F
+        self.weekdays = weekdays
+        day_restricted = not fields[3].startswith(('*', '?'))
+        weekday_restricted = not fields[5].startswith(('*', '?'))
+        self.day_or = day_restricted and weekday_restricted  # 日与周字段满足其一即可
+        if self.next_fire(datetime(2000, 1, 1)) is None:
+            raise CronError(f'cron 表达式不会触发：{expression}')
+
+    def __repr__(self):
+        return f'Cron({self.expression!r})'
+
+    def __eq__(self, other):
+        return isinstance(other, Cron) and self._key() == other._key()
+
+    def __hash__(self):
+        return hash(self._key())
+
+    def _key(self):
+        return self.seconds, self.minutes, self.hours, self.days, self.months, self.weekdays, self.day_or
+
+    def _day_bits(self, year, month):
+        """
+        某月中满足日与周字段的日期的位集合
+
+        :param year:
+        :param month:
+        :return:
+        """
+        first, length = calendar.monthrange(year, month)
+        valid = (1 << (length + 1)) - 2
+        shift = (first + 1) % 7  # 1 号是周几，周日为 0
+        week = ((self.weekdays >> shift) | (self.weekdays << (7 - shift))) & 0x7F  # 第 k 位：1+k 号
+        weekday_bits = (week | week << 7 | week << 14 | week << 21 | week << 28) << 1
+        day_bits = self.days
+        if self.day_or:
+            return (day_bits | weekday_bits) & valid
+        return day_bits & weekday_bits & valid
+
+    def next_fire(self, after):
+        """
+        严格晚于 after 的下次执行时间：按月、日、时、分、秒逐字段跳到下一个允许值，
+        某一字段没有可用值时进位到上一级字段并把下级字段置为最小值
+
+        :param after: datetime
+        :return: datetime，表达式不会再触发时返回 None
+        """
+        after = after.replace(microsecond=0) + timedelta(seconds=1)
+        year, month, day = after.year, after.month, after.day
+        hour, minute, second = after.hour, after.minute, after.second
+        last_year = year + MAX_YEARS
+        while year <= last_year:
+            found = _lowest(self.months, month)
+            if found is None:
+                year, month, day, hour, minute, second = year + 1, 1, 1, 0, 0, 0
+                continue
+            if found != month:
+                month, day, hour, minute, second = found, 1, 0, 0, 0
+            found = _lowest(self._day_bits(year, month), day)
+            if found is None:
+                month, day, hour, minute, second = month + 1, 1, 0, 0, 0
+                if month > 12:
+                    year, month = year + 1, 1
+                continue
+            if found != day:
+                day, hour, minute, second = found, 0, 0, 0
+            found = _lowest(self.hours, hour)
+            if found is None:
+                day, hour, minute, second = day + 1, 0, 0, 0
+                if day > 31:
+                    month, day = month + 1, 1
+                    if month > 12:
+                        year, month = year + 1, 1
+                continue
+            if found != hour:
+                hour, minute, second = found, 0, 0
+            found = _lowest(self.minutes, minute)
+            if found is None:
+                hour, minute, second = hour + 1, 0, 0
+                if hour > 23:
+                    day, hour = day + 1, 0  # 超出月末的日期由下一轮的日字段处理
+                continue
+            if found != minute:
+                minute, second = found, 0
+            found = _lowest(self.seconds, second)
+            if found is None:
+                minute, second = minute + 1, 0
+                if minute > 59:
+                    hour, minute = hour + 1, 0
+                    if hour > 23:
+                        day, hour = day + 1, 0
+                continue
+            return datetime(year, month, day, hour, minute, found)
+        return None
+
+    def iter(self, start):
+        """
+        从 start 之后依次产生执行时间
+
+        :param start:
+        :return:
+        """
+        current = self.next_fire(start)
+        while current is not None:
+            yield current
+            current = self.next_fire(current)
+
+    def match(self, moment):
+        """
+        moment 是否为执行时间（精确到秒）
+
+        :param moment:
+        :return:
+        """
+        return (self.seconds >> moment.second & 1 and self.minutes >> moment.minute & 1
+                and self.hours >> moment.hour & 1 and self.months >> moment.month & 1
+                and self._day_bits(moment.year, moment.month) >> moment.day & 1) == 1
+
+
+@lru_cache(maxsize=256)
+def parse(expression):
+    """
+    编译 cron 表达式，结果按表达式缓存最近使用的 256 个，长期运行中不断构造新表达式也不会无限增长
+
+    :param expression: 如 '*/5 9-17 * * 1-5'，也支持 @daily 等别名
+    :return: Cron
+    """
+    return Cron(expression)
+
+
+class CronError(ValueError):
+    """
+    cron 表达式错误
+    """
@@ -0,0 +1,240 @@
+# coding=utf-8
+
+"""
+@Author: LiangChao
+@Email: nobody_team@outlook.com
+@File: journal
+@Created: 2026/10/18
+@Desc: 追加写日志（write-ahead journal），用于进程崩溃后恢复状态
+"""
+import json
+import os
+import threading
+import time
+
+from nobody.log import logger
+
+SET = 'set'  # 写入完整记录
+UPDATE = 'update'  # 合并字段
+DELETE = 'del'  # 删除记录
+
+
+class Journal(object):
+    """
+    追加写日志，每行一个 JSON 数组：[操作, 键, 值]
+
+    * 记录按键区分，支持 set/update/delete，重放日志得到仍存活的记录；
+    * 写入由后台线程批量完成，一批只 fsync 一次（组提交），sync=True 时写入方等待所在批次落盘；
+    * 日志中的记录数超过 compact_threshold 且远多于存活记录时，改写为只含存活记录的新日志
+    """
+
+    def __init__(self, path, sync=False, commit_interval=0.005, compact_threshold=10000):
+        self.path = path
+        self.sync = sync
+        self.commit_interval = commit_interval  # 两次提交的最小间隔，用于攒批
+        self.compact_threshold = compact_threshold
+        self._live = {}  # 键 -> 记录
+        self._records = 0  # 日志文件中的记录数
+        self._buffer = []
+        self._appended = 0  # 已追加的记录序号
+        self._committed = 0  # 已落盘的记录序号
+        self._closed = False
+        self._compact_requested = False
+        self._condition = threading.Condition()
+        self._load()
+        self._file = open(path, 'a', encoding='utf-8')
+        self._thread = threading.Thread(target=self._commit_loop, name='任务日志', daemon=True)
+        self._thread.start()
+
+    def __len__(self):
+        return len(self._live)
+
+    @property
+    def closed(self):
+        return self._closed
+
+    def items(self):
+        """
+        存活的记录，按首次写入的顺序
+
+        :return:
+        """
+        with self._condition:
+            return list(self._live.items())
+
+    def get(self, key, default=None):
+        return self._live.get(key, default)
+
+    def set(self, key, value):
+        """
+        写入完整记录
+
+        :param key:
+        :param value: 可 JSON 序列化的字典
+        :return:
+        """
+        self._append(SET, key, dict(value))
+
+    def update(self, key, **fields):
+        """
+        合并字段到已有记录，记录不存在则忽略
+
+        :param key:
+        :param fields:
+        :return:
+        """
+        self._append(UPDATE, key, fields)
+
+    def delete(self, key):
+        """
+        删除记录
+
+        :param key:
+        :return:
+        """
+        self._append(DELETE, key)
+
+    def _append(self, op, key, value=None):
+        line = json.dumps([op, key, value] if value is not None else [op, key], ensure_ascii=False)
+        with self._condition:
+            if self._closed:
+                raise JournalError(f'日志已关闭：{self.path}')
+            if not self._apply(op, key, value):
+                return
+            self._buffer.append(line)
+            self._appended += 1
+            sequence = self._appended
+            self._condition.notify_all()
+            if self.sync:
+                while self._committed < sequence:
+                    self._condition.wait()
+
+    def _apply(self, op, key, value):
+        if op == SET:
+            self._live[key] = value
+        elif op == UPDATE:
+            record = self._live.get(key)
+            if record is None:
+                return False
+            record.update(value)
+        elif op == DELETE:
+            if self._live.pop(key, None) is None:
+                return False
+        else:
+            raise JournalError(f'未知的日志操作：{op}')
+        return True
+
+    def _load(self):
+        """
+        重放已有日志，末尾未写完整的行被截掉
+
+        :return:
+        """
+        if not os.path.exists(self.path):
+            return
+        valid = 0
+        with open(self.path, 'rb') as f:
+            for raw in f:
+                try:
+                    if not raw.endswith(b'\n'):
+                        raise ValueError('incomplete line')
+                    op, key, *value = json.loads(raw)
+                except ValueError:
+                    logger.warning(f'日志末尾不完整，已截断：{self.path}')
+                    break
+                self._apply(op, key, value[0] if value else None)
+                self._records += 1
+                valid += len(raw)
+        if valid != os.path.getsize(self.path):
+            with open(self.path, 'r+b') as f:
+                f.truncate(valid)
+
+    def _commit_loop(self):
+        while True:
+            with self._condition:
+                while not self._buffer and not self._closed and not self._compact_requested:
+                    self._condition.wait()
+                if self._compact_requested or (
+                        self._records > self.compact_threshold and self._records > 2 * len(self._live)):
+                    self._compact()
+                    continue
+                if self._closed and not self._buffer:
+                    break
+                lines, self._buffer = self._buffer, []
+                sequence = self._appended
+            self._file.write('\n'.join(lines))
+            self._file.write('\n')
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            with self._condition:
+                self._records += len(lines)
+                self._committed = sequence
+                self._condition.notify_all()
+            if self.commit_interval:
+                time.sleep(self.commit_interval)
+
+    def _compact(self):
+        """
+        以存活记录改写日志，只在提交线程中调用，调用方需持有 self._condition
+
+        :return:
+        """
+        tmp = f'{self.path}.compact'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            for key, value in self._live.items():
+                f.write(json.dumps([SET, key, value], ensure_ascii=False))
+                f.write('\n')
+            f.flush()
+            os.fsync(f.fileno())
+        self._file.close()
+        os.replace(tmp, self.path)
+        self._file = open(self.path, 'a', encoding='utf-8')
+        logger.debug(f'日志压缩：{self._records} -> {len(self._live)}')
+        self._records = len(self._live)
+        self._buffer = []
+        self._committed = self._appended
+        self._compact_requested = False
+        self._condition.notify_all()
+
+    def compact(self):
+        """
+        立即压缩日志，等待压缩完成
+
+        :return:
+        """
+        with self._condition:
+            self._compact_requested = True
+            self._condition.notify_all()
+            while self._compact_requested:
+                self._condition.wait()
+
+    def flush(self):
+        """
+        等待已写入的记录全部落盘
+
+        :return:
+        """
+        with self._condition:
+            sequence = self._appended
+            while self._committed < sequence:
+                self._condition.wait()
+
+    def close(self):
+        """
+        落盘并关闭日志
+
+        :return:
+        """
+        with self._condition:
+            if self._closed:
+                return
+            self._closed = True
+            self._condition.notify_all()
+        self._thread.join()
+        self._file.close()
+
+
+class JournalError(Exception):
+    """
+    日志异常
+    """
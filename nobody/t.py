@@ -6,16 +6,25 @@
 @Created: 2020/10/29 10:01
 @Desc:
 """
-import collections
+import collections.abc
 import datetime
 import functools
+import heapq
 import logging
 import random
 import re
+import threading
 import time
 
+from nobody.cron import parse
+
 logger = logging.getLogger('schedule')
 
+# What to do when a job is due while max_instances of it are still running
+SKIP = 'skip'  # drop this run
+QUEUE = 'queue'  # run it as soon as an instance finishes
+REPLACE = 'replace'  # like QUEUE, but only the latest pending run is kept
+
 
 class ScheduleError(Exception):
     """Base schedule exception"""
@@ -44,10 +53,55 @@ class Scheduler(object):
     Objects instantiated by the :class:`Scheduler <Scheduler>` are
     factories to create jobs, keep record of scheduled jobs and
     handle their execution.
+
+    Jobs are kept in a min-heap keyed by their next run time, so a tick
+    only touches the jobs that are due. Cancelled or rescheduled jobs
+    leave a stale heap entry behind that is skipped when it reaches the
+    top, and the heap is rebuilt once stale entries outnumber live ones.
+
+    The scheduler is thread safe: jobs may be added, cancelled or
+    rescheduled from any thread while :meth:`run_forever` is sleeping,
+    and doing so wakes it up.
+
+    :param executor: An optional :class:`concurrent.futures.Executor`.
+                     Without it due jobs run one after another in the
+                     calling thread; with it they are submitted to the
+                     executor, so a slow job does not delay the others,
+                     and :meth:`Schedule.limit` controls overlapping runs.
+                     The scheduler does not shut the executor down.
     """
 
-    def __init__(self):
-        self.jobs = []
+    def __init__(self, executor=None):
+        self.executor = executor
+        self._jobs = {}  # job -> heap entry [next_time, sequence, job], insertion ordered
+        self._heap = []
+        self._tags = collections.defaultdict(set)  # tag -> jobs
+        self._sequence = 0
+        self._stale = 0  # heap entries of cancelled or rescheduled jobs
+        self._condition = threading.Condition(threading.RLock())
+        self._stopped = True
+        self._thread = None
+
+    @property
+    def jobs(self):
+        """
+        :return: A list of the scheduled jobs, in the order they were added
+        """
+        with self._condition:
+            return list(self._jobs)
+
+    @property
+    def running(self):
+        """
+        :return: ``True`` while :meth:`run_forever` is looping
+        """
+        return not self._stopped
+
+    def __len__(self):
+        return len(self._jobs)
+
+    def __contains__(self, job):
+        return job in self._jobs
 
     def run_pending(self):
         """
@@ -58,10 +112,91 @@ class Scheduler(object):
         that should run every minute and you only call run_pending()
         in one hour increments then your job won't be run 60 times in
         between but only once.
+
+        A job that raises does not stop the others: every due job runs
+        and is rescheduled, and the first exception is logged and
+        re-raised afterwards.
         """
-        runnable_jobs = (job for job in self.jobs if job.should_run)
-        for job in sorted(runnable_jobs):
-            self._run_job(job)
+        now = datetime.datetime.now()
+        due = []
+        with self._condition:
+            while self._heap and self._heap[0][0] <= now:
+                planned, _, job = heapq.heappop(self._heap)
+                if job is None:
+                    self._stale -= 1
+                else:
+                    self._jobs[job] = None  # not in the heap until rescheduled
+                    due.append((job, planned))
+        error = None
+        for job, planned in due:
+            try:
+                self._run_job(job, planned)
+            except Exception as e:
+                logger.error('Job %s raised %r', job, e, exc_info=e)
+                if error is None:
+                    error = e
+        if error is not None:
+            raise error
+
+    def run_forever(self):
+        """
+        Run jobs as they become due until :meth:`stop` is called.
+
+        Between runs the calling thread sleeps on a condition variable
+        for exactly :attr:`idle_seconds`, so jobs start on time and an
+        idle scheduler does not wake up. Adding, cancelling or
+        rescheduling a job wakes it to recompute the sleep.
+
+        Exceptions raised by jobs are logged and do not stop the loop.
+        """
+        with self._condition:
+            self._stopped = False
+        self._loop()
+
+    def run_in_thread(self, name='scheduler', daemon=True):
+        """
+        Call :meth:`run_forever` in a new thread.
+
+        :param name: Name of the thread
+        :param daemon: Whether the thread is a daemon thread
+        :return: The started :class:`threading.Thread`
+        """
+        with self._condition:
+            if self._thread is not None and self._thread.is_alive():
+                raise ScheduleError('Scheduler is already running in a thread')
+            self._stopped = False
+            self._thread = threading.Thread(target=self._loop, name=name, daemon=daemon)
+            self._thread.start()
+            return self._thread
+
+    def stop(self, timeout=None):
+        """
+        Stop :meth:`run_forever` once the jobs currently running return,
+        and wait for the thread started by :meth:`run_in_thread`.
+
+        :param timeout: Seconds to wait for the thread, None waits forever
+        """
+        with self._condition:
+            self._stopped = True
+            self._condition.notify_all()
+            thread = self._thread
+        if thread is not None and thread is not threading.current_thread():
+            thread.join(timeout)
+
+    def _loop(self):
+        while True:
+            with self._condition:
+                while not self._stopped:
+                    idle = self.idle_seconds
+                    if idle is not None and idle <= 0:
+                        break
+                    self._condition.wait(idle)
+                if self._stopped:
+                    return
+            try:
+                self.run_pending()
+            except Exception:  # logged by run_pending, keep the loop alive
+                pass
 
     def run_all(self, delay_seconds=0):
         """
@@ -74,8 +209,11 @@ class Scheduler(object):
         :param delay_seconds: A delay added between every executed job
         """
         logger.info('Running *all* %i jobs with %is delay inbetween',
-                    len(self.jobs), delay_seconds)
-        for job in self.jobs[:]:
+                    len(self._jobs), delay_seconds)
+        for job in self.jobs:
+            if job not in self._jobs:  # cancelled by a job that ran before
+                continue
+            self._unschedule(job)
             self._run_job(job)
             time.sleep(delay_seconds)
 
@@ -87,10 +225,16 @@ class Scheduler(object):
         :param tag: An identifier used to identify a subset of
                     jobs to delete
         """
-        if tag is None:
-            del self.jobs[:]
-        else:
-            self.jobs[:] = (job for job in self.jobs if tag not in job.tags)
+        with self._condition:
+            if tag is None:
+                self._jobs.clear()
+                self._heap.clear()
+                self._tags.clear()
+                self._stale = 0
+                self._condition.notify_all()
+            else:
+                for job in list(self._tags.get(tag, ())):
+                    self.cancel_job(job)
 
     def cancel_job(self, job):
         """
@@ -98,25 +242,159 @@ class Scheduler(object):
 
         :param job: The job to be unscheduled
         """
-        try:
-            self.jobs.remove(job)
-        except ValueError:
-            pass
+        with self._condition:
+            if job not in self._jobs:
+                return
+            self._unschedule(job)
+            del self._jobs[job]
+            for tag in job.tags:
+                jobs = self._tags.get(tag)
+                if jobs is not None:
+                    jobs.discard(job)
+                    if not jobs:
+                        del self._tags[tag]
+            self._condition.notify_all()
+
+    def reschedule(self, job):
+        """
+        Recompute the next run of a job after its schedule was changed.
+
+        :param job: A scheduled job
+        """
+        with self._condition:
+            if job not in self._jobs:
+                raise ScheduleError('Job is not scheduled')
+            job._schedule_next_run()
+            self._schedule(job)
 
     def every(self, interval=1):
         """
         Schedule a new periodic job.
 
         :param interval: A quantity of a certain time unit
-        :return: An unconfigured :class:`Job <Job>`
+        :return: An unconfigured :class:`Schedule <Schedule>`
         """
-        job = Job(interval, self)
-        return job
+        return Schedule(interval, self)
 
-    def _run_job(self, job):
-        ret = job.run()
+    def cron(self, expression):
+        """
+        Schedule a new job by a cron expression.
+
+        :param expression: A cron expression such as ``*/5 9-17 * * 1-5``,
+                           see :mod:`nobody.cron`
+        :return: An unconfigured :class:`Schedule <Schedule>`
+        """
+        return Schedule(1, self).cron(expression)
+
+    def _run_job(self, job, planned=None):
+        """
+        Run the job inline, or submit it to the executor. The next run
+        is computed from the planned time, so slow runs do not make the
+        schedule drift.
+
+        :param job: The job to run
+        :param planned: The time the job was due, None when run early
+        """
+        try:
+            if self.executor is None:
+                ret = job.run(planned)
+                if isinstance(ret, CancelJob) or ret is CancelJob:
+                    self.cancel_job(job)
+            else:
+                with self._condition:
+                    if job._instances < job.max_instances:
+                        self._submit(job, planned)
+                    elif job.overlap == SKIP:
+                        logger.info('Skipping job %s, %i instances running', job, job._instances)
+                    else:
+                        if job.overlap == REPLACE:
+                            job._pending.clear()
+                        job._pending.append(planned)
+                    job._schedule_next_run(planned)
+        finally:  # a job that raised is still rescheduled
+            with self._condition:
+                if job in self._jobs:
+                    self._schedule(job)
+
+    def _submit(self, job, planned):
+        """
+        Submit one run of the job to the executor, the caller holds
+        the condition.
+        """
+        logger.info('Running job %s', job)
+        job._instances += 1
+        job.prev_time = datetime.datetime.now()
+        future = self.executor.submit(job.job_func)
+        future.add_done_callback(lambda f: self._on_job_done(job, planned, f))
+
+    def _on_job_done(self, job, planned, future):
+        if future.cancelled():
+            ret = None
+        elif future.exception() is not None:
+            ret = None
+            logger.error('Job %s raised %r', job, future.exception(), exc_info=future.exception())
+        else:
+            ret = future.result()
         if isinstance(ret, CancelJob) or ret is CancelJob:
             self.cancel_job(job)
+        with self._condition:
+            job._instances -= 1
+            if job._pending and job in self._jobs:
+                self._submit(job, job._pending.popleft())
+            else:
+                job._pending.clear()
+
+    def _schedule(self, job):
+        """
+        Add the job, or move it to its current `next_time`, waking
+        :meth:`run_forever` if it becomes the earliest job.
+        """
+        with self._condition:
+            if job in self._jobs:
+                self._unschedule(job)
+            else:
+                for tag in job.tags:
+                    self._tags[tag].add(job)
+            entry = [job.next_time, self._sequence, job]
+            self._sequence += 1
+            self._jobs[job] = entry
+            heapq.heappush(self._heap, entry)
+            if self._heap[0] is entry:
+                self._condition.notify_all()
+
+    def _unschedule(self, job):
+        """
+        Invalidate the heap entry of the job, the job stays registered.
+        """
+        entry = self._jobs.get(job)
+        if entry is None:
+            return
+        entry[2] = None
+        self._jobs[job] = None
+        self._stale += 1
+        if self._stale > len(self._jobs) and self._stale > 64:
+            self._heap = [e for e in self._heap if e[2] is not None]
+            heapq.heapify(self._heap)
+            self._stale = 0
+
+    def _tag(self, job, tags):
+        with self._condition:
+            if job in self._jobs:
+                for tag in tags:
+                    self._tags[tag].add(job)
+
+    def get_jobs(self, tag=None):
+        """
+        Gets scheduled jobs marked with the given tag, or all jobs
+        if tag is omitted.
+
+        :param tag: An identifier used to identify a subset of
+                    jobs to retrieve
+        """
+        if tag is None:
+            return self.jobs
+        with self._condition:
+            return list(self._tags.get(tag, ()))
 
     @property
     def next_run(self):
@@ -125,17 +403,24 @@ class Scheduler(object):
 
         :return: A :class:`~datetime.datetime` object
         """
-        if not self.jobs:
-            return None
-        return min(self.jobs).next_run
+        with self._condition:
+            heap = self._heap
+            while heap and heap[0][2] is None:
+                heapq.heappop(heap)
+                self._stale -= 1
+            return heap[0][0] if heap else None
 
     @property
     def idle_seconds(self):
         """
         :return: Number of seconds until
-                 :meth:`next_run <Scheduler.next_run>`.
+                 :meth:`next_run <Scheduler.next_run>`, None if no
+                 job is scheduled.
         """
-        return (self.next_run - datetime.datetime.now()).total_seconds()
+        next_run = self.next_run
+        if next_run is None:
+            return None
+        return (next_run - datetime.datetime.now()).total_seconds()
 
 
 class Job:
@@ -177,13 +462,18 @@ class Schedule(object):
         self.start_day = None  # Specific day of the week to start on
         self.tags = set()  # unique set of tags for the job
         self.scheduler = scheduler  # scheduler to register with
+        self.crontab = None  # compiled cron expression, replaces the unit
+        self.max_instances = 1  # concurrent runs allowed with an executor
+        self.overlap = SKIP  # what to do when due with max_instances running
+        self._instances = 0  # runs submitted and not yet finished
+        self._pending = collections.deque()  # planned times of queued runs
 
     def __lt__(self, other):
         """
         PeriodicJobs are sortable based on the scheduled time they
         run next.
         """
-        return self.next_time < other.next_run
+        return self.next_time < other.next_time
 
     def __repr__(self):
         def format_time(t):
@@ -201,6 +491,8 @@ class Schedule(object):
                   for k, v in self.job_func.keywords.items()]
         call_repr = job_func_name + '(' + ', '.join(args + kwargs) + ')'
 
+        if self.crontab is not None:
+            return 'Cron %s do %s %s' % (self.crontab.expression, call_repr, timestats)
         if self.at_time is not None:
             return 'Every %s %s at %s do %s %s' % (
                 self.interval,
@@ -334,9 +626,11 @@ class Schedule(object):
         :param tags: A unique list of ``Hashable`` tags.
         :return: The invoked job instance
         """
-        if not all(isinstance(tag, collections.Hashable) for tag in tags):
+        if not all(isinstance(tag, collections.abc.Hashable) for tag in tags):
             raise TypeError('Tags must be hashable')
         self.tags.update(tags)
+        if self.scheduler is not None:
+            self.scheduler._tag(self, tags)
         return self
 
     def at(self, time_str):
@@ -391,6 +685,37 @@ class Schedule(object):
         self.at_time = datetime.time(hour, minute, second)
         return self
 
+    def limit(self, max_instances=1, overlap=SKIP):
+        """
+        Limit how many runs of the job may overlap when the scheduler
+        has an executor.
+
+        :param max_instances: Maximum number of concurrent runs
+        :param overlap: What to do when the job is due while
+                        `max_instances` runs are still going: SKIP the
+                        run, QUEUE it until an instance finishes, or
+                        REPLACE any queued run with this one
+        :return: The invoked job instance
+        """
+        if max_instances < 1:
+            raise ScheduleValueError('max_instances must be at least 1')
+        if overlap not in (SKIP, QUEUE, REPLACE):
+            raise ScheduleValueError('Invalid overlap policy')
+        self.max_instances = max_instances
+        self.overlap = overlap
+        return self
+
+    def cron(self, expression):
+        """
+        Run the job at the times matched by a cron expression instead
+        of every `interval` units.
+
+        :param expression: A cron expression, see :mod:`nobody.cron`
+        :return: The invoked job instance
+        """
+        self.crontab = parse(expression)
+        return self
+
     def to(self, latest):
         """
         Schedule the job to run at an irregular (randomized) interval.
@@ -426,7 +751,7 @@ class Schedule(object):
             # call will fail.
             pass
         self._schedule_next_run()
-        self.scheduler.jobs.append(self)
+        self.scheduler._schedule(self)
         return self
 
     @property
@@ -436,22 +761,36 @@ class Schedule(object):
         """
         return datetime.datetime.now() >= self.next_time
 
-    def run(self):
+    def run(self, planned=None):
         """
-        Run the job and immediately reschedule it.
+        Run the job and immediately reschedule it, even if it raises.
 
+        :param planned: The time the job was due, the next run is
+                        computed from it rather than from now
         :return: The return value returned by the `job_func`
         """
         logger.info('Running job %s', self)
-        ret = self.job_func()
-        self.prev_time = datetime.datetime.now()
-        self._schedule_next_run()
-        return ret
+        try:
+            return self.job_func()
+        finally:
+            self.prev_time = datetime.datetime.now()
+            self._schedule_next_run(planned)
 
-    def _schedule_next_run(self):
+    def _schedule_next_run(self, planned=None):
         """
         Compute the instant when this job should run next.
+
+        :param planned: The time the last run was due. When given, the
+                        next run is one period after it, and runs missed
+                        while falling behind are skipped without shifting
+                        the phase.
         """
+        if self.crontab is not None:
+            now = datetime.datetime.now()
+            self.next_time = self.crontab.next_fire(planned or now)
+            if planned is not None and self.next_time <= now:
+                self.next_time = self.crontab.next_fire(now)
+            return
         if self.unit not in ('seconds', 'minutes', 'hours', 'days', 'weeks'):
             raise ScheduleValueError('Invalid unit')
 
@@ -463,7 +802,8 @@ class Schedule(object):
             interval = self.interval
 
         self.period = datetime.timedelta(**{self.unit: interval})
-        self.next_time = datetime.datetime.now() + self.period
+        now = datetime.datetime.now()
+        self.next_time = (planned or now) + self.period
         if self.start_day is not None:
             if self.unit != 'weeks':
                 raise ScheduleValueError('`unit` should be \'weeks\'')
@@ -517,6 +857,9 @@ class Schedule(object):
             # Let's see if we will still make that time we specified today
             if (self.next_time - datetime.datetime.now()).days >= 7:
                 self.next_time -= self.period
+        if planned is not None and self.next_time <= now:
+            # Fell behind: skip the missed runs but keep the phase
+            self.next_time += ((now - self.next_time) // self.period + 1) * self.period
 
 
 # The following methods are shortcuts for not having to
@@ -525,8 +868,19 @@ class Schedule(object):
 #: Default :class:`Scheduler <Scheduler>` object
 default_scheduler = Scheduler()
 
-#: Default :class:`Jobs <Job>` list
-jobs = default_scheduler.jobs  # todo: should this be a copy, e.g. jobs()?
+
+def jobs():
+    """Calls :meth:`jobs <Scheduler.jobs>` on the
+    :data:`default scheduler instance <default_scheduler>`.
+    """
+    return default_scheduler.jobs
+
+
+def get_jobs(tag=None):
+    """Calls :meth:`get_jobs <Scheduler.get_jobs>` on the
+    :data:`default scheduler instance <default_scheduler>`.
+    """
+    return default_scheduler.get_jobs(tag)
 
 
 def every(interval=1):
@@ -571,6 +925,34 @@ def next_run():
     return default_scheduler.next_run
 
 
+def cron(expression):
+    """Calls :meth:`cron <Scheduler.cron>` on the
+    :data:`default scheduler instance <default_scheduler>`.
+    """
+    return default_scheduler.cron(expression)
+
+
+def run_forever():
+    """Calls :meth:`run_forever <Scheduler.run_forever>` on the
+    :data:`default scheduler instance <default_scheduler>`.
+    """
+    default_scheduler.run_forever()
+
+
+def run_in_thread(name='scheduler', daemon=True):
+    """Calls :meth:`run_in_thread <Scheduler.run_in_thread>` on the
+    :data:`default scheduler instance <default_scheduler>`.
+    """
+    return default_scheduler.run_in_thread(name, daemon)
+
+
+def stop(timeout=None):
+    """Calls :meth:`stop <Scheduler.stop>` on the
+    :data:`default scheduler instance <default_scheduler>`.
+    """
+    default_scheduler.stop(timeout)
+
+
 def idle_seconds():
     """Calls :meth:`idle_seconds <Scheduler.idle_seconds>` on the
     :data:`default scheduler instance <default_scheduler>`.
@@ -7,38 +7,166 @@
 @Created: 2020/9/5
 @Desc: 
 """
+import base64
+import heapq
 import itertools
+import json
 import os
+import pickle
+import signal
+import struct
 import threading
 import time
 import traceback
 import uuid
-from collections import namedtuple
+from collections import namedtuple, deque
+from concurrent.futures import Future, wait, ALL_COMPLETED, FIRST_COMPLETED, FIRST_EXCEPTION
+from concurrent.futures.process import ProcessPoolExecutor, BrokenProcessPool
 from concurrent.futures.thread import ThreadPoolExecutor
+from contextvars import ContextVar
 from datetime import datetime
 from functools import wraps
-from queue import Queue
+from multiprocessing.shared_memory import SharedMemory
+from queue import Queue, Empty
 from typing import Optional, List, Dict
 
 from nobody.decorators import thread
+from nobody.journal import Journal
 from nobody.log import logger
-from nobody.schedule import Schedule
+from nobody.time import Schedule
 
 RUNNING = 'running'  # 执行中
 TERMINATED = 'terminated'  # 终止
 PAUSED = 'paused'  # 暂停
 FINISHED = 'finished'  # 已完成
 CANCELED = 'canceled'  # 已取消
+FAILED = 'failed'  # 执行出错
+DONE_STATUSES = (FINISHED, FAILED, TERMINATED, CANCELED)  # 终态
+
+# 任务池队列已满时的处理策略
+BLOCK = 'block'  # 阻塞调用方，直到队列有空位
+REJECT = 'reject'  # 拒绝，抛出 TaskRejectedError
+CALLER_RUNS = 'caller_runs'  # 在调用方线程中直接执行
+DISCARD_OLDEST = 'discard_oldest'  # 丢弃队列中最早的任务
+DROP = 'drop'  # 丢弃新的，用于事件总线
+
+DEFAULT_GROUP = 'default'  # 默认任务分组
+
+# 执行方式
+THREAD = 'thread'  # 线程池
+PROCESS = 'process'  # 进程池，适合CPU密集型任务，目标及参数必须可以 pickle
+
+# 周期任务到期时上次执行尚未结束的处理策略
+SKIP = 'skip'  # 跳过本次
+QUEUE = 'queue'  # 排队，上次结束后立即执行
+ALLOW = 'allow'  # 并发执行
+SKIPPED = 'skipped'  # 被跳过的执行记录的状态
+RUN_HISTORY = 100  # 周期任务保留的执行记录数
+
+# 看门狗处理阶段
+START = 'start'  # 进程任务已交给进程池：检查工作进程是否已开始执行
+DEADLINE = 'deadline'  # 截止时间到：尚未开始则取消，否则强行停止
+STOP = 'stop'  # 超时：强行停止
+KILL = 'kill'  # 停止后仍未结束：放弃线程或杀死工作进程
 
 TaskItem = namedtuple('TaskItem', ('task', 'args', 'kwargs'))
+TaskRun = namedtuple('TaskRun', ('planned', 'begin_time', 'finish_time', 'status', 'result', 'exception'))
+
+_current_handler = ContextVar('task_handler', default=None)
+_current_task = ContextVar('task', default=None)
+_handler_lock = threading.Lock()
+_task_ids = itertools.count(1)  # 任务ID，进程内递增的整数
+_NO_EVENTS = ()  # 未开启追踪的任务共用，不记录生命周期事件
+_deques: Dict[int, deque] = {}  # 线程ID -> 该线程派生的、尚未执行的子任务
+
+
+def _skip_ids(task_ids):
+    """
+    新任务的ID从给定ID中最大的整数之后开始，避免与日志中待恢复的任务重复
+
+    :param task_ids:
+    :return:
+    """
+    global _task_ids
+    last = max((task_id for task_id in task_ids if isinstance(task_id, int)), default=0)
+    with _handler_lock:
+        _task_ids = itertools.count(max(next(_task_ids), last + 1))
+
+
+def current_handler():
+    """
+    获取当前正在执行的任务的控制器，不在任务中执行时返回 None
+
+    :return:
+    """
+    return _current_handler.get()
+
+
+def checkpoint(every=1):
+    """
+    检查点：当前任务被暂停时在此等待，被终止时抛出 TaskTerminatedError，不在任务中执行时什么也不做
+
+    :param every: 每调用 every 次才真正检查一次，用于紧密循环
+    :return:
+    """
+    task_handler = _current_handler.get()
+    if task_handler is not None:
+        task_handler.checkpoint(every)
+
+
+def _local_deque():
+    """
+    当前线程的子任务队列，本线程从尾部取（后进先出），其他线程从头部窃取
+
+    :return:
+    """
+    ident = threading.get_ident()
+    local = _deques.get(ident)
+    if local is None:
+        local = _deques[ident] = deque()
+    return local
+
+
+def _run_spawned(sub):
+    """
+    执行派生的子任务，父任务已被终止的直接取消
+
+    :param sub:
+    :return:
+    """
+    if sub.task_handler._force_stop:
+        sub.cancel()
+    sub.run()
+
+
+def _steal():
+    """
+    空闲工作线程执行：从其他线程的子任务队列头部窃取执行，直到没有可窃取的
+
+    :return:
+    """
+    ident = threading.get_ident()
+    while True:
+        for owner, queue in list(_deques.items()):
+            if owner == ident:
+                continue
+            try:
+                sub = queue.popleft()
+                break
+            except IndexError:
+                continue
+        else:
+            return
+        _run_spawned(sub)
 
 
 def pausable(func):
     @wraps(func)
     def wrapper(*args, **kwargs):
-        obj = args[0]
-        if hasattr(obj, 'task_handler') and obj.task_handler:
-            obj.task_handler.wait()
+        obj = args[0] if args else None
+        task_handler = getattr(obj, 'task_handler', None) or _current_handler.get()
+        if task_handler:
+            task_handler.checkpoint()
         return func(*args, **kwargs)
 
     return wrapper
@@ -55,11 +183,31 @@ class _TaskHandler(object):
         self._force_stop = False
         self._stop_reason = None
         self._pause_timeout = None
+        self._signal = False  # 暂停或终止时为 True，检查点据此跳过加锁
+        self._ticks = 0
+        self._children = None  # 子任务的控制器，终止时一并终止
 
     def wait(self, timeout=None):
         if self._force_stop:
             raise TaskTerminatedError(self._stop_reason)
         self._thread_event.wait(timeout or self._pause_timeout)
+        if self._force_stop:
+            raise TaskTerminatedError(self._stop_reason)
+
+    def checkpoint(self, every=1):
+        """
+        检查点，未暂停且未终止时只读取一个属性，不加锁
+
+        :param every: 每调用 every 次才真正检查一次
+        :return:
+        """
+        if every > 1:
+            self._ticks += 1
+            if self._ticks < every:
+                return
+            self._ticks = 0
+        if self._signal:
+            self.wait()
 
     def pause(self, timeout=None):
         """
@@ -69,6 +217,7 @@ class _TaskHandler(object):
         """
         self._pause_timeout = timeout
         self._thread_event.clear()
+        self._signal = True
 
     def resume(self):
         """
@@ -76,6 +225,7 @@ class _TaskHandler(object):
 
         :return:
         """
+        self._signal = self._force_stop
         self._thread_event.set()
 
     def stop(self):
@@ -83,12 +233,29 @@ class _TaskHandler(object):
 
     def force_stop(self, reason=None):
         """
-        强行停止
+        强行停止，同时终止关联的子任务，暂停中的任务会被唤醒并终止
 
         :return:
         """
         self._force_stop = True
         self._stop_reason = reason
+        self._signal = True
+        self._thread_event.set()
+        for child in self._children or ():
+            child.force_stop(reason)
+
+    def link(self, child):
+        """
+        关联子任务的控制器
+
+        :param child:
+        :return:
+        """
+        if self._children is None:
+            self._children = []
+        self._children.append(child)
+        if self._force_stop:
+            child.force_stop(self._stop_reason)
 
     def handle(self, target, *args, **kwargs):
         obj = target(*args, **kwargs) if isinstance(target, type) else target
@@ -96,23 +263,218 @@ class _TaskHandler(object):
         return obj
 
 
+class _ProcessTaskHandler(_TaskHandler):
+    """
+    进程任务控制器，通过共享内存在父进程与工作进程间传递暂停、恢复与终止指令
+
+    共享内存布局：状态(1字节) | 填充 | 暂停超时(double) | 工作进程ID(int64) | 终止原因(utf-8)
+    """
+    _layout = struct.Struct('<b7xd')
+    _pid_layout = struct.Struct('<q')
+    _reason_offset = _layout.size + _pid_layout.size
+    _size = 256
+    poll_interval = 0.05  # 暂停时检查指令的间隔
+
+    def __init__(self, name=None):
+        self._ticks = 0
+        self._children = None
+        self._owner = name is None
+        if self._owner:
+            self._shm = SharedMemory(create=True, size=self._size)
+            self._shm.buf[:self._size] = bytes(self._size)
+        else:
+            try:
+                self._shm = SharedMemory(name, track=False)
+            except TypeError:  # Python < 3.13
+                self._shm = SharedMemory(name)
+
+    def __reduce__(self):
+        return self.__class__, (self._shm.name,)
+
+    def _write(self, state, timeout=None):
+        self._layout.pack_into(self._shm.buf, 0, state, timeout or 0)
+
+    def _read(self):
+        return self._layout.unpack_from(self._shm.buf, 0)
+
+    @property
+    def _signal(self):
+        return self._shm.buf[0]
+
+    @property
+    def pid(self):
+        """
+        正在执行任务的工作进程ID，未在执行时为 None
+
+        :return:
+        """
+        return self._pid_layout.unpack_from(self._shm.buf, self._layout.size)[0] or None
+
+    @pid.setter
+    def pid(self, value):
+        self._pid_layout.pack_into(self._shm.buf, self._layout.size, value or 0)
+
+    def wait(self, timeout=None):
+        state, pause_timeout = self._read()
+        if state == 2:
+            raise TaskTerminatedError(self._stop_reason)
+        if state == 0:
+            return
+        timeout = timeout or pause_timeout
+        deadline = time.monotonic() + timeout if timeout else None
+        while state == 1 and (deadline is None or time.monotonic() < deadline):
+            time.sleep(self.poll_interval)
+            state, _ = self._read()
+        if state == 2:
+            raise TaskTerminatedError(self._stop_reason)
+
+    def pause(self, timeout=None):
+        self._write(1, timeout)
+
+    def resume(self):
+        self._write(0)
+
+    def force_stop(self, reason=None):
+        data = str(reason or '').encode('utf-8')[:self._size - self._reason_offset]
+        start = self._reason_offset
+        self._shm.buf[start:start + len(data)] = data
+        self._write(2)
+        for child in self._children or ():
+            child.force_stop(reason)
+
+    @property
+    def _stop_reason(self):
+        reason = bytes(self._shm.buf[self._reason_offset:]).rstrip(b'\0')
+        return reason.decode('utf-8') or None
+
+    def close(self):
+        """
+        释放共享内存，父进程中同时删除
+
+        :return:
+        """
+        self._shm.close()
+        if self._owner:
+            self._shm.unlink()
+            self._owner = False
+
+
+def _run_in_process(task_handler, target, args, kwargs):
+    """
+    工作进程中的执行入口
+
+    :param task_handler: 进程任务控制器
+    :return:
+    """
+    token = _current_handler.set(task_handler)
+    task_handler.pid = os.getpid()
+    try:
+        task_handler.wait()
+        return target(*args, **kwargs)
+    finally:
+        task_handler.pid = None
+        _current_handler.reset(token)
+        task_handler.close()
+
+
+def _run_chunk(target, chunk):
+    """
+    依次执行一组参数，每组之间检查暂停与终止
+
+    :param target:
+    :param chunk: 参数元组列表
+    :return: 返回值列表
+    """
+    results = []
+    for args in chunk:
+        checkpoint()
+        results.append(target(*args))
+    return results
+
+
 class _Task:
+    """
+    任务，使用 __slots__ 且不预先创建 Event、Future 与空列表，排队中的任务只占几百字节
+    """
+    __slots__ = ('id', '_task_handler', 'parent', 'subs', 'future', 'begin_time', 'finish_time', 'schedule',
+                 'next_fire', 'recurring', 'overlap', 'runs', '_active', '_queued', 'spawned', '_limiters', 'timeout',
+                 'deadline', '_abandoned', 'executor', 'priority', 'group', 'depends_on', 'dependents', '_waiting',
+                 '_status', '_target', '_args', '_kwargs', '_listeners', '_async_listeners', '__subs_paused',
+                 '_future', '_resolved', '_result', '_exception', 'events')
+
     def __init__(self, target, *args, **kwargs):
-        self.id = str(uuid.uuid4())
-        self.task_handler = _TaskHandler()
+        self.id = next(_task_ids)
+        self._task_handler = None  # 首次使用时创建
         self.parent: Optional[_Task] = None  # 父任务
-        self.subs: List[_Task] = []  # 子任务
+        self.subs: List[_Task] = ()  # 子任务，首次添加时创建列表
         self.future = None
         self.begin_time = None
         self.finish_time = None
         self.schedule: Optional[Schedule] = None
+        self.next_fire: Optional[datetime] = None  # 下次执行时间，排期时由执行计划算出
+        self.recurring = False  # 周期任务：每次执行后按执行计划重新排期
+        self.overlap = SKIP  # 周期任务到期时上次执行尚未结束的处理策略
+        self.runs: Optional[deque] = None  # 周期任务的执行记录
+        self._active = 0  # 周期任务执行中的次数
+        self._queued: Optional[deque] = None  # 周期任务排队等待执行的计划时间
+        self.spawned = False  # 是否由 task_service.spawn 在父任务中派生
+        self._limiters = ()  # 分发时占用的限流器，结束时释放
+        self.timeout: Optional[float] = None  # 开始执行后的最长秒数
+        self.deadline: Optional[datetime] = None  # 必须结束的时间，到期时尚未开始则取消
+        self._abandoned = None  # 超时后不响应终止而被放弃线程时，记下线程所属的执行器
+        self.executor = THREAD  # 执行方式
+        self.priority = 0  # 优先级，越大越先执行
+        self.group = DEFAULT_GROUP  # 所属分组，分组间按权重公平调度
+        self.depends_on: List[_Task] = ()  # 依赖的任务，全部完成后才会就绪
+        self.dependents: List[_Task] = ()  # 依赖本任务的任务，首次添加时创建列表
+        self._waiting = 0  # 尚未完成的依赖数
         self._status = None
         self._target = target
         self._args = args
         self._kwargs = kwargs
-        self.__sub_finish_count = 0
-        self._listeners = []
+        self._listeners = ()  # 同步监听器，在触发事件的线程中调用
+        self._async_listeners = ()  # 异步监听器，由事件总线投递
         self.__subs_paused = False
+        self._future: Optional[Future] = None  # 见 _done，首次使用时创建
+        self._resolved = False  # 是否已进入终态
+        self._result = None
+        self._exception = None
+        self.events = _NO_EVENTS  # 生命周期事件：(事件, time.monotonic_ns(), 线程ID)，开启追踪时才记录
+
+    @property
+    def _done(self):
+        """
+        任务结束时完成的 Future，持有返回值或异常；首次使用时创建，任务已结束则立即完成
+
+        :return:
+        """
+        if self._future is None:
+            with _handler_lock:
+                if self._future is not None:
+                    return self._future
+                future = Future()
+                self._future = future
+                resolved = self._resolved
+            if resolved:
+                self.__resolve(future)
+        return self._future
+
+    @property
+    def task_handler(self):
+        """
+        任务控制器，首次使用时按执行方式创建，排队中的任务不占用 Event 或共享内存
+
+        :return:
+        """
+        if self._task_handler is None:
+            with _handler_lock:
+                if self._task_handler is None:
+                    self._task_handler = _ProcessTaskHandler() if self.executor == PROCESS else _TaskHandler()
+        return self._task_handler
+
+    @task_handler.setter
+    def task_handler(self, value):
+        self._task_handler = value
 
     @property
     def status(self):
@@ -120,17 +482,78 @@ class _Task:
 
     @status.setter
     def status(self, value):
-        self._status = value
-        for listener in self._listeners:
-            if not isinstance(listener, TaskListener):
-                continue
-            method = getattr(listener, f'on_status_changed')
-            if method:
-                method(task=self, status=value)
+        self._transition(value)
+
+    def _transition(self, value, exception=None):
+        """
+        改变状态。进入终态后不再改变，并发的终态转换（如超时停止与正常结束）只有先到的生效，Future 只完成一次
+
+        :param value: 新状态
+        :param exception: 以 FAILED 或 TERMINATED 结束时的异常，与状态一同记下
+        :return: 是否生效
+        """
+        with _handler_lock:
+            if self._status in DONE_STATUSES:
+                return False
+            self._status = value
+            if exception is not None:
+                self._exception = exception
+        if value == RUNNING:
+            if not self.begin_time:
+                self.begin_time = datetime.now()
+                self._mark('start')
+            else:
+                self._mark('resume')
+        elif value == PAUSED:
+            self._mark('pause')
+        elif value in DONE_STATUSES:
+            if value == TERMINATED and self._exception is None:  # 进程任务的控制器结束后即关闭，先记下终止原因
+                self._exception = TaskTerminatedError(self.task_handler._stop_reason)
+            self.finish_time = datetime.now()
+            self._mark('finish')
+        self._emit('on_status_changed', status=value)
         if value == FINISHED and self.parent:
             self.parent._sub_finish(sub=self)
+        if value in DONE_STATUSES:
+            self._settle()
 
         logger.debug(f'task {value}: {self.id}')
+        return True
+
+    def _settle(self):
+        """
+        进入终态：已有等待方时完成 Future，否则由 _done 在创建时完成
+
+        :return:
+        """
+        with _handler_lock:
+            self._resolved = True
+            future = self._future
+        if future is not None:
+            self.__resolve(future)
+
+    def __resolve(self, future):
+        status = self._status
+        if status == FINISHED:
+            future.set_result(self._result)
+        elif status == FAILED:
+            future.set_exception(self._exception)
+        elif status == TERMINATED:
+            future.set_exception(self._exception)
+        else:
+            future.cancel()
+            future.set_running_or_notify_cancel()  # 通知 concurrent.futures.wait 的等待方
+
+    def _mark(self, event):
+        """
+        记录生命周期事件：submit、ready、dispatch、start、pause、resume、finish，未开启追踪时什么也不做
+
+        :param event:
+        :return:
+        """
+        if self.events is _NO_EVENTS:
+            return
+        self.events.append((event, time.monotonic_ns(), threading.get_ident()))
 
     @property
     def cost(self):
@@ -144,6 +567,15 @@ class _Task:
         else:
             raise TaskError("Task does not start!")
 
+    def _arm(self):
+        """
+        按执行计划算出下次执行时间，每次排期只计算一次
+
+        :return:
+        """
+        self.next_fire = next(self.schedule) if self.schedule else None
+        return self.next_fire
+
     @property
     def ready(self):
         """
@@ -152,29 +584,136 @@ class _Task:
         :return:
         """
         if self.schedule:
-            return self.schedule.next_run <= datetime.now()
+            return (self.next_fire or self._arm()) <= datetime.now()
         else:
             return True
 
-    def run(self):
+    def run(self, on_start=None):
         if self.status:
             return
         if not self.ready:
             raise TaskNotReadyError(self.id)
-        self.status = RUNNING
+        if not self._transition(RUNNING):  # 刚被取消
+            return
+        if on_start is not None:  # 如从此刻开始计算超时
+            on_start(self)
+        token = _current_handler.set(self.task_handler)
+        task_token = _current_task.set(self)
+        try:
+            self._result = self._target(*self._args, **self._kwargs)
+            self.__join_spawned()
+            if self.status != TERMINATED:  # 目标未经过检查点就返回了
+                self.status = FINISHED
+        except TaskTerminatedError as e:
+            self.__cancel_spawned()
+            self._transition(TERMINATED, e)
+        except Exception as e:
+            logger.error(traceback.format_exc())
+            self.__cancel_spawned()
+            self._transition(FAILED, e)
+        finally:
+            _current_task.reset(task_token)
+            _current_handler.reset(token)
+
+    def __join_spawned(self):
+        """
+        结束前等待派生的子任务，本线程队列中的由自己执行
+
+        :return:
+        """
+        spawned = [sub for sub in self.subs if sub.spawned]
+        if spawned:
+            self._help(None, ALL_COMPLETED)
+            join(spawned)
+
+    def __cancel_spawned(self):
+        for sub in self.subs:
+            if sub.spawned:
+                sub.cancel()
+
+    def _help(self, timeout, return_when, waiting=None):
+        """
+        在本线程中执行队列尾部自己派生的子任务，而不是阻塞等待；更深的子任务由各自的父任务执行
+
+        :param timeout:
+        :param return_when:
+        :param waiting: 等待的子任务，按 return_when 满足即返回；默认为全部子任务
+        :return:
+        """
+        local = _deques.get(threading.get_ident())
+        if not local:
+            return
+        if waiting is not None:
+            if return_when != ALL_COMPLETED and any(
+                    t.done() and (return_when == FIRST_COMPLETED or t.status != FINISHED) for t in waiting):
+                return
+            waiting = {t for t in waiting if t.parent is self and t.spawned and not t.done()}
+            if not waiting:
+                return
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        while True:
+            try:
+                sub = local.pop()
+            except IndexError:
+                return
+            if sub.parent is not self:  # 自己的子任务已被窃取完，下面是祖先任务的
+                local.append(sub)
+                return
+            _run_spawned(sub)
+            if waiting is None or sub in waiting:
+                if return_when == FIRST_COMPLETED or (return_when == FIRST_EXCEPTION and sub.status != FINISHED):
+                    return
+                if waiting is not None:
+                    waiting.discard(sub)
+                    if not waiting:
+                        return
+            if deadline is not None and time.monotonic() >= deadline:
+                return
+
+    def __help_parent(self, timeout):
+        """
+        父任务在自己的线程中等待本任务时，先由父任务执行本线程队列中派生的子任务
+
+        :param timeout:
+        :return:
+        """
+        parent = self.parent
+        if self.spawned and parent is not None and not self._resolved and _current_task.get() is parent:
+            parent._help(timeout, ALL_COMPLETED, (self,))
+
+    def _run_once(self, planned):
+        """
+        周期任务的一次执行，结果记入执行记录，不改变任务状态
+
+        :param planned: 计划执行时间
+        :return: TaskRun
+        """
+        begin_time = datetime.now()
+        result = exception = None
+        token = _current_handler.set(self.task_handler)
+        task_token = _current_task.set(self)
         try:
-            self._target(*self._args, **self._kwargs)
-            self.status = FINISHED
+            result = self._target(*self._args, **self._kwargs)
+            self.__join_spawned()
+            status = FINISHED
         except TaskTerminatedError:
-            self.status = TERMINATED
-        except:
+            status = TERMINATED
+        except Exception as e:
             logger.error(traceback.format_exc())
-            raise
+            exception = e
+            status = FAILED
+        finally:
+            _current_task.reset(task_token)
+            _current_handler.reset(token)
+        return TaskRun(planned, begin_time, datetime.now(), status, result, exception)
 
     def add_sub(self, sub):
-        self.subs.append(sub)
+        if self.subs:
+            self.subs.append(sub)
+        else:
+            self.subs = [sub]
         sub.parent = self
-        # sub.task_handler = self.task_handler
+        self.task_handler.link(sub.task_handler)
         return self
 
     def pause(self, timeout=None, include_subs=True):
@@ -203,8 +742,8 @@ class _Task:
                 sub.resume()
         logger.debug(f'唤醒任务：{self.id}')
         self.task_handler.resume()
-        for listener in self._listeners:
-            listener.on_resumed(self, *args, **kwargs)
+        self.status = RUNNING
+        self._emit('on_resumed', *args, **kwargs)
         return True
 
     def stop(self, reason=None, *args, **kwargs):
@@ -216,9 +755,8 @@ class _Task:
         """
         assert self.status == RUNNING, f'只能终止执行中的任务！'
         self.task_handler.force_stop(reason)
-        self.status = TERMINATED
-        for listener in self._listeners:
-            listener.on_stop(self, *args, **kwargs)
+        if self._transition(TERMINATED):
+            self._emit('on_terminated', *args, **kwargs)
 
     def cancel(self):
         """
@@ -226,116 +764,1303 @@ class _Task:
 
         :return:
         """
-        if self.future:
+        if self.future and not self.recurring:
             if not self.future.cancel():
                 return False
         if not self.status:
             self.status = CANCELED
+            if self.executor == PROCESS and self._task_handler is not None and not self._active:
+                self._task_handler.close()  # 周期任务在两次执行之间被取消
             return True
         return self.status == CANCELED
 
     def wait(self, timeout=None):
         self.task_handler.wait(timeout)
 
-    def wait_sub_finished(self):
+    def done(self):
+        """
+        是否已结束（完成、出错、终止或取消）
+
+        :return:
+        """
+        return self._status in DONE_STATUSES
+
+    @property
+    def stop_reason(self):
+        """
+        终止原因，未被终止时为 None
+
+        :return:
+        """
+        if self._status == TERMINATED and self._exception is not None:
+            return self._exception.args[0] if self._exception.args else None
+        return None
+
+    def result(self, timeout=None):
+        """
+        等待并获取任务返回值，任务出错时抛出其异常，被终止时抛出 TaskTerminatedError，被取消时抛出 CancelledError。
+        父任务在自己的线程中等待派生的子任务时，先执行本线程队列中的子任务，不占着线程空等
+
+        :param timeout: 超时秒数，超时抛出 concurrent.futures.TimeoutError；执行子任务期间不检查超时，可能超出
+        :return:
+        """
+        self.__help_parent(timeout)
+        return self._done.result(timeout)
+
+    def exception(self, timeout=None):
+        """
+        等待并获取任务抛出的异常，正常完成时返回 None
+
+        :param timeout:
+        :return:
+        """
+        self.__help_parent(timeout)
+        return self._done.exception(timeout)
+
+    def add_done_callback(self, fn):
+        """
+        添加任务结束回调，回调接收任务本身作为参数，任务已结束时立即调用
+
+        :param fn:
+        :return:
+        """
+        self._done.add_done_callback(lambda f: fn(self))
+
+    def join(self, timeout=None, return_when=ALL_COMPLETED):
+        """
+        等待子任务结束，在任务自身的线程中调用时先执行本线程队列中派生的子任务，不占着线程空等
+
+        :param timeout: 执行子任务期间不检查超时，可能超出
+        :param return_when: ALL_COMPLETED、FIRST_COMPLETED 或 FIRST_EXCEPTION
+        :return: (已结束的子任务, 未结束的子任务)
+        """
+        if _current_task.get() is self:
+            self._help(timeout, return_when)
+        return join(self.subs, timeout, return_when)
+
+    def wait_sub_finished(self, timeout=None):
         """
         等待子任务完成
 
         :return:
         """
         logger.debug('等待子任务完成')
-        self.pause(include_subs=False)
-        self.task_handler.wait()
+        return self.join(timeout)
 
     def _sub_finish(self, sub):
+        self._emit('on_sub_finished', sub=sub)
+
+    def _emit(self, method, *args, **kwargs):
+        """
+        触发事件：同步监听器立即调用，异步监听器交给事件总线
+
+        :param method: 监听器方法名
+        :return:
+        """
         for listener in self._listeners:
-            listener.on_sub_finished(task=self, sub=sub)
-        self.__sub_finish_count += 1
-        if self.__sub_finish_count >= len(self.subs) and self._status == PAUSED:
-            logger.debug(f'{self.__sub_finish_count}')
-            self.task_handler.resume()
-            # self.__sub_finish_count = 0
+            handler = getattr(listener, method, None)
+            if handler:
+                handler(self, *args, **kwargs)
+        if self._async_listeners:
+            event_bus.publish(self, method, args, kwargs, self._async_listeners)
 
-    def add_listener(self, listener):
+    def add_listener(self, listener, sync=None):
         """
         添加任务监听器
 
         :param listener:
+        :param sync: 是否同步调用，默认取 listener.synchronous；异步监听器由事件总线在独立线程中投递
         :return:
         """
-        self._listeners.append(listener)
+        if sync is None:
+            sync = getattr(listener, 'synchronous', False)
+        if sync:
+            self._listeners += (listener,)
+        else:
+            self._async_listeners += (listener,)
 
 
-class TaskPoolExecutor(ThreadPoolExecutor):
+class _BatchTask(_Task):
     """
-    任务池执行器
+    批量提交的任务，结束时通知所属批次计数
     """
-    _counter = itertools.count().__next__
+    __slots__ = ('batch_id', 'index', 'batch')
 
-    def __init__(self, max_workers=None, thread_name_prefix=''):
-        super().__init__(max_workers, thread_name_prefix)
+    def __init__(self, batch_id, index, target, args):
+        super().__init__(target, *args)
+        self.batch_id = batch_id
+        self.index = index
+        self.batch: Optional[TaskBatch] = None
 
-    @property
-    def max_workers(self):
-        return self._max_workers or (os.cpu_count() or 1) * 5
+    def _settle(self):
+        super()._settle()
+        if self.batch is not None:
+            self.batch._on_done()
 
-    def submit(self, fn, *args, **kwargs):
-        pass
 
+def join(tasks, timeout=None, return_when=ALL_COMPLETED):
+    """
+    等待一组任务结束，不占用任务的暂停状态，也不轮询。
+    在任务中等待其派生的子任务时，先执行本线程队列中的子任务，见 _Task.join
 
-class __TaskService(object):
-    def __init__(self):
-        self._tasks: Dict[str, _Task] = {}
-        self._queue = Queue()
-        self._max_workers = None
-        self._task_executor = ThreadPoolExecutor()
-        self._working = False
-        self._stopping_self = False
-        self.daemon = True
-        self.stop_self_timeout = 600
-        self._self_stop_thread = None
+    :param tasks:
+    :param timeout: 超时秒数，超时后返回当前结果
+    :param return_when: ALL_COMPLETED、FIRST_COMPLETED 或 FIRST_EXCEPTION
+    :return: (已结束的任务, 未结束的任务)
+    """
+    current = _current_task.get()
+    if current is not None:
+        tasks = list(tasks)
+        current._help(timeout, return_when, [task for task in tasks if task.parent is current])
+    tasks = {task._done: task for task in tasks}
+    done, not_done = wait(tasks, timeout, return_when)
+    return {tasks[f] for f in done}, {tasks[f] for f in not_done}
 
-    @property
-    def working(self):
-        return self._working
 
-    @property
-    def tasks(self):
-        return self._tasks.keys()
+class TaskBatch(object):
+    """
+    submit_many 返回的任务集合，可迭代、可用于 join，并提供汇总进度
+    """
+
+    def __init__(self, batch_id, tasks, chunksize=1):
+        self.id = batch_id
+        self.tasks: List[_Task] = tasks
+        self.chunksize = chunksize
+        self._finished = 0
+        self._lock = threading.Lock()
+        for task in tasks:
+            task.batch = self
+
+    def __len__(self):
+        return len(self.tasks)
+
+    def __iter__(self):
+        return iter(self.tasks)
+
+    def __getitem__(self, index):
+        return self.tasks[index]
+
+    def _on_done(self):
+        with self._lock:
+            self._finished += 1
 
     @property
-    def max_workers(self):
-        return self._max_workers or (os.cpu_count() or 1) * 5
+    def finished(self):
+        """
+        已结束的任务数
 
-    def get_task(self, task_id):
+        :return:
         """
-        获取任务
+        return self._finished
+
+    @property
+    def progress(self):
+        """
+        进度，0 到 1
 
-        :param task_id:
         :return:
         """
-        return self._tasks.get(task_id).task
+        return self._finished / len(self.tasks) if self.tasks else 1.0
 
-    def submit(self, target, *args, **kwargs):
-        task = _Task(target, *args, **kwargs)
-        self._tasks[task.id] = task
-        # try:
-        #     setattr(target, '__task', task)
-        # except:
-        #     pass
-        if not self.working:
-            self.start()
-        return task
+    def done(self):
+        return self._finished == len(self.tasks)
 
-    def pause_task(self, task_id, timeout=None):
+    def counts(self):
         """
-        暂停任务
+        各状态的任务数，尚未开始执行的键为 None
 
-        :param task_id:
-        :param timeout:
         :return:
         """
-        task: _Task = self._tasks.get(task_id)
+        counts = {}
+        for task in self.tasks:
+            counts[task.status] = counts.get(task.status, 0) + 1
+        return counts
+
+    def wait(self, timeout=None, return_when=ALL_COMPLETED):
+        """
+        等待任务结束
+
+        :param timeout:
+        :param return_when: ALL_COMPLETED、FIRST_COMPLETED 或 FIRST_EXCEPTION
+        :return: (已结束的任务, 未结束的任务)
+        """
+        return join(self.tasks, timeout, return_when)
+
+    def results(self, timeout=None):
+        """
+        按提交顺序返回每组参数的返回值，分块执行的结果会展开；任一任务未成功完成则抛出其异常
+
+        :param timeout:
+        :return:
+        """
+        _, not_done = self.wait(timeout, FIRST_EXCEPTION)
+        for task in self.tasks:
+            if task.done() and task.status != FINISHED:
+                task.result(0)  # 抛出任务的异常
+        if not_done:
+            raise TimeoutError(f'批次未完成：{self.id}')
+        if self.chunksize == 1:
+            return [task.result(0) for task in self.tasks]
+        results = []
+        for task in self.tasks:
+            results.extend(task.result(0))
+        return results
+
+    def cancel(self):
+        """
+        取消尚未开始执行的任务
+
+        :return: 取消的任务数
+        """
+        return sum(1 for task in self.tasks if not task.status and task.cancel())
+
+    def stop(self, reason=None):
+        """
+        终止执行中的任务，并取消尚未开始执行的任务
+
+        :param reason:
+        :return:
+        """
+        for task in self.tasks:
+            if task.status == RUNNING:
+                task.stop(reason)
+            elif not task.status:
+                task.cancel()
+
+
+class TaskPoolExecutor(ThreadPoolExecutor):
+    """
+    任务池执行器
+
+    max_queue_size 为 0 时队列不限长度；否则排队与执行中的任务总数不超过 max_workers + max_queue_size，
+    超出时按 policy 处理，policy 可以是 BLOCK/REJECT/CALLER_RUNS/DISCARD_OLDEST，
+    也可以是可调用对象 policy(executor, fn, *args, **kwargs)，其返回值作为 submit 的返回值
+    """
+    _counter = itertools.count().__next__
+
+    def __init__(self, max_workers=None, thread_name_prefix='', max_queue_size=0, policy=BLOCK):
+        super().__init__(max_workers or (os.cpu_count() or 1) * 5, thread_name_prefix)
+        self.max_queue_size = max_queue_size
+        self.policy = policy
+        self._slots = threading.Semaphore(self._max_workers + max_queue_size) if max_queue_size else None
+        self._discard_lock = threading.Lock()
+
+    @property
+    def max_workers(self):
+        return self._max_workers or (os.cpu_count() or 1) * 5
+
+    def submit(self, fn, *args, **kwargs):
+        if self._slots is None:
+            return super().submit(fn, *args, **kwargs)
+        if not self._slots.acquire(blocking=False):
+            if callable(self.policy):
+                return self.policy(self, fn, *args, **kwargs)
+            if self.policy == BLOCK:
+                self._slots.acquire()
+            elif self.policy == REJECT:
+                raise TaskRejectedError(f'任务池已满：{self.max_workers} + {self.max_queue_size}')
+            elif self.policy == CALLER_RUNS:
+                return self._run_in_caller(fn, *args, **kwargs)
+            elif self.policy == DISCARD_OLDEST:
+                self._discard_oldest()
+            else:
+                raise ValueError(f'未知的队列策略：{self.policy}')
+        try:
+            future = super().submit(fn, *args, **kwargs)
+        except:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda f: self._slots.release())
+        return future
+
+    def _run_in_caller(self, fn, *args, **kwargs):
+        """
+        在调用方线程中执行
+
+        :return:
+        """
+        future = Future()
+        future.set_running_or_notify_cancel()
+        try:
+            future.set_result(fn(*args, **kwargs))
+        except BaseException as e:
+            future.set_exception(e)
+        return future
+
+    def submit_idle(self, fn, *args, **kwargs):
+        """
+        有空闲线程或还能新建线程时提交，不占用排队名额，用于唤醒线程窃取子任务
+
+        :return: 是否提交
+        """
+        if self._shutdown:
+            return False
+        if self._idle_semaphore.acquire(timeout=0):
+            self._idle_semaphore.release()
+        elif len(self._threads) >= self._max_workers:
+            return False
+        ThreadPoolExecutor.submit(self, fn, *args, **kwargs)
+        return True
+
+    def abandon(self):
+        """
+        放弃一个卡在任务中的线程：多允许一个线程和一个名额补上它，该任务结束后调用 reclaim 收回
+
+        :return:
+        """
+        with self._shutdown_lock:
+            self._max_workers += 1
+        if self._slots is not None:
+            self._slots.release()
+
+    def reclaim(self):
+        """
+        收回 abandon 多给的线程和名额
+
+        :return:
+        """
+        with self._shutdown_lock:
+            self._max_workers -= 1
+        if self._slots is not None:
+            self._slots.acquire(blocking=False)
+
+    def _discard_oldest(self):
+        """
+        取消队列中最早的任务，直到腾出空位
+
+        :return:
+        """
+        with self._discard_lock:
+            while not self._slots.acquire(blocking=False):
+                try:
+                    work_item = self._work_queue.get_nowait()
+                except Empty:
+                    # 队列为空说明空位都被执行中的任务占用，只能等待
+                    self._slots.acquire()
+                    return
+                if work_item is None:  # 关闭信号
+                    self._work_queue.put(None)
+                    raise RuntimeError('cannot schedule new futures after shutdown')
+                work_item.future.cancel()
+                logger.debug('任务池已满，丢弃最早的任务')
+
+
+class _Watchdog(object):
+    """
+    看门狗：一个线程维护截止时间堆，到期时在该线程中调用 on_expired(task, phase)
+    """
+
+    def __init__(self, on_expired):
+        self._on_expired = on_expired
+        self._heap = []  # (time.monotonic() 截止时间, 序号, 任务, 阶段)
+        self._condition = threading.Condition()
+        self._sequence = itertools.count().__next__
+        self._thread = None
+
+    def __len__(self):
+        return len(self._heap)
+
+    def watch(self, task, due, phase):
+        """
+        登记截止时间
+
+        :param task:
+        :param due: time.monotonic() 时间
+        :param phase: 到期时原样传给 on_expired
+        :return:
+        """
+        with self._condition:
+            heapq.heappush(self._heap, (due, self._sequence(), task, phase))
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._loop, name='任务看门狗', daemon=True)
+                self._thread.start()
+            elif self._heap[0][2] is task:
+                self._condition.notify()
+
+    def _loop(self):
+        while True:
+            with self._condition:
+                now = time.monotonic()
+                while not self._heap or self._heap[0][0] > now:
+                    self._condition.wait(self._heap[0][0] - now if self._heap else None)
+                    now = time.monotonic()
+                _, _, task, phase = heapq.heappop(self._heap)
+            if task.done() and phase != KILL:
+                continue
+            try:
+                self._on_expired(task, phase)
+            except Exception as e:
+                logger.error(f'看门狗处理超时出错：{task.id}, {e}')
+
+
+class _Limiter(object):
+    """
+    命名限流器，可挂在多个分组上：限制并发数，并按令牌桶限制分发速率；
+    只在分发线程持有条件变量时访问
+    """
+
+    def __init__(self, name, max_running=None, rate=None, burst=None):
+        self.name = name
+        self.max_running = max_running  # 最大并发数
+        self.rate = rate  # 每秒补充的令牌数
+        self.burst = burst or 1  # 令牌桶容量
+        self.tokens = self.burst
+        self.running = 0
+        self.acquired = 0
+        self.limited_by_concurrency = 0  # 因并发数已满而被挡住的任务数，每个任务只计一次
+        self.limited_by_rate = 0  # 因令牌不足而被挡住的任务数，每个任务只计一次
+        self._refilled = time.monotonic()
+
+    def configure(self, max_running=None, rate=None, burst=None):
+        self._refill(time.monotonic())
+        self.max_running = max_running
+        self.rate = rate
+        self.burst = burst or 1
+        self.tokens = min(self.tokens, self.burst)
+
+    def _refill(self, now):
+        if self.rate:
+            self.tokens = min(self.burst, self.tokens + (now - self._refilled) * self.rate)
+        self._refilled = now
+
+    def delay(self, now):
+        """
+        距可以放行一个任务还需等待的秒数
+
+        :param now: time.monotonic()
+        :return: 0 表示可以放行，None 表示需等待执行中的任务结束
+        """
+        if self.max_running is not None and self.running >= self.max_running:
+            return None
+        if self.rate:
+            self._refill(now)
+            if self.tokens < 1:
+                return (1 - self.tokens) / self.rate
+        return 0
+
+    def acquire(self):
+        self.running += 1
+        self.acquired += 1
+        if self.rate:
+            self.tokens -= 1
+
+    def release(self):
+        self.running -= 1
+
+    @property
+    def stats(self):
+        self._refill(time.monotonic())
+        return dict(max_running=self.max_running,
+                    rate=self.rate,
+                    burst=self.burst,
+                    running=self.running,
+                    tokens=self.tokens if self.rate else None,
+                    acquired=self.acquired,
+                    limited_by_concurrency=self.limited_by_concurrency,
+                    limited_by_rate=self.limited_by_rate,
+                    utilization=self.running / self.max_running if self.max_running else None)
+
+
+class _TaskGroup(object):
+    """
+    任务分组，组内按优先级排队，组间按权重公平分配工作线程
+    """
+
+    def __init__(self, name, weight=1, min_share=0):
+        self.name = name
+        self.weight = weight
+        self.min_share = min_share  # 保证的最少工作线程数
+        self.vtime = 0  # 虚拟时间，每分发一个任务增加 1 / weight
+        self.running = 0
+        self.dispatched = 0
+        self.wait_total = 0
+        self.wait_max = 0
+        self.limiters: List[_Limiter] = []
+        self._queues = {THREAD: [], PROCESS: []}  # 按执行方式分开排队：(-优先级, 序号, 就绪时间, 任务)
+        self._held = {}  # 被限流挡住的任务 -> 已计数的 (限流器, 是否因并发数)，出队时移除
+
+    def __len__(self):
+        return sum(len(queue) for queue in self._queues.values())
+
+    def push(self, task, sequence):
+        task._mark('ready')
+        heapq.heappush(self._queues[task.executor], (-task.priority, sequence, time.monotonic(), task))
+
+    def oldest(self):
+        """
+        最早入队且尚未开始的任务的队列项，没有则返回 None
+
+        :return:
+        """
+        return min((entry for queue in self._queues.values() for entry in queue
+                    if entry[3].status is None and not entry[3].recurring),
+                   key=lambda entry: entry[1], default=None)
+
+    def head(self, executors):
+        """
+        给定执行方式的队列中排在最前的队列项，已结束的任务顺便丢弃
+
+        :param executors: 尚有名额的执行方式
+        :return: 没有则返回 None
+        """
+        head = None
+        for executor in executors:
+            queue = self._queues[executor]
+            while queue and queue[0][3].status in DONE_STATUSES:
+                self._held.pop(heapq.heappop(queue)[3], None)
+            if queue and (head is None or queue[0][:2] < head[:2]):
+                head = queue[0]
+        return head
+
+    def delay(self, now, task):
+        """
+        限流：距可以分发还需等待的秒数，0 表示可以分发，None 表示需等待执行中的任务结束。
+        分发线程每次唤醒都会检查，队首任务被同一限流器以同一原因挡住只计一次
+
+        :param now:
+        :param task: 队首任务
+        :return:
+        """
+        delay = 0
+        for limiter in self.limiters:
+            wait = limiter.delay(now)
+            if wait == 0:
+                continue
+            counted = self._held.setdefault(task, set())
+            if (limiter, wait is None) not in counted:
+                counted.add((limiter, wait is None))
+                if wait is None:
+                    limiter.limited_by_concurrency += 1
+                else:
+                    limiter.limited_by_rate += 1
+            if wait is None:
+                return None
+            delay = max(delay, wait)
+        return delay
+
+    def pop(self, vclock, executor):
+        _, _, ready_at, task = heapq.heappop(self._queues[executor])
+        self._held.pop(task, None)
+        for limiter in self.limiters:
+            limiter.acquire()
+        task._limiters = tuple(self.limiters)
+        task._mark('dispatch')
+        wait = time.monotonic() - ready_at
+        self.wait_total += wait
+        self.wait_max = max(self.wait_max, wait)
+        self.dispatched += 1
+        self.running += 1
+        self.vtime = max(self.vtime, vclock) + 1 / self.weight
+        return task
+
+    @property
+    def stats(self):
+        return dict(weight=self.weight,
+                    min_share=self.min_share,
+                    depth=len(self),
+                    running=self.running,
+                    dispatched=self.dispatched,
+                    wait_avg=self.wait_total / self.dispatched if self.dispatched else 0,
+                    wait_max=self.wait_max,
+                    limiters=[limiter.name for limiter in self.limiters])
+
+
+class __TaskService(object):
+    def __init__(self):
+        self._registry = _TaskRegistry()
+        self._queue = Queue()
+        self._max_workers = None
+        self._max_queue_size = 0
+        self._policy = BLOCK
+        self._task_executor = TaskPoolExecutor()
+        self._max_processes = None
+        self._process_executor = None
+        self._running_processes = 0  # 已交给进程池的任务数，不超过 max_processes，不占用工作线程名额
+        self._working = False
+        self._dispatching = False
+        self._ready_heap = []  # 计划任务堆：(计划执行时间, 序号, 任务)
+        self._groups: Dict[str, _TaskGroup] = {DEFAULT_GROUP: _TaskGroup(DEFAULT_GROUP)}
+        self._vclock = 0  # 公平调度的全局虚拟时间
+        self._limiters: Dict[str, _Limiter] = {}
+        self._throttle_wait = None  # 被限速的分组最早可以分发的等待秒数
+        self._watchdog = _Watchdog(self.__on_expired)
+        self.stop_grace = 1  # 超时强行停止后等待任务响应的秒数
+        self._running = 0
+        self._tracer = None
+        self._journal: Optional[Journal] = None
+        self._journal_listener = None
+        self._condition = threading.Condition()
+        self._sequence = itertools.count().__next__
+        self._stopping_self = False
+        self.daemon = True
+        self.stop_self_timeout = 600
+        self._self_stop_thread = None
+
+    @property
+    def working(self):
+        return self._working
+
+    @property
+    def tasks(self):
+        return self._registry.ids()
+
+    def get_tasks(self, status=None):
+        """
+        获取指定状态的任务
+
+        :param status: 任务状态，None 表示尚未开始执行的任务
+        :return:
+        """
+        return self._registry.get_tasks(status)
+
+    def count(self, status=None):
+        """
+        统计指定状态的任务数
+
+        :param status: 任务状态，None 表示尚未开始执行的任务
+        :return:
+        """
+        return self._registry.count(status)
+
+    def set_retention(self, keep_last=None, keep_for=None, on_evict=None):
+        """
+        设置已结束任务的保留策略，超出保留范围的任务从服务中移除
+
+        :param keep_last: 最多保留最近结束的任务数，0 表示不保留
+        :param keep_for: 结束后保留的秒数
+        :param on_evict: 任务被移除时的回调，接收任务本身作为参数
+        :return:
+        """
+        self._registry.set_retention(keep_last, keep_for, on_evict)
+
+    @property
+    def max_workers(self):
+        return self._max_workers or (os.cpu_count() or 1) * 5
+
+    @property
+    def max_processes(self):
+        return self._max_processes or os.cpu_count() or 1
+
+    def configure(self, max_workers=None, max_queue_size=0, policy=BLOCK, max_processes=None):
+        """
+        配置任务池，替换当前执行器，已提交给旧执行器的任务会继续执行完
+
+        :param max_workers: 最大工作线程数
+        :param max_queue_size: 最大排队数，0 表示不限；否则未结束（排队、计划、执行中）的任务总数
+                               不超过 max_workers + max_queue_size，超出时由 submit 在调用方线程中按 policy 处理
+        :param policy: 队列已满时的处理策略：BLOCK 阻塞调用方、REJECT 抛出 TaskRejectedError、
+                       CALLER_RUNS 在调用方线程中执行、DISCARD_OLDEST 取消最早排队的任务，
+                       也可以是可调用对象 policy(task_service, target, *args, **kwargs)，其返回值作为 submit 的返回值
+        :param max_processes: 进程池最大进程数，也是同时交给进程池的任务数上限，不占用 max_workers，默认为CPU核数
+        :return:
+        """
+        if not callable(policy) and policy not in (BLOCK, REJECT, CALLER_RUNS, DISCARD_OLDEST):
+            raise ValueError(f'未知的队列策略：{policy}')
+        executor = self._task_executor
+        self._max_workers = max_workers
+        self._max_queue_size = max_queue_size
+        self._policy = policy
+        self._task_executor = TaskPoolExecutor(self.max_workers)  # 分发线程只在有空闲线程时提交，无需排队
+        executor.shutdown(wait=False)
+        if self._max_processes != max_processes and self._process_executor:
+            self._process_executor.shutdown(wait=False)
+            self._process_executor = None
+        self._max_processes = max_processes
+        self._registry.notify_room()
+
+    def _queue_limit(self):
+        """
+        未结束的任务数上限，None 表示不限
+
+        :return:
+        """
+        return self.max_workers + self._max_queue_size if self._max_queue_size else None
+
+    @property
+    def process_executor(self):
+        """
+        进程池，首次使用时创建
+
+        :return:
+        """
+        if self._process_executor is None:
+            self._process_executor = ProcessPoolExecutor(self._max_processes)
+        return self._process_executor
+
+    def set_group(self, name, weight=1, min_share=0):
+        """
+        设置任务分组，分组间按权重分配工作线程，每个分组至少保证 min_share 个工作线程
+
+        :param name: 分组名
+        :param weight: 权重
+        :param min_share: 保证的最少工作线程数
+        :return:
+        """
+        with self._condition:
+            group = self._groups.get(name)
+            if group is not None:
+                group.weight = weight
+                group.min_share = min_share
+            else:
+                self._groups[name] = _TaskGroup(name, weight, min_share)
+            self._condition.notify()
+
+    def group_stats(self):
+        """
+        各分组的统计：排队数、执行数、已分发数、平均及最大等待秒数
+
+        :return:
+        """
+        with self._condition:
+            return {name: group.stats for name, group in self._groups.items()}
+
+    def set_limiter(self, name, max_running=None, rate=None, burst=None, groups=None):
+        """
+        设置命名限流器并挂到分组上，被限流的任务留在分组队列中，不占用工作线程
+
+        :param name: 限流器名
+        :param max_running: 最大并发数，None 表示不限
+        :param rate: 每秒最多分发的任务数，None 表示不限
+        :param burst: 令牌桶容量，即允许的突发分发数，默认为 1
+        :param groups: 挂载的分组名，默认为与限流器同名的分组；挂在多个分组上时共享额度
+        :return:
+        """
+        with self._condition:
+            limiter = self._limiters.get(name)
+            if limiter is None:
+                limiter = self._limiters[name] = _Limiter(name, max_running, rate, burst)
+            else:
+                limiter.configure(max_running, rate, burst)
+            for group_name in groups or (name,):
+                group = self.__get_group(group_name)
+                if limiter not in group.limiters:
+                    group.limiters.append(limiter)
+            self._condition.notify()
+
+    def remove_limiter(self, name):
+        """
+        移除限流器
+
+        :param name:
+        :return:
+        """
+        with self._condition:
+            limiter = self._limiters.pop(name, None)
+            for group in self._groups.values():
+                if limiter in group.limiters:
+                    group.limiters.remove(limiter)
+            self._condition.notify()
+
+    def limiter_stats(self):
+        """
+        各限流器的统计：执行数、剩余令牌、被并发数或速率挡住的任务数、并发利用率，用于判断瓶颈在哪个限制
+
+        :return:
+        """
+        with self._condition:
+            return {name: limiter.stats for name, limiter in self._limiters.items()}
+
+    def enable_trace(self, path):
+        """
+        开启任务追踪，此后提交的任务结束时写入 Chrome trace（traceEvents）JSON 文件，可用 Perfetto 或 chrome://tracing 打开
+
+        :param path: 追踪文件路径
+        :return:
+        """
+        self.disable_trace()
+        self._tracer = TaskTracer(path)
+        return self._tracer
+
+    def __trace(self, task):
+        """
+        开启追踪时为任务记录生命周期事件，结束时由追踪器写入
+
+        :param task:
+        :return:
+        """
+        if self._tracer:
+            task.events = []
+            task.add_listener(self._tracer)
+        task._mark('submit')
+
+    def disable_trace(self):
+        """
+        关闭任务追踪并补全追踪文件
+
+        :return:
+        """
+        tracer, self._tracer = self._tracer, None
+        if tracer:
+            event_bus.flush()
+            tracer.close()
+
+    def enable_journal(self, path, sync=False, recover=True, **kwargs):
+        """
+        开启任务日志，记录此后提交的任务及其状态变化，进程崩溃后可据此恢复未完成的任务。
+        只记录目标、参数及执行计划可以 pickle 的任务；任务结束后即从日志中删除
+
+        :param path: 日志文件路径
+        :param sync: 是否等待日志落盘后再返回，默认由后台线程批量落盘
+        :param recover: 是否立即恢复日志中未完成的任务
+        :param kwargs: 传给 Journal 的其他参数，如 commit_interval、compact_threshold
+        :return: 恢复的任务列表
+        """
+        self.disable_journal()
+        self._journal = Journal(path, sync=sync, **kwargs)
+        _skip_ids(task_id for task_id, _ in self._journal.items())
+        self._journal_listener = _TaskJournalListener(self._journal)
+        return self.recover() if recover else []
+
+    def disable_journal(self):
+        """
+        关闭任务日志
+
+        :return:
+        """
+        journal, self._journal = self._journal, None
+        if journal is not None:
+            journal.close()
+
+    def __journal_task(self, task, schedule, executor, priority, group, depends_on, recurring=False, overlap=SKIP,
+                       timeout=None, deadline=None):
+        try:
+            payload = pickle.dumps((task._target, task._args, task._kwargs, schedule))
+        except Exception as e:
+            logger.warning(f'任务无法序列化，不记录日志：{task.id}, {e}')
+            return
+        self._journal.set(task.id, dict(payload=base64.b64encode(payload).decode('ascii'),
+                                        executor=executor,
+                                        priority=priority,
+                                        group=group,
+                                        depends_on=[getattr(dep, 'id', dep) for dep in depends_on or ()],
+                                        recurring=recurring,
+                                        overlap=overlap,
+                                        timeout=timeout,
+                                        deadline=deadline.timestamp() if deadline else None,
+                                        status=None))
+
+    def recover(self):
+        """
+        按日志重新提交未完成的任务，任务ID保持不变，已在服务中的任务跳过，可重复调用。
+        已不在日志中的依赖视为已完成
+
+        :return: 恢复的任务列表
+        """
+        if self._journal is None:
+            raise TaskError('未开启任务日志')
+        tasks = []
+        for task_id, record in self._journal.items():
+            if task_id in self._registry:
+                continue
+            try:
+                target, args, kwargs, schedule = pickle.loads(base64.b64decode(record['payload']))
+            except Exception as e:
+                logger.error(f'无法恢复任务：{task_id}, {e}')
+                self._journal.delete(task_id)
+                continue
+            depends_on = [dep for dep in record['depends_on'] if dep in self._registry]
+            tasks.append(self.__submit(task_id, target, args, kwargs, schedule, record['executor'],
+                                       record['priority'], record['group'], depends_on,
+                                       record.get('recurring', False), record.get('overlap', SKIP),
+                                       record.get('timeout'),
+                                       datetime.fromtimestamp(record['deadline']) if record.get('deadline') else None))
+        if tasks:
+            logger.info(f'从任务日志恢复 {len(tasks)} 个任务')
+        return tasks
+
+    def get_task(self, task_id):
+        """
+        获取任务
+
+        :param task_id:
+        :return:
+        """
+        return self._registry.get(task_id)
+
+    def submit(self, target, *args, task_schedule=None, task_executor=THREAD, task_priority=0,
+               task_group=DEFAULT_GROUP, task_depends_on=None, task_recurring=False, task_overlap=SKIP,
+               task_timeout=None, task_deadline=None, **kwargs):
+        """
+        提交任务。服务的选项都以 task_ 开头，其余位置参数与关键字参数原样传给任务目标
+
+        :param target: 任务目标
+        :param task_schedule: 执行计划，为空则立即执行
+        :param task_executor: 执行方式，THREAD 或 PROCESS，PROCESS 方式下目标须通过 current_handler() 响应暂停与终止
+        :param task_priority: 优先级，越大越先执行，高优先级任务总是先于低优先级任务分发
+        :param task_group: 所属分组，同优先级的任务在分组间按权重公平分发
+        :param task_depends_on: 依赖的任务或任务ID，全部完成后才就绪，任一依赖未能完成则本任务被取消
+        :param task_recurring: 周期任务，每次执行后按执行计划重新排期，执行记录见 task.runs，
+                               执行计划不再产生更晚的时间时结束，也可以 cancel 或 stop 结束
+        :param task_overlap: 周期任务到期时上次执行尚未结束的处理策略，SKIP、QUEUE 或 ALLOW
+        :param task_timeout: 开始执行后的最长秒数，超时强行停止；stop_grace 秒后仍未结束的，
+                             线程任务放弃其线程（由新线程补上），进程任务杀死工作进程
+        :param task_deadline: 必须结束的时间（datetime），到期时尚未开始则取消，否则同 task_timeout 处理
+        :return: 任务；队列已满时按 configure 的 policy 在调用方线程中处理，见 configure
+        """
+        return self.__submit(None, target, args, kwargs, task_schedule, task_executor, task_priority, task_group,
+                             task_depends_on, task_recurring, task_overlap, task_timeout, task_deadline, bounded=True)
+
+    def __submit(self, task_id, target, args, kwargs, schedule, executor, priority, group, depends_on,
+                 recurring=False, overlap=SKIP, timeout=None, deadline=None, bounded=False):
+        if executor not in (THREAD, PROCESS):
+            raise ValueError(f'未知的执行方式：{executor}')
+        if recurring and schedule is None:
+            raise ValueError('周期任务必须指定执行计划')
+        if overlap not in (SKIP, QUEUE, ALLOW):
+            raise ValueError(f'未知的重叠策略：{overlap}')
+        if recurring and (timeout is not None or deadline is not None):
+            raise ValueError('周期任务不支持超时')
+        task = _Task(target, *args, **kwargs)
+        if task_id is not None:
+            task.id = task_id
+        task.schedule = schedule
+        task.executor = executor
+        task.priority = priority
+        task.group = group
+        if recurring:
+            task.recurring = True
+            task.overlap = overlap
+            task.runs = deque(maxlen=RUN_HISTORY)
+            task._queued = deque()
+        task.timeout = timeout
+        task.deadline = deadline
+        if depends_on:
+            depends_on = self.__resolve_dependencies(depends_on)  # 先于登记，依赖不存在时不留下任务
+        self.__trace(task)
+        if bounded and self._max_queue_size:
+            admitted, result = self.__admit(task, runnable=not schedule and not depends_on)
+            if not admitted:
+                return result
+        else:
+            self._registry.add(task)
+        if self._journal is not None:
+            if task_id is None:
+                self.__journal_task(task, schedule, executor, priority, group, depends_on, recurring, overlap,
+                                    timeout, deadline)
+            if self._journal.get(task.id) is not None:
+                task.add_listener(self._journal_listener)
+        if deadline is not None:
+            self._watchdog.watch(task, time.monotonic() + (deadline - datetime.now()).total_seconds(), DEADLINE)
+        # try:
+        #     setattr(target, '__task', task)
+        # except:
+        #     pass
+        if depends_on:
+            self.__add_dependencies(task, depends_on)
+        if not task._waiting and not task.status:
+            self.__push(task)
+        if not self.working:
+            self.start()
+        return task
+
+    def __admit(self, task, runnable=True):
+        """
+        有界队列：登记任务，未结束的任务数已达上限时在调用方线程中按 policy 处理
+
+        :param task:
+        :param runnable: 任务没有执行计划与依赖，CALLER_RUNS 时可以由调用方立即执行，否则等待空位
+        :return: (是否已登记、可以入队, 未登记时 submit 的返回值)
+        """
+        while not self._registry.add(task, self._queue_limit()):
+            policy = self._policy
+            if callable(policy):
+                return False, policy(self, task._target, *task._args, **task._kwargs)
+            if policy == REJECT:
+                raise TaskRejectedError(f'任务队列已满：{self.max_workers} + {self._max_queue_size}')
+            if policy == CALLER_RUNS and runnable:
+                self.__run_in_caller(task)
+                return False, task
+            if policy != DISCARD_OLDEST or not self.__discard_oldest():
+                self._registry.wait_for_room(self._queue_limit)
+        return True, None
+
+    def __run_in_caller(self, task):
+        """
+        队列已满时在调用方线程中执行任务，不占用工作线程
+
+        :param task:
+        :return:
+        """
+        self._registry.add(task)
+        task._mark('dispatch')
+        task.run(self.__arm_timeout)
+        if task.executor == PROCESS and task._task_handler is not None:
+            task._task_handler.close()
+
+    def __discard_oldest(self):
+        """
+        取消分组队列中最早就绪的任务
+
+        :return: 是否取消了任务
+        """
+        with self._condition:
+            entries = [group.oldest() for group in self._groups.values()]
+        entries = [entry for entry in entries if entry is not None]
+        if not entries:
+            return False
+        task = min(entries, key=lambda entry: entry[1])[3]
+        logger.debug(f'任务队列已满，丢弃最早的任务：{task.id}')
+        return task.cancel()
+
+    def submit_many(self, target, iterable_of_args, chunksize=1, executor=THREAD, priority=0, group=DEFAULT_GROUP):
+        """
+        批量提交任务，每组参数执行一次 target(*args)。
+        控制器与 Future 在首次使用时创建，全部任务一次加锁入队，开销远小于逐个 submit
+
+        :param target: 任务目标
+        :param iterable_of_args: 参数元组的可迭代对象
+        :param chunksize: 每个任务依次执行的参数组数，大于 1 时任务返回值为列表
+        :param executor: 执行方式，THREAD 或 PROCESS
+        :param priority: 优先级
+        :param group: 所属分组
+        :return: TaskBatch
+        """
+        if executor not in (THREAD, PROCESS):
+            raise ValueError(f'未知的执行方式：{executor}')
+        if chunksize < 1:
+            raise ValueError('chunksize 必须大于 0')
+        batch_id = uuid.uuid4().hex[:12]
+        if chunksize == 1:
+            tasks = [_BatchTask(batch_id, i, target, tuple(args)) for i, args in enumerate(iterable_of_args)]
+        else:
+            tasks = []
+            iterator = iter(iterable_of_args)
+            while True:
+                chunk = [tuple(args) for args in itertools.islice(iterator, chunksize)]
+                if not chunk:
+                    break
+                tasks.append(_BatchTask(batch_id, len(tasks), _run_chunk, (target, chunk)))
+        for task in tasks:
+            task.executor = executor
+            task.priority = priority
+            task.group = group
+            self.__trace(task)
+        batch = TaskBatch(batch_id, tasks, chunksize)
+        if not self._max_queue_size:
+            self._registry.add_many(tasks)
+            self.__push_batch(tasks)
+            return batch
+        if self._policy == REJECT:  # 整批拒绝，不会只提交其中一部分
+            if self._registry.add_many(tasks, self._queue_limit(), partial=False) < len(tasks):
+                raise TaskRejectedError(f'任务队列已满：{self.max_workers} + {self._max_queue_size}')
+            self.__push_batch(tasks)
+            return batch
+        # 放得下的先入队，放不下的逐个按 policy 处理，BLOCK 时调用方边等待边提交
+        start = 0
+        while start < len(tasks):
+            count = self._registry.add_many(tasks[start:], self._queue_limit())
+            self.__push_batch(tasks[start:start + count])
+            start += count
+            if start < len(tasks):
+                task = tasks[start]
+                start += 1
+                admitted, _ = self.__admit(task)
+                if admitted:
+                    self.__push_batch((task,))
+                elif not task.status:  # 交给了可调用的 policy，批次中记为已取消
+                    task.cancel()
+        return batch
+
+    def __push_batch(self, tasks):
+        """
+        已登记的批量任务写入日志，并一次加锁放入分组队列
+
+        :param tasks:
+        :return:
+        """
+        if not tasks:
+            return
+        if self._journal is not None:
+            for task in tasks:
+                self.__journal_task(task, None, task.executor, task.priority, task.group, None)
+                if self._journal.get(task.id) is not None:
+                    task.add_listener(self._journal_listener)
+        with self._condition:
+            task_group = self.__get_group(tasks[0].group)
+            for task in tasks:
+                task_group.push(task, self._sequence())
+            self._condition.notify()
+        if not self.working:
+            self.start()
+
+    def spawn(self, target, *args, **kwargs):
+        """
+        在执行中的任务内派生子任务。
+        子任务放入当前线程的队列，父任务调用 join 或等待子任务的 result、exception 时由自己执行，空闲的工作线程也会窃取执行；
+        父任务结束前等待全部派生的子任务，出错或被终止时取消尚未开始的子任务。
+        递归分治不会因等待子任务而占满线程池。不在任务中调用时等同于 submit
+
+        :param target:
+        :return: 子任务
+        """
+        parent = _current_task.get()
+        if parent is None:
+            if _current_handler.get() is not None:
+                raise TaskError('只能在线程任务中派生子任务')
+            return self.submit(target, *args, **kwargs)
+        sub = _Task(target, *args, **kwargs)
+        sub.spawned = True
+        sub.priority = parent.priority
+        sub.group = parent.group
+        self.__trace(sub)
+        parent.add_sub(sub)
+        self._registry.add(sub)
+        _local_deque().append(sub)
+        self._task_executor.submit_idle(_steal)
+        return sub
+
+    def __push(self, task):
+        """
+        将任务放入分组队列，计划任务放入计划任务堆，并唤醒分发线程
+
+        :param task:
+        :return:
+        """
+        due = (task.next_fire or task._arm()).timestamp() if task.schedule else 0
+        with self._condition:
+            if due <= time.time():
+                self.__get_group(task.group).push(task, self._sequence())
+            else:
+                heapq.heappush(self._ready_heap, (due, self._sequence(), task))
+                if self._ready_heap[0][2] is not task:
+                    return
+            self._condition.notify()
+
+    def __resolve_dependencies(self, depends_on):
+        """
+        将依赖的任务ID换成任务
+
+        :param depends_on: 任务或任务ID
+        :return: 任务列表
+        """
+        deps = []
+        for dep in depends_on:
+            if not isinstance(dep, _Task):
+                dep_id, dep = dep, self._registry.get(dep)
+                if dep is None:
+                    raise TaskNotFoundError(dep_id)
+            deps.append(dep)
+        return deps
+
+    def __add_dependencies(self, task, deps):
+        """
+        登记任务依赖，依赖完成时由 __on_dependency_done 释放下游任务
+
+        :param task:
+        :param deps: 依赖的任务列表
+        :return:
+        """
+        failed = False
+        with self._condition:
+            task.depends_on = deps
+            for dep in deps:
+                if not dep.done():
+                    task._waiting += 1
+                    if dep.dependents:
+                        dep.dependents.append(task)
+                    else:
+                        dep.dependents = [task]
+                        dep.add_done_callback(self.__on_dependency_done)
+                elif dep.status != FINISHED:
+                    failed = True
+        if failed:
+            task.cancel()
+
+    def __on_dependency_done(self, dep):
+        """
+        依赖结束：完成则减少下游任务的等待数，归零即就绪；否则取消下游任务，并继续向下传播
+
+        :param dep:
+        :return:
+        """
+        ready, canceled = [], []
+        with self._condition:
+            for task in dep.dependents:
+                if task.status:
+                    continue
+                if dep.status == FINISHED:
+                    task._waiting -= 1
+                    if not task._waiting:
+                        ready.append(task)
+                else:
+                    canceled.append(task)
+        for task in ready:
+            self.__push(task)
+        for task in canceled:
+            logger.debug(f'依赖任务未完成（{dep.status}），取消任务：{task.id}')
+            task.cancel()
+
+    def critical_path(self, task_id):
+        """
+        计算任务所在依赖图的关键路径，即耗时之和最大的依赖链，未开始的任务耗时按 0 计
+
+        :param task_id: 依赖图中任一任务或任务ID
+        :return: (关键路径耗时秒数, 关键路径上的任务列表)
+        """
+        task = task_id if isinstance(task_id, _Task) else self._registry.get(task_id)
+        if task is None:
+            raise TaskNotFoundError(task_id)
+        with self._condition:
+            graph, stack = {task}, [task]
+            while stack:
+                current = stack.pop()
+                for t in itertools.chain(current.depends_on, current.dependents):
+                    if t not in graph:
+                        graph.add(t)
+                        stack.append(t)
+            # 按依赖关系拓扑排序，计算每个任务的最早完成时间
+            waiting = {t: len(t.depends_on) for t in graph}
+            order = [t for t, n in waiting.items() if not n]
+            for t in order:
+                for d in t.dependents:
+                    waiting[d] -= 1
+                    if not waiting[d]:
+                        order.append(d)
+        finish, previous = {}, {}
+        for t in order:
+            before = max(t.depends_on, key=finish.get, default=None)
+            cost = t.cost if t.begin_time else 0
+            finish[t] = (finish[before] if before else 0) + cost
+            previous[t] = before
+        end = max(finish, key=finish.get)
+        path = [end]
+        while previous[path[-1]]:
+            path.append(previous[path[-1]])
+        return finish[end], path[::-1]
+
+    def __get_group(self, name):
+        group = self._groups.get(name)
+        if group is None:
+            group = self._groups[name] = _TaskGroup(name)
+        return group
+
+    def __release(self, task):
+        """
+        任务结束，释放工作线程
+
+        :param task:
+        :return:
+        """
+        with self._condition:
+            if task.executor == PROCESS:
+                self._running_processes -= 1
+            else:
+                self._running -= 1
+            self._groups[task.group].running -= 1
+            for limiter in task._limiters:
+                limiter.release()
+            task._limiters = ()
+            self._condition.notify()
+
+    def pause_task(self, task_id, timeout=None):
+        """
+        暂停任务
+
+        :param task_id:
+        :param timeout:
+        :return:
+        """
+        task: _Task = self._registry.get(task_id)
         if task:
             task.pause(timeout)
         else:
@@ -348,7 +2073,7 @@ class __TaskService(object):
         :param task_id:
         :return:
         """
-        task: _Task = self._tasks.get(task_id)
+        task: _Task = self._registry.get(task_id)
         if task:
             task.resume()
         else:
@@ -362,7 +2087,7 @@ class __TaskService(object):
         :param reason:
         :return:
         """
-        task: _Task = self._tasks.get(task_id)
+        task: _Task = self._registry.get(task_id)
         if task:
             task.stop(reason)
         else:
@@ -375,7 +2100,7 @@ class __TaskService(object):
         :param task_id:
         :return:
         """
-        task: _Task = self._tasks.get(task_id)
+        task: _Task = self._registry.get(task_id)
         if task:
             task.cancel()
             task.stop()
@@ -383,26 +2108,302 @@ class __TaskService(object):
             raise TaskNotFoundError(task_id)
 
     def start(self):
-        def callback(f):
-            task_id = getattr(f, 'task_id')
-            self._tasks[task_id].status = FINISHED
+        def submit_run(task, planned):
+            """
+            提交周期任务的一次执行，没有可执行的则释放工作线程；提交失败的一次记为出错
+            """
+            while planned is not None:
+                try:
+                    if task.executor == PROCESS:
+                        future = self.__submit_process(_run_in_process, task.task_handler,
+                                                       task._target, task._args, task._kwargs)
+                        setattr(future, 'begin_time', datetime.now())
+                    else:
+                        future = self._task_executor.submit(task._run_once, planned)
+                except Exception as e:
+                    logger.error(f'任务提交失败：{task.id}, {e!r}')
+                    planned = self.__end_run(task, TaskRun(planned, None, None, FAILED, None, e))
+                    continue
+                task.future = future
+                setattr(future, 'task_id', task.id)
+                setattr(future, 'planned', planned)
+                future.add_done_callback(lambda f: callback(task, f))
+                return
+            self.__release(task)
+            self.has_unfinished_tasks()
+
+        def dispatch(task):
+            """
+            提交任务给执行器，提交失败的任务记为出错并释放工作线程，不影响分发线程
+            """
+            try:
+                if task.executor == PROCESS:  # 工作进程开始执行后才标记为执行中，见 __on_expired 的 START
+                    future = self.__submit_process(_run_in_process, task.task_handler,
+                                                   task._target, task._args, task._kwargs)
+                else:
+                    future = self._task_executor.submit(task.run, self.__arm_timeout)
+            except Exception as e:
+                logger.error(f'任务提交失败：{task.id}, {e!r}')
+                self.__release(task)
+                if task.executor == PROCESS:
+                    task.task_handler.close()
+                task._transition(FAILED, e)
+                return
+            task.future = future
+            setattr(future, 'task_id', task.id)
+            future.add_done_callback(lambda f: callback(task, f))
+            if task.executor == PROCESS:
+                self._watchdog.watch(task, time.monotonic() + _ProcessTaskHandler.poll_interval, START)
+
+        def callback(task, f):
+            planned = getattr(f, 'planned', None)
+            if planned is not None:
+                submit_run(task, self.__end_run(task, self.__run_of(task, f, planned)))
+                return
+            if task.executor == PROCESS:
+                with self._condition:  # 与看门狗检查是否已开始互斥，之后关闭控制器
+                    if task.status is None and not f.cancelled() and not isinstance(f.exception(), BrokenProcessPool):
+                        task.status = RUNNING  # 很快就结束了，看门狗尚未发现已开始
+                    task.task_handler.close()
+            try:
+                if f.cancelled():
+                    task.status = CANCELED
+                elif task.executor == PROCESS and task.status != TERMINATED:
+                    e = f.exception()
+                    if isinstance(e, BrokenProcessPool):
+                        pool = getattr(f, 'pool', None)
+                        if getattr(pool, 'killed', False):
+                            logger.warning(f'进程池被看门狗重建，任务重新排队：{task.id}')
+                            task.task_handler = None
+                            task.status = None
+                            self.__release(task)
+                            self.__push(task)
+                            return
+                        logger.error(f'工作进程意外退出，进程池下次使用时重建：{task.id}')
+                        self.__discard_pool(pool)
+                    if isinstance(e, TaskTerminatedError):
+                        task._transition(TERMINATED, e)
+                    elif e:
+                        logger.error(''.join(traceback.format_exception(type(e), e, e.__traceback__)))
+                        task._transition(FAILED, e)
+                    else:
+                        task._result = f.result()
+                        task.status = FINISHED
+            except Exception:
+                logger.error(traceback.format_exc())  # 不能因此泄漏工作线程名额
+            with self._condition:
+                abandoned = task._abandoned
+            if abandoned is not None:  # 名额已在超时时释放
+                abandoned.reclaim()
+            else:
+                self.__release(task)
             self.has_unfinished_tasks()
 
         @thread(name='任务池', daemon=self.daemon)
         def _work():
-            while self._working:
-                for task in self.__get_ready_tasks():
-                    future = self._task_executor.submit(task.run)
-                    task.future = future
-                    setattr(future, 'task_id', task.id)
-                    future.add_done_callback(callback)
-                time.sleep(1)
-
-        self._working = True
+            try:
+                while True:
+                    try:
+                        fired = None
+                        with self._condition:
+                            task = self.__next_ready_task()
+                            if task is not None and task.recurring:
+                                fired = self.__fire(task)
+                                if fired is None:
+                                    continue
+                        if task is None:
+                            break
+                        if fired is not None:
+                            submit_run(task, fired)
+                        else:
+                            dispatch(task)
+                    except Exception:
+                        logger.error(traceback.format_exc())  # 分发线程不能退出，否则之后的任务都不会执行
+            except BaseException:
+                with self._condition:
+                    self._dispatching = False
+                raise
+
+        with self._condition:
+            self._working = True
+            if self._dispatching:
+                self._condition.notify_all()
+                return
+            self._dispatching = True
         _work()
 
+    def __submit_process(self, fn, *args):
+        """
+        提交给进程池；进程池已因工作进程意外退出而损坏时，重建后再提交一次
+
+        :return: future，pool 属性为所用的进程池
+        """
+        pool = self.process_executor
+        try:
+            future = pool.submit(fn, *args)
+        except BrokenProcessPool:
+            logger.warning('进程池已损坏，重建')
+            self.__discard_pool(pool)
+            pool = self.process_executor
+            future = pool.submit(fn, *args)
+        setattr(future, 'pool', pool)
+        return future
+
+    def __discard_pool(self, pool):
+        """
+        丢弃已损坏的进程池，下次使用时重建
+
+        :param pool:
+        :return:
+        """
+        if pool is not None and self._process_executor is pool:
+            self._process_executor = None
+
+    def __arm_timeout(self, task):
+        """
+        任务开始执行时开始计算超时
+
+        :param task:
+        :return:
+        """
+        if task.timeout is not None:
+            self._watchdog.watch(task, time.monotonic() + task.timeout, STOP)
+
+    def __on_expired(self, task, phase):
+        """
+        看门狗回调：进程任务的工作进程开始执行时标记为执行中；
+        截止时间到时取消尚未开始的任务，截止时间到或超时时强行停止执行中的任务；
+        stop_grace 秒后仍未结束的，线程任务放弃其线程并释放名额，进程任务杀死工作进程
+
+        :param task:
+        :param phase: START、DEADLINE、STOP 或 KILL
+        :return:
+        """
+        if phase == START:
+            with self._condition:  # 与任务结束时的回调互斥，回调会关闭控制器
+                future = task.future
+                if task.status is not None or future is None or future.done():
+                    return
+                started = bool(task.task_handler.pid)
+                if started:
+                    task.status = RUNNING
+            if started:
+                self.__arm_timeout(task)
+            else:
+                self._watchdog.watch(task, time.monotonic() + _ProcessTaskHandler.poll_interval, START)
+            return
+        if phase in (DEADLINE, STOP):
+            if phase == DEADLINE and not task.status:
+                if task.cancel():
+                    logger.warning(f'任务到期仍未开始，取消：{task.id}')
+                else:  # 已交给执行器，即将开始，开始后再停止
+                    self._watchdog.watch(task, time.monotonic() + _ProcessTaskHandler.poll_interval, DEADLINE)
+                return
+            if task.status not in (RUNNING, PAUSED):
+                return
+            logger.warning(f'任务超时，强行停止：{task.id}')
+            task.task_handler.force_stop('timeout' if phase == STOP else 'deadline')
+            if task._transition(TERMINATED):
+                task._emit('on_terminated')
+            self._watchdog.watch(task, time.monotonic() + self.stop_grace, KILL)
+            return
+        future = task.future
+        if future is None or future.done():
+            return
+        if task.executor == PROCESS:
+            pid = task.task_handler.pid
+            if pid:
+                logger.warning(f'任务不响应终止，杀死工作进程：{task.id}, {pid}')
+                pool = getattr(future, 'pool', None)
+                setattr(pool, 'killed', True)  # 进程池已损坏，其中的其他任务重新排队
+                os.kill(pid, getattr(signal, 'SIGKILL', signal.SIGTERM))
+                self.__discard_pool(pool)
+        else:
+            with self._condition:  # 与任务结束时的回调互斥，避免重复释放名额
+                if future.done():
+                    return
+                logger.warning(f'任务不响应终止，放弃其线程：{task.id}')
+                task._abandoned = self._task_executor
+                task._abandoned.abandon()
+                self.__release(task)
+
+    def __fire(self, task):
+        """
+        周期任务到期：按执行计划重新排期，并按重叠策略决定本次是否执行；调用方需持有 self._condition
+
+        :param task:
+        :return: 本次的计划执行时间，跳过或排队时返回 None
+        """
+        planned = task.next_fire
+        if task._arm() is None or task.next_fire <= planned:  # 执行计划已结束
+            task.recurring = False
+        else:
+            heapq.heappush(self._ready_heap, (task.next_fire.timestamp(), self._sequence(), task))
+        if task._active and task.overlap != ALLOW:
+            if task.overlap == QUEUE:
+                task._queued.append(planned)
+            else:
+                logger.debug(f'上次执行尚未结束，跳过：{task.id}')
+                task.runs.append(TaskRun(planned, None, None, SKIPPED, None, None))
+            self.__release(task)
+            return None
+        task._active += 1
+        if task.status is None:
+            task.status = RUNNING
+        return planned
+
+    def __end_run(self, task, run):
+        """
+        周期任务一次执行结束：记入执行记录，没有执行中的了则回到等待状态，执行计划已结束则以本次结果结束
+
+        :param task:
+        :param run:
+        :return: 排队等待的下一次执行的计划时间，没有则为 None
+        """
+        with self._condition:
+            task._active -= 1
+            task.runs.append(run)
+            if task.status in DONE_STATUSES or run.status == TERMINATED:
+                task._queued.clear()
+                if not task._active and task.status not in DONE_STATUSES:
+                    task.status = TERMINATED
+            elif task._queued:
+                task._active += 1
+                return task._queued.popleft()
+            elif not task._active:
+                if task.recurring:
+                    if task.status == RUNNING:
+                        task.status = None
+                else:
+                    task._result = run.result
+                    task._transition(run.status, run.exception)
+            if task.executor == PROCESS and task.status in DONE_STATUSES and not task._active:
+                task.task_handler.close()
+        return None
+
+    @staticmethod
+    def __run_of(task, future, planned):
+        """
+        由周期任务一次执行的 future 得到执行记录
+
+        :return: TaskRun
+        """
+        if future.cancelled():
+            return TaskRun(planned, None, None, CANCELED, None, None)
+        if task.executor != PROCESS:
+            return future.result()
+        e = future.exception()
+        if isinstance(e, TaskTerminatedError):
+            return TaskRun(planned, future.begin_time, datetime.now(), TERMINATED, None, e)
+        if e:
+            logger.error(''.join(traceback.format_exception(type(e), e, e.__traceback__)))
+            return TaskRun(planned, future.begin_time, datetime.now(), FAILED, None, e)
+        return TaskRun(planned, future.begin_time, datetime.now(), FINISHED, future.result(), None)
+
     def stop(self):
-        self._working = False
+        with self._condition:
+            self._working = False
+            self._condition.notify_all()
 
     def stop_self(self):
         """
@@ -423,7 +2424,7 @@ class __TaskService(object):
                 self._event.clear()
                 self._event.wait(self.service.stop_self_timeout)
                 if not self.service.has_unfinished_tasks():
-                    self.service._working = False
+                    self.service.stop()
                 self.service._stopping_self = False
 
             def resume(self):
@@ -435,24 +2436,192 @@ class __TaskService(object):
             self._self_stop_thread = _StopSelfThread(self)
             self._self_stop_thread.start()
 
-    def __get_ready_tasks(self):
-        task_items = list(self._tasks.values())
-        for task in task_items:
-            if task.ready and not task.status:
-                yield task
+    def __next_ready_task(self):
+        """
+        取出下一个到期的任务，没有则在条件变量上等待，直到有新任务提交或堆顶任务到期；
+        调用方需持有 self._condition，服务停止时返回 None
+
+        :return:
+        """
+        while self._working:
+            now = time.time()
+            while self._ready_heap and self._ready_heap[0][0] <= now:
+                _, sequence, task = heapq.heappop(self._ready_heap)
+                if task.status not in DONE_STATUSES:  # 已取消的不再排队
+                    self.__get_group(task.group).push(task, sequence)
+            self._throttle_wait = None
+            executors = [executor for executor, running, limit in (
+                (THREAD, self._running, self.max_workers),
+                (PROCESS, self._running_processes, self.max_processes)) if running < limit]
+            if executors:
+                task = self.__pick_task(executors)
+                if task:
+                    if task.executor == PROCESS:
+                        self._running_processes += 1
+                    else:
+                        self._running += 1
+                    return task
+            timeout = self._ready_heap[0][0] - now if self._ready_heap else None
+            if self._throttle_wait is not None:
+                timeout = self._throttle_wait if timeout is None else min(timeout, self._throttle_wait)
+            self._condition.wait(timeout)
+        self._dispatching = False
+        return None
+
+    def __pick_task(self, executors):
+        """
+        选择下一个分发的任务：
+        0. 只看尚有名额的执行方式，被限流的分组跳过，记下最早可以分发的等待秒数；
+        1. 未达到保证线程数的分组优先，按已占比例从低到高；
+        2. 否则取最高优先级，同优先级的分组间按虚拟时间（加权公平队列）选择
+
+        :param executors: 尚有名额的执行方式
+        :return:
+        """
+        candidates = {}
+        now = time.monotonic()
+        for group in self._groups.values():
+            head = group.head(executors)
+            if head is None:
+                continue
+            if group.limiters:
+                delay = group.delay(now, head[3])
+                if delay != 0:
+                    if delay is not None:
+                        self._throttle_wait = delay if self._throttle_wait is None else min(self._throttle_wait, delay)
+                    continue
+            candidates[group] = head
+        if not candidates:
+            return None
+        starved = [group for group in candidates if group.running < group.min_share]
+        if starved:
+            group = min(starved, key=lambda g: g.running / g.min_share)
+        else:
+            top = min(head[0] for head in candidates.values())
+            group = min((g for g, head in candidates.items() if head[0] == top),
+                        key=lambda g: max(g.vtime, self._vclock))
+        self._vclock = max(group.vtime, self._vclock)
+        return group.pop(self._vclock, candidates[group][3].executor)
 
     def has_unfinished_tasks(self):
-        for task_id, task in self._tasks.items():
-            if task.status != FINISHED:
-                return True
+        if self._registry.unfinished:
+            return True
         self.stop_self()
         return False
 
 
+class TaskEventBus(object):
+    """
+    任务事件总线：生命周期事件进入队列，由独立线程成批投递给异步监听器，慢监听器不再拖住工作线程和分发线程。
+
+    * 单线程按入队顺序投递，同一任务的事件保持顺序；
+    * 队列长度达到 max_size 时按 policy 阻塞发布方（BLOCK）或丢弃新事件（DROP），max_size 为 0 表示不限；
+    * 监听器抛出的异常只记录日志，不影响其他监听器
+    """
+
+    def __init__(self, max_size=100000, policy=BLOCK, batch_size=1000):
+        self.max_size = max_size
+        self.policy = policy
+        self.batch_size = batch_size
+        self.published = 0
+        self.delivered = 0
+        self.dropped = 0
+        self.batches = 0
+        self._events = deque()  # (任务, 方法名, args, kwargs, 监听器)
+        self._lock = threading.Lock()
+        self._not_empty = threading.Condition(self._lock)
+        self._not_full = threading.Condition(self._lock)  # 也用于等待投递完成
+        self._thread = None
+
+    def configure(self, max_size=100000, policy=BLOCK, batch_size=1000):
+        """
+        配置事件总线
+
+        :param max_size: 队列长度上限，0 表示不限
+        :param policy: 队列已满时的处理策略，BLOCK 或 DROP
+        :param batch_size: 每批最多投递的事件数
+        :return:
+        """
+        if policy not in (BLOCK, DROP):
+            raise ValueError(f'未知的队列策略：{policy}')
+        with self._lock:
+            self.max_size = max_size
+            self.policy = policy
+            self.batch_size = batch_size
+            self._not_full.notify_all()
+
+    def publish(self, task, method, args, kwargs, listeners):
+        """
+        发布事件
+
+        :return: 是否入队，DROP 策略下队列已满时返回 False
+        """
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._loop, name='任务事件总线', daemon=True)
+                self._thread.start()
+            # 监听器中触发的事件不能阻塞，否则投递线程会等待自己
+            if self.max_size and len(self._events) >= self.max_size and threading.current_thread() is not self._thread:
+                if self.policy == DROP:
+                    self.dropped += 1
+                    return False
+                while self.max_size and len(self._events) >= self.max_size:
+                    self._not_full.wait()
+            self._events.append((task, method, args, kwargs, listeners))
+            self.published += 1
+            self._not_empty.notify()
+        return True
+
+    def _loop(self):
+        while True:
+            with self._lock:
+                while not self._events:
+                    self._not_empty.wait()
+                events = self._events
+                if len(events) <= self.batch_size:
+                    self._events = deque()
+                else:
+                    events = [events.popleft() for _ in range(self.batch_size)]
+                self._not_full.notify_all()
+            for task, method, args, kwargs, listeners in events:
+                for listener in listeners:
+                    handler = getattr(listener, method, None)
+                    if handler is None:
+                        continue
+                    try:
+                        handler(task, *args, **kwargs)
+                    except Exception:
+                        logger.error(traceback.format_exc())
+            with self._lock:
+                self.delivered += len(events)
+                self.batches += 1
+                self._not_full.notify_all()
+
+    def flush(self, timeout=None):
+        """
+        等待已发布的事件投递完毕，不能在异步监听器中调用
+
+        :param timeout:
+        :return: 是否投递完毕
+        """
+        with self._lock:
+            target = self.published
+            return self._not_full.wait_for(lambda: self.delivered >= target, timeout)
+
+    @property
+    def stats(self):
+        return dict(depth=len(self._events),
+                    published=self.published,
+                    delivered=self.delivered,
+                    dropped=self.dropped,
+                    batches=self.batches)
+
+
 class TaskListener:
     """
-    任务监听器
+    任务监听器，默认由事件总线异步投递；synchronous 为 True 时在触发事件的线程中同步调用
     """
+    synchronous = False
 
     def on_start(self, task, *args, **kwargs):
         pass
@@ -479,6 +2648,259 @@ class TaskListener:
         pass
 
 
+class TaskTracer(TaskListener):
+    """
+    任务追踪器，任务结束时将其生命周期以 Chrome trace 格式流式写入文件：
+
+    * 执行区间写在执行线程的轨道上，暂停区间嵌套其中；
+    * 从提交到结束的整个过程写成异步区间，以根任务ID归组，子任务嵌套在父任务之下；
+    * 排队区间（提交到分发）同样嵌套在任务的异步区间中
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'w', encoding='utf-8')
+        self._file.write('{"traceEvents": [\n')
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        self._threads = set()
+
+    def on_status_changed(self, task, status, *args, **kwargs):
+        if status in DONE_STATUSES:
+            self.write(task)
+
+    def write(self, task):
+        """
+        写入任务的追踪事件
+
+        :param task:
+        :return:
+        """
+        events = self._build(task)
+        with self._lock:
+            if self._file.closed:
+                return
+            for event in events:
+                self._file.write(json.dumps(event, ensure_ascii=False))
+                self._file.write(',\n')
+            self._file.flush()
+
+    def _build(self, task):
+        root = task
+        while root.parent:
+            root = root.parent
+        name = getattr(task._target, '__qualname__', None) or repr(task._target)
+        marks = {}
+        pauses = []
+        tid = None
+        for event, ts, thread_id in task.events:
+            ts //= 1000  # 微秒
+            if event == 'start':
+                tid = thread_id
+            elif event == 'pause':
+                pauses.append([ts, None])
+            elif event == 'resume' and pauses:
+                pauses[-1][1] = ts
+            marks[event] = ts
+        finish = marks.get('finish', 0)
+        start = marks.get('start')
+        submit = marks.get('submit', start or finish)
+        common = dict(cat='task', pid=self._pid)
+        args = dict(id=str(task.id), status=task.status, group=task.group)
+        async_id = str(root.id)
+        events = [dict(common, name=name, ph='b', id=async_id, ts=submit, args=args),
+                  dict(common, name='queued', ph='b', id=async_id, ts=submit),
+                  dict(common, name='queued', ph='e', id=async_id, ts=marks.get('dispatch', start or finish)),
+                  dict(common, name=name, ph='e', id=async_id, ts=finish)]
+        if tid is not None:
+            if tid not in self._threads:
+                self._threads.add(tid)
+                thread_name = next((t.name for t in threading.enumerate() if t.ident == tid), str(tid))
+                events.append(dict(name='thread_name', ph='M', pid=self._pid, tid=tid, args=dict(name=thread_name)))
+            events.append(dict(common, name=name, ph='X', tid=tid, ts=start, dur=finish - start, args=args))
+            for begin, end in pauses:
+                events.append(dict(common, name='paused', ph='X', tid=tid, ts=begin, dur=(end or finish) - begin))
+        return events
+
+    def close(self):
+        """
+        补全 JSON 并关闭文件
+
+        :return:
+        """
+        with self._lock:
+            if self._file.closed:
+                return
+            self._file.write(json.dumps(dict(name='process_name', ph='M', pid=self._pid, args=dict(name='nobody.task'))))
+            self._file.write('\n], "displayTimeUnit": "ms"}\n')
+            self._file.close()
+
+
+class _TaskJournalListener(TaskListener):
+    """
+    将任务状态变化写入任务日志，任务结束即删除其记录
+    """
+    synchronous = True  # 日志须与状态同步落盘
+
+    def __init__(self, journal):
+        self.journal = journal
+
+    def on_status_changed(self, task, status, *args, **kwargs):
+        if self.journal.closed:
+            return
+        if status in DONE_STATUSES:
+            self.journal.delete(task.id)
+        else:
+            self.journal.update(task.id, status=status)
+
+
+class _TaskRegistry(TaskListener):
+    """
+    任务登记簿，按状态索引任务并实时计数，已结束的任务按保留策略移除
+
+    作为监听器挂在每个任务上，状态变化时更新索引
+    """
+    synchronous = True  # 计数须实时
+
+    def __init__(self, keep_last=None, keep_for=None, on_evict=None):
+        self._lock = threading.RLock()
+        self._room = threading.Condition(self._lock)  # 有任务结束时通知，见 wait_for_room
+        self._statuses = {}  # 任务ID -> 状态
+        self._index: Dict[Optional[str], Dict[str, _Task]] = {}  # 状态 -> {任务ID: 任务}
+        self._done = deque()  # 已结束的任务：(结束时间, 任务ID)
+        self._done_count = 0
+        self.keep_last = keep_last
+        self.keep_for = keep_for
+        self.on_evict = on_evict
+
+    def __len__(self):
+        return len(self._statuses)
+
+    def __contains__(self, task_id):
+        return task_id in self._statuses
+
+    @property
+    def unfinished(self):
+        """
+        未结束的任务数
+
+        :return:
+        """
+        return len(self._statuses) - self._done_count
+
+    def set_retention(self, keep_last=None, keep_for=None, on_evict=None):
+        with self._lock:
+            self.keep_last = keep_last
+            self.keep_for = keep_for
+            self.on_evict = on_evict
+            self.evict()
+
+    def add(self, task, limit=None):
+        return self.add_many((task,), limit) == 1
+
+    def add_many(self, tasks, limit=None, partial=True):
+        """
+        登记任务
+
+        :param tasks:
+        :param limit: 未结束的任务数上限，None 表示不限
+        :param partial: 放不下全部任务时是否登记放得下的前若干个，否则一个也不登记
+        :return: 登记的任务数
+        """
+        with self._lock:
+            if limit is not None:
+                room = max(0, limit - self.unfinished)
+                if room < len(tasks):
+                    tasks = tasks[:room] if partial else ()
+            for task in tasks:
+                self._statuses[task.id] = task.status
+                self._index.setdefault(task.status, {})[task.id] = task
+                if task.status in DONE_STATUSES:
+                    self._done_count += 1
+                    self._done.append((time.monotonic(), task.id))
+        for task in tasks:
+            task.add_listener(self)
+        self.evict()
+        return len(tasks)
+
+    def wait_for_room(self, limit):
+        """
+        等待未结束的任务数低于上限
+
+        :param limit: 返回当前上限的函数，上限为 None 表示不限，上限改变后需调用 notify_room
+        :return:
+        """
+        with self._room:
+            while True:
+                current = limit()
+                if current is None or self.unfinished < current:
+                    return
+                self._room.wait()
+
+    def notify_room(self):
+        with self._room:
+            self._room.notify_all()
+
+    def get(self, task_id):
+        with self._lock:  # 状态与索引须一致，否则状态变化时会找不到任务
+            status = self._statuses.get(task_id, self)
+            if status is self:
+                return None
+            return self._index[status].get(task_id)
+
+    def ids(self):
+        return self._statuses.keys()
+
+    def get_tasks(self, status=None):
+        with self._lock:
+            return list(self._index.get(status, {}).values())
+
+    def count(self, status=None):
+        return len(self._index.get(status, ()))
+
+    def on_status_changed(self, task, status, *args, **kwargs):
+        with self._lock:
+            old = self._statuses.get(task.id, self)
+            if old is self or old == status:
+                return
+            self._index[old].pop(task.id, None)
+            self._index.setdefault(status, {})[task.id] = task
+            self._statuses[task.id] = status
+            if (old in DONE_STATUSES) == (status in DONE_STATUSES):
+                return
+            if status in DONE_STATUSES:
+                self._done_count += 1
+                self._done.append((time.monotonic(), task.id))
+                self._room.notify_all()
+            else:
+                self._done_count -= 1
+        if status in DONE_STATUSES:
+            self.evict()
+
+    def evict(self):
+        """
+        按保留策略移除已结束的任务
+
+        :return:
+        """
+        evicted = []
+        with self._lock:
+            deadline = time.monotonic() - self.keep_for if self.keep_for is not None else None
+            while self._done and (
+                    (self.keep_last is not None and len(self._done) > self.keep_last)
+                    or (deadline is not None and self._done[0][0] <= deadline)):
+                _, task_id = self._done.popleft()
+                status = self._statuses.get(task_id)
+                if status not in DONE_STATUSES:  # 已移除，或重新进入执行状态
+                    continue
+                del self._statuses[task_id]
+                evicted.append(self._index[status].pop(task_id))
+                self._done_count -= 1
+        if self.on_evict:
+            for task in evicted:
+                self.on_evict(task)
+
+
 class TaskError(Exception):
     """
     任务异常
@@ -503,4 +2925,11 @@ class TaskNotFoundError(TaskError):
     """
 
 
+class TaskRejectedError(TaskError):
+    """
+    任务池已满，任务被拒绝
+    """
+
+
+event_bus = TaskEventBus()
 task_service = __TaskService()
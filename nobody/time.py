@@ -7,8 +7,17 @@
 @Desc: 改写自 https://github.com/dbader/schedule
 原Schedule必须对一个可执行对象封装，这里不关心执行什么，只提供时间上的计划
 """
+from collections import namedtuple
 from datetime import datetime, timedelta
 
+from nobody.cron import parse
+
+WEEKDAYS = ('monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday')
+_US = timedelta(microseconds=1)
+
+# 多个执行计划合并后的时间线：times 为升序的执行时间，owners 为对应的执行计划下标，slots 为各时段的起点，load 为各时段的执行次数
+Timeline = namedtuple('Timeline', ('times', 'owners', 'slots', 'load'))
+
 
 # region Schedule
 
@@ -25,6 +34,7 @@ class Schedule:
         self.period = None  # timedelta between runs, only valid for
         self.start_day = None
         self._relative = None  # 计算下次时间的相对值
+        self.crontab = None  # cron 表达式，设置后忽略 every 与 at
 
     def __lt__(self, other):
         return self.next_run < other.next_run
@@ -33,6 +43,8 @@ class Schedule:
         def format_time(t):
             return t.strftime('%Y-%m-%d %H:%M:%S') if t else '[never]'
 
+        if self.crontab is not None:
+            return 'Cron %s' % self.crontab.expression
         if self.at_time is not None:
             return 'Every %s %s at %s' % (
                 self.interval,
@@ -119,6 +131,16 @@ class Schedule:
         self.at_time = dict(year=year, month=month, day=day, hour=hour, minute=minute, second=second, microsecond=0)
         return self
 
+    def cron(self, expression):
+        """
+        按 cron 表达式计划，如 '*/5 9-17 * * 1-5'，见 nobody.cron
+
+        :param expression:
+        :return:
+        """
+        self.crontab = parse(expression)
+        return self
+
     def begin_at(self, *args, **kwargs):
         if args and isinstance(args[0], datetime):
             self._relative = args[0]
@@ -135,6 +157,8 @@ class Schedule:
         Compute the instant when this job should run next.
 
         """
+        if self.crontab is not None:
+            return self.crontab.next_fire(self._relative or datetime.now())
         if self.unit and self.interval:
             self.period = timedelta(**{self.unit: self.interval})
             if not self._relative:
@@ -169,12 +193,41 @@ class Schedule:
 
     def get_during(self, start, end):
         """
-        获取起止日期范围内的日程时间
+        获取起止日期范围内的日程时间，不改变执行计划的状态。
+        用 numpy datetime64 一次生成等差数列，再按 at 与星期几筛选，不逐次调用 __next__；
+        at 只固定比单位小的字段时（如每天 at 9 点），结果与从当前状态逐次 next 得到的时间相同
 
-        :param start:
-        :param end:
-        :return:
+        :param start: 起始时间（含）
+        :param end: 结束时间（不含）
+        :return: datetime64[us] 数组，升序；tolist() 可转为 datetime 列表
         """
+        import numpy as np  # 只有展开执行计划时才需要，不拖慢 nobody.task 等模块的导入
+
+        if self.crontab is not None:
+            return _cron_during(self.crontab, start, end)
+        relative = self._relative
+        try:
+            first = self.next_run  # 未设置 begin_at 时 next_run 以当前时间为起点
+        finally:
+            self._relative = relative
+        first = np.datetime64(first, 'us')
+        start, end = np.datetime64(start, 'us'), np.datetime64(end, 'us')
+        if not (self.unit and self.interval):  # 只执行一次
+            return np.array([first] if start <= first < end else [], dtype='datetime64[us]')
+        period = np.timedelta64(self.period // _US, 'us')
+        low = max(0, -((first - start) // period))  # 不早于 start 的第一项
+        high = max(low, -((first - end) // period))
+        times = first + np.arange(low, high, dtype=np.int64) * period
+        if self.at_time is not None:
+            fields = _fields(times)
+            keep = np.ones(len(times), dtype=bool)
+            for name, value in self.at_time.items():
+                if value is not None and name in fields:
+                    keep &= fields[name] == value
+            times = times[keep]
+        if self.start_day is not None:
+            times = times[_fields(times)['weekday'] == WEEKDAYS.index(self.start_day)]
+        return times
 
     def __next__(self):
         next_run = self.next_run
@@ -182,6 +235,86 @@ class Schedule:
         return next_run
 
 
+def _fields(times):
+    """
+    datetime64 数组的各日期时间字段，星期一为 0
+
+    :param times:
+    :return:
+    """
+    import numpy as np
+
+    days = times.astype('datetime64[D]')
+    months = times.astype('datetime64[M]')
+    seconds = (times - days) // np.timedelta64(1, 's')
+    return dict(year=months.astype(np.int64) // 12 + 1970,
+                month=months.astype(np.int64) % 12 + 1,
+                day=(days - months).astype(np.int64) + 1,
+                hour=seconds // 3600,
+                minute=seconds // 60 % 60,
+                second=seconds % 60,
+                microsecond=(times - times.astype('datetime64[s]')).astype(np.int64),
+                weekday=(days.astype(np.int64) + 3) % 7)
+
+
+def _bits(bits, low, high):
+    import numpy as np
+
+    return np.array([value for value in range(low, high + 1) if bits >> value & 1], dtype=np.int64)
+
+
+def _cron_during(crontab, start, end):
+    """
+    cron 表达式在起止时间内的执行时间：先按月、日、周筛出日期，再与一天内允许的时分秒组合
+
+    :param crontab: nobody.cron.Cron
+    :param start:
+    :param end:
+    :return:
+    """
+    import numpy as np
+
+    start, end = np.datetime64(start, 'us'), np.datetime64(end, 'us')
+    if start >= end:
+        return np.array([], dtype='datetime64[us]')
+    days = np.arange(start.astype('datetime64[D]'), end.astype('datetime64[D]') + 1)
+    fields = _fields(days.astype('datetime64[us]'))
+    day_ok = crontab.days >> fields['day'] & 1
+    weekday_ok = crontab.weekdays >> (fields['weekday'] + 1) % 7 & 1  # cron 中周日为 0
+    day_ok = day_ok | weekday_ok if crontab.day_or else day_ok & weekday_ok
+    days = days[(crontab.months >> fields['month'] & 1 & day_ok).astype(bool)]
+    offsets = (_bits(crontab.hours, 0, 23)[:, None, None] * 3600
+               + _bits(crontab.minutes, 0, 59)[None, :, None] * 60
+               + _bits(crontab.seconds, 0, 59)[None, None, :]).ravel()
+    times = (days.astype('datetime64[s]')[:, None] + offsets.astype('timedelta64[s]')).ravel().astype('datetime64[us]')
+    return times[(times >= start) & (times < end)]
+
+
+def timeline(schedules, start, end, slot=timedelta(hours=1)):
+    """
+    将多个执行计划在起止时间内的执行时间合并为一条时间线，并统计每个时段的执行次数，用于容量规划与冲突检查
+
+    :param schedules: 执行计划列表
+    :param start: 起始时间（含）
+    :param end: 结束时间（不含）
+    :param slot: 时段长度
+    :return: Timeline
+    """
+    import numpy as np
+
+    expansions = [schedule.get_during(start, end) for schedule in schedules]
+    times = np.concatenate(expansions) if expansions else np.array([], dtype='datetime64[us]')
+    owners = np.repeat(np.arange(len(expansions)), [len(e) for e in expansions])
+    order = np.argsort(times, kind='stable')
+    times, owners = times[order], owners[order]
+    begin = np.datetime64(start, 'us')
+    width = np.timedelta64(slot // _US, 'us')
+    count = max(0, -((begin - np.datetime64(end, 'us')) // width))
+    slots = begin + np.arange(count, dtype=np.int64) * width
+    load = np.bincount(((times - begin) // width).astype(np.int64), minlength=count)
+    return Timeline(times, owners, slots, load)
+
+
 class ScheduleError(Exception):
     """Base schedule exception"""
 
@@ -194,6 +327,10 @@ def every(interval):
     return Schedule().every(interval)
 
 
+def cron(expression):
+    return Schedule().cron(expression)
+
+
 def at_time(*args, **kwargs):
     if args and isinstance(args[0], datetime):
         return Schedule().at(args[0])
@@ -0,0 +1,38 @@
+# coding=utf-8
+
+"""
+@Author: LiangChao
+@Email: nobody_team@outlook.com
+@File: conftest
+@Created: 2026/10/18
+@Desc: 测试公共工具
+"""
+import time
+
+import pytest
+
+from nobody.task import task_service, RUNNING, PAUSED
+
+
+def wait_until(predicate, timeout=5):
+    """
+    轮询等待条件成立，超时则断言失败
+
+    :param predicate: 无参可调用对象
+    :param timeout: 超时秒数
+    :return:
+    """
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, '等待超时'
+        time.sleep(0.01)
+
+
+@pytest.fixture
+def service():
+    """
+    task_service，测试结束后等待任务全部结束并恢复默认配置
+    """
+    yield task_service
+    wait_until(lambda: not any(task_service.count(status) for status in (None, RUNNING, PAUSED)))
+    task_service.configure()
@@ -0,0 +1,40 @@
+# coding=utf-8
+
+"""
+@Author: LiangChao
+@Email: nobody_team@outlook.com
+@File: test_atask
+@Created: 2026/10/18
+@Desc: async_task_service 回归测试
+"""
+import asyncio
+
+import pytest
+
+from nobody.atask import async_task_service
+from nobody.task import TaskTerminatedError, RUNNING, TERMINATED, CANCELED
+from tests.conftest import wait_until
+
+
+class TestStop:
+    def test_stop_terminates_running_tasks(self):
+        running = async_task_service.submit(asyncio.sleep, 60)
+        wait_until(lambda: running.status == RUNNING)
+        paused = async_task_service.submit(asyncio.sleep, 60)
+        wait_until(lambda: paused.status == RUNNING)
+        paused.pause()
+        async_task_service.stop()
+        assert running.status == TERMINATED
+        assert paused.status == TERMINATED
+        with pytest.raises(TaskTerminatedError):
+            running.result(1)
+        with pytest.raises(TaskTerminatedError):
+            paused.result(1)
+        assert async_task_service.count(RUNNING) == 0
+
+    def test_stop_cancels_scheduled_tasks(self):
+        from nobody.time import Schedule
+        task = async_task_service.submit(asyncio.sleep, 0, task_schedule=Schedule().every(60).seconds)
+        wait_until(lambda: task.future is not None)
+        async_task_service.stop()
+        assert task.status == CANCELED
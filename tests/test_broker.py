@@ -0,0 +1,96 @@
+# coding=utf-8
+
+"""
+@Author: LiangChao
+@Email: nobody_team@outlook.com
+@File: test_broker
+@Created: 2026/10/18
+@Desc: 任务代理回归测试
+"""
+import socket
+import threading
+import time
+from multiprocessing import AuthenticationError
+
+import pytest
+
+from nobody.broker import Broker, BrokerWorker, serve, connect
+from nobody.task import RUNNING, FAILED
+
+
+def echo_kwargs(**kwargs):
+    return kwargs
+
+
+@pytest.fixture
+def broker(tmp_path):
+    return Broker(str(tmp_path / 'tasks.db'), lease_time=1)
+
+
+class TestLease:
+    def test_expired_lease_is_requeued(self, broker):
+        task_ids = [broker.submit(time.sleep, 0) for _ in range(2)]
+        assert len(broker.lease('dead', 2)) == 2
+        assert broker.reclaim() == 0
+        time.sleep(1.2)
+        assert broker.reclaim() == 2
+        assert [broker.status(task_id) for task_id in task_ids] == [None, None]
+
+    def test_renew_only_given_tasks(self, broker):
+        kept, orphaned = broker.submit(time.sleep, 0), broker.submit(time.sleep, 0)
+        broker.lease('worker', 2)
+        for _ in range(3):
+            time.sleep(0.5)
+            assert broker.renew('worker', [kept]) == [kept]
+        assert broker.reclaim() == 1
+        assert broker.status(kept) == RUNNING
+        assert broker.status(orphaned) is None
+
+
+class TestWorker:
+    def test_payload_kwargs_reach_target(self, broker):
+        worker = BrokerWorker(broker, max_workers=4, poll_interval=0.05)
+        worker.start()
+        try:
+            kwargs = dict(timeout=5, deadline=1, executor='x', group='g', schedule=None, depends_on=(), priority=3)
+            task_id = broker.submit(echo_kwargs, **kwargs)
+            assert broker.result(task_id, timeout=10, poll_interval=0.05) == kwargs
+        finally:
+            worker.stop()
+
+    def test_bad_payload_does_not_block_batch(self, broker):
+        good = broker.submit(echo_kwargs, value=1)
+        now = time.time()
+        broker._db().execute('INSERT INTO tasks (id, payload, priority, created, updated) VALUES (?, ?, ?, ?, ?)',
+                             ('bad', b'not a pickle', 1, now, now))
+        worker = BrokerWorker(broker, max_workers=4, poll_interval=0.05)
+        worker.start()
+        try:
+            assert broker.result(good, timeout=10, poll_interval=0.05) == dict(value=1)
+            assert broker.status('bad') == FAILED
+        finally:
+            worker.stop()
+
+
+class TestServe:
+    @pytest.mark.parametrize('authkey', [b'', None])
+    def test_refuses_empty_authkey(self, broker, authkey):
+        with pytest.raises(ValueError):
+            serve(broker, ('127.0.0.1', 0), authkey=authkey)
+
+    def test_authkey_is_checked(self, broker):
+        with socket.socket() as s:
+            s.bind(('127.0.0.1', 0))
+            address = s.getsockname()
+        threading.Thread(target=serve, args=(broker, address), kwargs=dict(authkey=b'secret'), daemon=True).start()
+        deadline = time.monotonic() + 5
+        while True:
+            try:
+                remote = connect(address, b'secret')
+                break
+            except ConnectionRefusedError:
+                assert time.monotonic() < deadline, '等待超时'
+                time.sleep(0.05)
+        assert remote.stats() == broker.stats()
+        with pytest.raises(AuthenticationError):
+            connect(address, b'wrong')
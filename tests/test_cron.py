@@ -0,0 +1,94 @@
+# coding=utf-8
+
+"""
+@Author: LiangChao
+@Email: nobody_team@outlook.com
+@File: test_cron
+@Created: 2026/10/18
+@Desc: cron 表达式测试：编译后的位集合与逐值解析的朴素实现对照
+"""
+import random
+from datetime import datetime, timedelta
+
+import pytest
+
+from benchmark.cron_next_fire import expressions
+from nobody.cron import Cron, CronError, MONTHS, WEEKDAYS, parse
+
+
+def _allows(text, value, low, high, names=None):
+    """
+    朴素实现：逐个逗号分隔的部分判断 value 是否被允许
+    """
+    for part in text.split(','):
+        body, _, step = part.partition('/')
+        step = int(step or 1)
+        if body in ('*', '?'):
+            start, stop = low, high
+        else:
+            bounds = [names.index(v.lower()) + low if names and v.lower() in names else int(v)
+                      for v in body.split('-')]
+            start, stop = bounds[0], bounds[-1] if len(bounds) > 1 or step == 1 else high
+        if start <= value <= stop and (value - start) % step == 0:
+            return True
+    return False
+
+
+def _matches(expression, moment):
+    fields = expression.split()
+    if len(fields) == 5:
+        fields.insert(0, '0')
+    second, minute, hour, day, month, weekday = fields
+    cron_weekday = (moment.weekday() + 1) % 7
+    day_ok = _allows(day, moment.day, 1, 31)
+    weekday_ok = (_allows(weekday, cron_weekday, 0, 7, WEEKDAYS)
+                  or cron_weekday == 0 and _allows(weekday, 7, 0, 7, WEEKDAYS))
+    if not day.startswith(('*', '?')) and not weekday.startswith(('*', '?')):
+        date_ok = day_ok or weekday_ok
+    else:
+        date_ok = day_ok and weekday_ok
+    return (_allows(second, moment.second, 0, 59) and _allows(minute, moment.minute, 0, 59)
+            and _allows(hour, moment.hour, 0, 23) and _allows(month, moment.month, 1, 12, MONTHS) and date_ok)
+
+
+def _scan(expression, after, limit=timedelta(days=400)):
+    moment = after.replace(second=0, microsecond=0) + timedelta(minutes=1)
+    while moment < after + limit:
+        if _matches(expression, moment):
+            return moment
+        moment += timedelta(minutes=1)
+    return None
+
+
+class TestCron:
+    @pytest.mark.parametrize('expression', expressions(200, seed=1) + [
+        '0 0 29 2 *', '*/15 9-17 * * mon-fri', '0 12 1,15 jan-mar *', '30 6 * * 7', '0 0 13 * fri', '@weekly'])
+    def test_match_agrees_with_naive(self, expression):
+        cron = Cron(expression)
+        text = {'@weekly': '0 0 * * 0'}.get(expression, expression)
+        rng = random.Random(expression)
+        for _ in range(300):
+            moment = datetime(2026, 1, 1) + timedelta(minutes=rng.randrange(60 * 24 * 366 * 2))
+            assert bool(cron.match(moment)) == _matches(text, moment), moment
+
+    @pytest.mark.parametrize('expression', expressions(30, seed=2) + ['0 0 29 2 *', '0 0 13 * fri'])
+    def test_next_fire_agrees_with_scan(self, expression):
+        after = datetime(2026, 10, 18, 12, 34, 56)
+        expected = _scan(expression, after, timedelta(days=2000 if '29 2' in expression else 400))
+        assert Cron(expression).next_fire(after) == expected
+
+    def test_seconds_field(self):
+        cron = Cron('*/20 * * * * *')
+        assert cron.next_fire(datetime(2026, 1, 1, 0, 0, 5)) == datetime(2026, 1, 1, 0, 0, 20)
+
+    def test_never_fires(self):
+        with pytest.raises(CronError):
+            Cron('0 0 30 2 *')
+
+    def test_parse_cache_is_bounded(self):
+        parse.cache_clear()
+        for minute in range(60):
+            for hour in range(10):
+                parse(f'{minute} {hour} * * *')
+        assert parse.cache_info().currsize <= 256
+        assert parse('0 0 * * *') is parse('0 0 * * *')
@@ -0,0 +1,104 @@
+# coding=utf-8
+
+"""
+@Author: LiangChao
+@Email: nobody_team@outlook.com
+@File: test_dag
+@Created: 2026/10/18
+@Desc: 任务依赖测试：依赖完成后释放、未完成时级联取消、关键路径
+"""
+import threading
+import time
+
+import pytest
+
+from nobody.task import task_service, TaskNotFoundError, FINISHED, CANCELED, FAILED
+from tests.conftest import wait_until
+
+pytestmark = pytest.mark.usefixtures('service')
+
+
+def fail():
+    raise ValueError('bad task')
+
+
+class TestRelease:
+    def test_waits_for_all_dependencies(self):
+        gate, order = threading.Event(), []
+        a = task_service.submit(lambda: (gate.wait(5), order.append('a')))
+        b = task_service.submit(order.append, 'b')
+        c = task_service.submit(order.append, 'c', task_depends_on=[a, b.id])  # 任务或任务ID均可
+        b.result(5)
+        time.sleep(0.1)
+        assert c.status is None
+        gate.set()
+        c.result(5)
+        assert order == ['b', 'a', 'c']
+
+    def test_finished_dependency(self):
+        a = task_service.submit(pow, 2, 3)
+        a.result(5)
+        assert task_service.submit(pow, 2, 4, task_depends_on=[a]).result(5) == 16
+
+    def test_unknown_dependency(self):
+        with pytest.raises(TaskNotFoundError):
+            task_service.submit(pow, 2, 4, task_depends_on=[-1])
+        assert not task_service.count(None)  # 依赖不存在时不留下待执行的任务
+
+
+class TestCascade:
+    def test_failure_cancels_downstream(self):
+        gate = threading.Event()
+        a = task_service.submit(lambda: (gate.wait(5), fail()))
+        b = task_service.submit(pow, 2, 1, task_depends_on=[a])
+        c = task_service.submit(pow, 2, 2, task_depends_on=[b])
+        d = task_service.submit(pow, 2, 3)
+        e = task_service.submit(pow, 2, 4, task_depends_on=[c, d])
+        gate.set()
+        wait_until(lambda: e.done())
+        assert a.status == FAILED
+        assert [t.status for t in (b, c, e)] == [CANCELED] * 3
+        assert d.status == FINISHED
+
+    def test_cancel_cancels_downstream(self):
+        a = task_service.submit(pow, 2, 1, task_depends_on=[task_service.submit(threading.Event().wait, 0.2)])
+        b = task_service.submit(pow, 2, 2, task_depends_on=[a])
+        assert a.cancel()
+        wait_until(lambda: b.done())
+        assert b.status == CANCELED
+
+    def test_failed_dependency_at_submit(self):
+        a = task_service.submit(fail)
+        wait_until(lambda: a.done())
+        b = task_service.submit(pow, 2, 1, task_depends_on=[a])
+        wait_until(lambda: b.done())
+        assert b.status == CANCELED
+
+
+class TestCriticalPath:
+    def test_longest_chain(self):
+        a = task_service.submit(time.sleep, 0.05)
+        b = task_service.submit(time.sleep, 0.3, task_depends_on=[a])
+        c = task_service.submit(time.sleep, 0.01, task_depends_on=[a])
+        d = task_service.submit(time.sleep, 0.05, task_depends_on=[b, c])
+        d.result(5)
+        cost, path = task_service.critical_path(c.id)
+        assert path == [a, b, d]
+        assert cost == pytest.approx(a.cost + b.cost + d.cost)
+        assert cost >= 0.4
+
+    def test_unstarted_tasks_cost_nothing(self):
+        gate = threading.Event()
+        a = task_service.submit(gate.wait, 5)
+        b = task_service.submit(pow, 2, 1, task_depends_on=[a])
+        wait_until(lambda: a.begin_time)
+        time.sleep(0.1)
+        cost, path = task_service.critical_path(b)
+        assert path[0] is a
+        assert b.begin_time is None and cost == pytest.approx(a.cost, abs=0.05)  # b 未开始，耗时按 0 计
+        gate.set()
+        b.result(5)
+
+    def test_unknown_task(self):
+        with pytest.raises(TaskNotFoundError):
+            task_service.critical_path(-1)
@@ -0,0 +1,156 @@
+# coding=utf-8
+
+"""
+@Author: LiangChao
+@Email: nobody_team@outlook.com
+@File: test_event_bus
+@Created: 2026/10/18
+@Desc: 事件总线测试：投递顺序、队列策略，以及异步监听器不拖住工作线程
+"""
+import threading
+import time
+
+import pytest
+
+from nobody.task import task_service, TaskEventBus, TaskListener, BLOCK, DROP, RUNNING, FINISHED
+from tests.conftest import wait_until
+
+pytestmark = pytest.mark.usefixtures('service')
+
+
+class _Recorder(TaskListener):
+    def __init__(self, delay=0, sync=False):
+        self.delay = delay
+        self.synchronous = sync
+        self.events = []
+        self.threads = set()
+
+    def on_status_changed(self, task, status, *args, **kwargs):
+        self.threads.add(threading.current_thread().name)
+        time.sleep(self.delay)
+        self.events.append((task.id, status))
+
+
+class _Gate:
+    """
+    第一个事件阻塞投递线程，直到 open 被设置
+    """
+
+    def __init__(self):
+        self.open = threading.Event()
+        self.entered = threading.Event()
+        self.events = []
+
+    def on_event(self, task, value):
+        self.entered.set()
+        self.open.wait(5)
+        self.events.append(value)
+
+
+class TestBus:
+    def test_delivery_order(self):
+        bus, received = TaskEventBus(batch_size=10), []
+
+        class Listener:
+            def on_event(self, task, value):
+                received.append(value)
+
+        listeners = (Listener(),)
+        for i in range(1000):
+            bus.publish(None, 'on_event', (i,), {}, listeners)
+        assert bus.flush(5)
+        assert received == list(range(1000))
+        assert bus.stats['delivered'] == 1000 and bus.stats['batches'] >= 100
+
+    def test_listener_error_is_isolated(self):
+        bus, received = TaskEventBus(), []
+
+        class Bad:
+            def on_event(self, task, value):
+                raise ValueError(value)
+
+        class Good:
+            def on_event(self, task, value):
+                received.append(value)
+
+        bus.publish(None, 'on_event', (1,), {}, (Bad(), Good()))
+        bus.publish(None, 'on_event', (2,), {}, (Good(), Bad()))
+        assert bus.flush(5)
+        assert received == [1, 2]
+
+    def test_drop_when_full(self):
+        bus, gate = TaskEventBus(max_size=2, policy=DROP), _Gate()
+        assert bus.publish(None, 'on_event', (0,), {}, (gate,))
+        assert gate.entered.wait(5)
+        assert bus.publish(None, 'on_event', (1,), {}, (gate,))
+        assert bus.publish(None, 'on_event', (2,), {}, (gate,))
+        assert not bus.publish(None, 'on_event', (3,), {}, (gate,))
+        gate.open.set()
+        assert bus.flush(5)
+        assert gate.events == [0, 1, 2] and bus.stats['dropped'] == 1
+
+    def test_block_when_full(self):
+        bus, gate = TaskEventBus(max_size=1, policy=BLOCK), _Gate()
+        bus.publish(None, 'on_event', (0,), {}, (gate,))
+        assert gate.entered.wait(5)
+        bus.publish(None, 'on_event', (1,), {}, (gate,))
+        publisher = threading.Thread(target=bus.publish, args=(None, 'on_event', (2,), {}, (gate,)))
+        publisher.start()
+        publisher.join(0.2)
+        assert publisher.is_alive()  # 队列已满，发布方等待
+        gate.open.set()
+        publisher.join(5)
+        assert bus.flush(5)
+        assert gate.events == [0, 1, 2] and bus.stats['dropped'] == 0
+
+    def test_publish_from_listener_does_not_block(self):
+        bus, received = TaskEventBus(max_size=1), []
+
+        class Chain:
+            def on_event(self, task, value):
+                received.append(value)
+                if value < 5:
+                    bus.publish(None, 'on_event', (value + 1,), {}, (self,))  # 队列已满也不能等待自己
+
+        bus.publish(None, 'on_event', (0,), {}, (Chain(),))
+        wait_until(lambda: len(received) == 6)
+        assert received == list(range(6))
+
+    def test_unknown_policy(self):
+        with pytest.raises(ValueError):
+            TaskEventBus().configure(policy='o')
+
+
+class TestListeners:
+    def test_async_listener_keeps_task_order(self):
+        recorder = _Recorder(delay=0.001)
+        tasks = [task_service.submit(pow, 2, i) for i in range(50)]
+        for task in tasks:
+            task.add_listener(recorder)
+        for task in tasks:
+            task.result(5)
+        wait_until(lambda: sum(status == FINISHED for _, status in recorder.events) == 50)
+        for task in tasks:
+            statuses = [status for task_id, status in recorder.events if task_id == task.id]
+            assert statuses.index(FINISHED) == len(statuses) - 1
+            assert statuses in ([RUNNING, FINISHED], [FINISHED])  # 添加监听器时可能已在执行
+        assert recorder.threads == {'任务事件总线'}
+
+    def test_slow_async_listener_does_not_block_task(self):
+        recorder, gate = _Recorder(delay=1), threading.Event()
+        task = task_service.submit(gate.wait, 5)
+        task.add_listener(recorder)
+        begin = time.monotonic()
+        gate.set()
+        task.result(5)
+        assert time.monotonic() - begin < 0.5
+        wait_until(lambda: (task.id, FINISHED) in recorder.events)
+
+    def test_sync_listener_runs_in_worker(self):
+        recorder, gate = _Recorder(sync=True), threading.Event()
+        task = task_service.submit(gate.wait, 5)
+        task.add_listener(recorder)
+        gate.set()
+        task.result(5)
+        assert recorder.events[-1] == (task.id, FINISHED)  # 同步监听器在 result 返回前已被调用
+        assert '任务事件总线' not in recorder.threads
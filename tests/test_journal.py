@@ -0,0 +1,116 @@
+# coding=utf-8
+
+"""
+@Author: LiangChao
+@Email: nobody_team@outlook.com
+@File: test_journal
+@Created: 2026/10/18
+@Desc: 任务日志测试：重放、截断、压缩幂等，以及 task_service 按日志恢复任务
+"""
+import os
+import subprocess
+import sys
+
+import pytest
+
+from nobody.journal import Journal, JournalError
+from nobody.task import CANCELED
+from tests.conftest import wait_until
+
+pytestmark = pytest.mark.usefixtures('service')
+
+
+def _write(path, **kwargs):
+    journal = Journal(path, **kwargs)
+    journal.set('a', {'status': None, 'n': 1})
+    journal.set('b', {'status': None})
+    journal.update('a', n=2)
+    journal.update('missing', n=3)  # 记录不存在，忽略
+    journal.set('c', {'status': None})
+    journal.delete('b')
+    journal.close()
+    return [('a', {'status': None, 'n': 2}), ('c', {'status': None})]
+
+
+class TestJournal:
+    def test_replay(self, tmp_path):
+        path = str(tmp_path / 'journal')
+        expected = _write(path)
+        journal = Journal(path)
+        assert journal.items() == expected
+        journal.close()
+
+    def test_closed(self, tmp_path):
+        journal = Journal(str(tmp_path / 'journal'))
+        journal.close()
+        with pytest.raises(JournalError):
+            journal.set('a', {})
+
+    def test_incomplete_tail_is_truncated(self, tmp_path):
+        path = tmp_path / 'journal'
+        expected = _write(str(path))
+        size = path.stat().st_size
+        with open(path, 'ab') as f:
+            f.write(b'["set", "d", {"sta')  # 崩溃时写了一半
+        journal = Journal(str(path))
+        assert journal.items() == expected
+        journal.close()
+        assert path.stat().st_size == size
+
+    def test_compact_is_idempotent(self, tmp_path):
+        path = tmp_path / 'journal'
+        expected = _write(str(path))
+        journal = Journal(str(path))
+        journal.compact()
+        compacted = path.read_bytes()
+        assert compacted.count(b'\n') == len(expected)
+        journal.compact()
+        assert path.read_bytes() == compacted
+        journal.close()
+        journal = Journal(str(path))
+        assert journal.items() == expected
+        journal.close()
+
+    def test_auto_compact(self, tmp_path):
+        path = tmp_path / 'journal'
+        journal = Journal(str(path), compact_threshold=50)
+        for i in range(200):
+            journal.set('k', {'n': i})
+        journal.flush()
+        journal.set('k', {'n': 200})
+        journal.close()
+        assert path.read_bytes().count(b'\n') < 100
+        journal = Journal(str(path))
+        assert journal.items() == [('k', {'n': 200})]
+        journal.close()
+
+
+class TestRecover:
+    def test_recover_after_crash(self, service, tmp_path):
+        path = str(tmp_path / 'journal')
+        code = (
+            'import os; from nobody.task import task_service; from nobody.time import every; '
+            f'task_service.enable_journal({path!r}, sync=True); '
+            'task = task_service.submit(pow, 2, 10, task_schedule=every(1).days, '
+            'task_priority=3); '
+            'print(task.id, flush=True); os._exit(0)'  # 任务执行前进程崩溃
+        )
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        output = subprocess.run([sys.executable, '-c', code], cwd=root, capture_output=True, text=True, check=True)
+        task_id = int(output.stdout.split()[-1])
+        try:
+            recovered = service.enable_journal(path, sync=True)
+            assert [task.id for task in recovered] == [task_id]
+            task = recovered[0]
+            assert task.priority == 3 and task.status is None
+            assert service.recover() == []  # 已在服务中的任务不重复恢复
+            other = service.submit(pow, 2, 0)
+            assert other.id != task_id
+            other.result(5)
+            task.cancel()
+            wait_until(lambda: task.status == CANCELED)
+        finally:
+            service.disable_journal()
+        journal = Journal(path)
+        assert journal.items() == []  # 结束的任务已从日志删除
+        journal.close()
@@ -0,0 +1,102 @@
+# coding=utf-8
+
+"""
+@Author: LiangChao
+@Email: nobody_team@outlook.com
+@File: test_recurring
+@Created: 2026/10/18
+@Desc: 周期任务测试：上次执行未结束时 SKIP、QUEUE、ALLOW 三种重叠策略
+"""
+import threading
+import time
+
+import pytest
+
+from nobody.task import task_service, checkpoint, SKIP, QUEUE, ALLOW, SKIPPED, FINISHED, RUNNING
+from nobody.time import every
+from tests.conftest import wait_until
+
+pytestmark = pytest.mark.usefixtures('service')
+
+
+class _Busy:
+    """
+    每次执行占用 seconds 秒，记录同时执行的最大数量
+    """
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self.lock = threading.Lock()
+        self.active = self.peak = self.calls = 0
+
+    def __call__(self):
+        with self.lock:
+            self.active += 1
+            self.calls += 1
+            self.peak = max(self.peak, self.active)
+        try:
+            end = time.monotonic() + self.seconds
+            while time.monotonic() < end:
+                checkpoint()
+                time.sleep(0.01)
+        finally:
+            with self.lock:
+                self.active -= 1
+
+
+def _recurring(busy, overlap):
+    return task_service.submit(busy, task_schedule=every(0.1).seconds, task_recurring=True, task_overlap=overlap)
+
+
+def _end(task):
+    """
+    结束周期任务：两次执行之间取消，执行中则终止
+    """
+    deadline = time.monotonic() + 5
+    while not task.done():
+        assert time.monotonic() < deadline, '等待超时'
+        if task.status == RUNNING:
+            try:
+                task.stop()
+            except AssertionError:  # 恰好回到等待状态
+                pass
+        else:
+            task.cancel()
+        time.sleep(0.01)
+
+
+class TestOverlap:
+    def test_skip(self):
+        busy = _Busy(0.35)
+        task = _recurring(busy, SKIP)
+        wait_until(lambda: sum(run.status == FINISHED for run in task.runs) >= 2)
+        _end(task)
+        assert busy.peak == 1
+        skipped = [run for run in task.runs if run.status == SKIPPED]
+        assert skipped and all(run.begin_time is None for run in skipped)
+        assert not task._queued
+
+    def test_queue(self):
+        busy = _Busy(0.25)
+        task = _recurring(busy, QUEUE)
+        wait_until(lambda: sum(run.status == FINISHED for run in task.runs) >= 3)
+        _end(task)
+        assert busy.peak == 1
+        assert not [run for run in task.runs if run.status == SKIPPED]
+        finished = [run for run in task.runs if run.status == FINISHED]
+        for before, after in zip(finished, finished[1:]):
+            assert after.planned > before.planned
+            assert after.begin_time >= before.finish_time
+            assert after.begin_time > after.planned  # 排队的一次在上次结束后才执行
+
+    def test_allow(self):
+        busy = _Busy(0.35)
+        task = _recurring(busy, ALLOW)
+        wait_until(lambda: busy.peak >= 2)
+        _end(task)
+        wait_until(lambda: not busy.active)
+        assert not [run for run in task.runs if run.status == SKIPPED]
+
+    def test_unknown_overlap(self):
+        with pytest.raises(ValueError):
+            _recurring(_Busy(0), 'o')
@@ -0,0 +1,117 @@
+# coding=utf-8
+
+"""
+@Author: LiangChao
+@Email: nobody_team@outlook.com
+@File: test_schedule
+@Created: 2026/10/18
+@Desc: nobody.t 调度器回归测试
+"""
+import datetime
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from nobody.t import Scheduler, ScheduleValueError, SKIP, QUEUE, REPLACE
+from tests.conftest import wait_until
+
+
+def fail():
+    raise ZeroDivisionError('bad job')
+
+
+class TestRunPending:
+    def test_failing_job_does_not_block_others(self):
+        scheduler = Scheduler()
+        calls = []
+        scheduler.every(1).seconds.do(fail)
+        scheduler.every(1).seconds.do(calls.append, 1)
+        scheduler.every(1).seconds.do(calls.append, 2)
+        for rounds in (1, 2):
+            time.sleep(1.1)
+            with pytest.raises(ZeroDivisionError):
+                scheduler.run_pending()
+            assert calls == [1, 2] * rounds
+            now = datetime.datetime.now()
+            assert len(scheduler.jobs) == 3
+            assert all(job.next_time > now for job in scheduler.jobs)
+
+
+class TestRunInThread:
+    def test_loop_survives_failing_job(self):
+        scheduler = Scheduler()
+        calls = []
+        scheduler.every(1).seconds.do(fail)
+        scheduler.every(1).seconds.do(calls.append, 1)
+        thread = scheduler.run_in_thread()
+        try:
+            time.sleep(2.5)
+            assert thread.is_alive()
+            assert len(calls) >= 2
+        finally:
+            scheduler.stop(5)
+        assert not thread.is_alive()
+
+
+class _Blocking:
+    """
+    阻塞直到放行的任务，记录同时执行的最大数量
+    """
+
+    def __init__(self):
+        self.release = threading.Event()
+        self.lock = threading.Lock()
+        self.active = self.peak = self.calls = 0
+
+    def __call__(self):
+        with self.lock:
+            self.active += 1
+            self.calls += 1
+            self.peak = max(self.peak, self.active)
+        self.release.wait(5)
+        with self.lock:
+            self.active -= 1
+
+
+class TestMaxInstances:
+    @pytest.mark.parametrize('max_instances, overlap, calls', [
+        (2, SKIP, 2),  # 超出的两次被丢弃
+        (1, QUEUE, 4),  # 超出的三次依次执行
+        (1, REPLACE, 2),  # 只保留最后一次
+    ])
+    def test_overlap(self, max_instances, overlap, calls):
+        job = _Blocking()
+        with ThreadPoolExecutor(4) as executor:
+            scheduler = Scheduler(executor)
+            scheduled = scheduler.every(1).hours.do(job).limit(max_instances, overlap)
+            for _ in range(4):
+                scheduler.run_all()
+            wait_until(lambda: job.active == max_instances)
+            assert scheduled._instances == max_instances
+            job.release.set()
+            wait_until(lambda: not scheduled._instances)
+        assert job.calls == calls
+        assert job.peak == max_instances
+        assert not scheduled._pending
+
+    def test_cancelled_job_drops_queued_runs(self):
+        job = _Blocking()
+        with ThreadPoolExecutor(2) as executor:
+            scheduler = Scheduler(executor)
+            scheduled = scheduler.every(1).hours.do(job).limit(1, QUEUE)
+            for _ in range(3):
+                scheduler.run_all()
+            wait_until(lambda: job.active == 1)
+            scheduler.cancel_job(scheduled)
+            job.release.set()
+            wait_until(lambda: not scheduled._instances)
+        assert job.calls == 1
+
+    def test_invalid_limit(self):
+        scheduler = Scheduler()
+        with pytest.raises(ScheduleValueError):
+            scheduler.every(1).hours.do(print).limit(0)
+        with pytest.raises(ScheduleValueError):
+            scheduler.every(1).hours.do(print).limit(1, 'o')
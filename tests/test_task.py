@@ -0,0 +1,313 @@
+# coding=utf-8
+
+"""
+@Author: LiangChao
+@Email: nobody_team@outlook.com
+@File: test_task
+@Created: 2026/10/18
+@Desc: task_service 回归测试
+"""
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timedelta
+
+import pytest
+
+from nobody.task import _Task, task_service, join, checkpoint, TaskRejectedError, TaskTerminatedError, REJECT, BLOCK, \
+    CALLER_RUNS, DISCARD_OLDEST, FINISHED, CANCELED, RUNNING, PAUSED, FAILED, TERMINATED, PROCESS
+from tests.conftest import wait_until
+
+
+pytestmark = pytest.mark.usefixtures('service')
+
+
+def _occupy(workers):
+    """
+    占满全部工作线程，返回用于放行的 Event 与占位任务
+    """
+    release = threading.Event()
+    blockers = [task_service.submit(release.wait) for _ in range(workers)]
+    wait_until(lambda: all(t.status == RUNNING for t in blockers))
+    return release, blockers
+
+
+class TestQueueBackpressure:
+    def test_reject_raises_in_submit(self):
+        task_service.configure(max_workers=1, max_queue_size=1, policy=REJECT)
+        release, blockers = _occupy(1)
+        try:
+            queued = task_service.submit(time.sleep, 0)
+            rejected = 0
+            for _ in range(50):
+                try:
+                    task_service.submit(time.sleep, 0)
+                except TaskRejectedError:
+                    rejected += 1
+            assert rejected == 50
+        finally:
+            release.set()
+        assert queued.result(5) is None
+
+    def test_block_waits_on_caller_thread(self):
+        task_service.configure(max_workers=1, max_queue_size=1, policy=BLOCK)
+        release, blockers = _occupy(1)
+        task_service.submit(time.sleep, 0)
+        submitted = threading.Event()
+        producer = threading.Thread(target=lambda: (task_service.submit(time.sleep, 0), submitted.set()))
+        producer.start()
+        try:
+            assert not submitted.wait(0.3)
+        finally:
+            release.set()
+        assert submitted.wait(5)
+        producer.join(5)
+
+    def test_caller_runs_on_caller_thread(self):
+        task_service.configure(max_workers=1, max_queue_size=1, policy=CALLER_RUNS)
+        release, blockers = _occupy(1)
+        try:
+            task_service.submit(time.sleep, 0)
+            task = task_service.submit(threading.get_ident)
+            assert task.status == FINISHED
+            assert task.result(0) == threading.get_ident()
+        finally:
+            release.set()
+
+    def test_discard_oldest_cancels_queued(self):
+        task_service.configure(max_workers=1, max_queue_size=1, policy=DISCARD_OLDEST)
+        release, blockers = _occupy(1)
+        try:
+            oldest = task_service.submit(time.sleep, 0)
+            newest = task_service.submit(time.sleep, 0)
+            assert oldest.status == CANCELED
+        finally:
+            release.set()
+        assert newest.result(5) is None
+
+    def test_submit_many_is_bounded(self):
+        task_service.configure(max_workers=1, max_queue_size=2, policy=REJECT)
+        release, blockers = _occupy(1)
+        try:
+            with pytest.raises(TaskRejectedError):
+                task_service.submit_many(time.sleep, [(0,)] * 3)
+            batch = task_service.submit_many(time.sleep, [(0,)] * 2)
+        finally:
+            release.set()
+        assert batch.results(5) == [None, None]
+
+
+class TestDispatcherSurvival:
+    def test_worker_crash(self):
+        crashed = task_service.submit(os._exit, 1, task_executor=PROCESS)
+        assert isinstance(crashed.exception(30), BrokenProcessPool)
+        assert crashed.status == FAILED
+        assert not crashed.task_handler._owner  # 共享内存已释放
+        assert task_service.submit(pow, 2, 10, task_executor=PROCESS).result(30) == 1024
+        assert task_service.submit(pow, 2, 10).result(5) == 1024
+
+    def test_broken_pool_is_rebuilt_on_submit(self):
+        pool = task_service.process_executor
+        task_service.submit(os._exit, 1, task_executor=PROCESS).exception(30)
+        task_service._process_executor = pool  # 模拟仍在使用已损坏的进程池
+        assert task_service.submit(pow, 2, 10, task_executor=PROCESS).result(30) == 1024
+        assert task_service.process_executor is not pool
+
+    def test_queued_process_tasks_do_not_hold_workers(self):
+        task_service.configure(max_workers=4, max_processes=1)
+        task_service.submit(pow, 2, 10, task_executor=PROCESS).result(30)  # 预热进程池
+        slow = [task_service.submit(time.sleep, 1, task_executor=PROCESS) for _ in range(4)]
+        wait_until(lambda: slow[0].status == RUNNING, 30)
+        assert [t.status for t in slow[1:]] == [None] * 3
+        begin = time.monotonic()
+        assert task_service.submit(pow, 2, 10).result(5) == 1024
+        assert time.monotonic() - begin < 0.3
+        for t in slow:
+            t.cancel()
+
+    def test_submit_failure(self, monkeypatch):
+        def broken(fn, *args, **kwargs):
+            raise RuntimeError('executor is gone')
+
+        monkeypatch.setattr(task_service._task_executor, 'submit', broken)
+        failed = task_service.submit(pow, 2, 10)
+        assert isinstance(failed.exception(5), RuntimeError)
+        monkeypatch.undo()
+        assert task_service.submit(pow, 2, 10).result(5) == 1024
+        assert task_service.count(RUNNING) == 0
+
+
+class TestRegistry:
+    def test_get_while_status_changes(self):
+        stop = threading.Event()
+        task = task_service.submit(stop.wait)
+        wait_until(lambda: task.status == RUNNING)
+        missing = []
+
+        def lookup():
+            while not stop.is_set():
+                if task_service.get_task(task.id) is None:
+                    missing.append(task.id)
+
+        reader = threading.Thread(target=lookup)
+        reader.start()
+        try:
+            for _ in range(2000):
+                task.pause()
+                task.resume()
+        finally:
+            stop.set()
+            reader.join()
+        assert not missing
+
+
+def fib(n):
+    if n < 2:
+        return n
+    a, b = task_service.spawn(fib, n - 1), task_service.spawn(fib, n - 2)
+    return a.result() + b.result()
+
+
+def fib_join(n):
+    if n < 2:
+        return n
+    subs = [task_service.spawn(fib_join, n - 1), task_service.spawn(fib_join, n - 2)]
+    join(subs)
+    return sum(sub.result(0) for sub in subs)
+
+
+class TestSpawn:
+    @pytest.mark.parametrize('target', [fib, fib_join])
+    def test_waiting_parent_runs_subtasks(self, target):
+        task_service.configure(max_workers=2)
+        assert task_service.submit(target, 12).result(30) == 144
+
+
+class TestLimiter:
+    def test_blocked_task_counted_once(self):
+        release = threading.Event()
+        task_service.set_limiter('test-limiter', max_running=1)
+        try:
+            blocker = task_service.submit(release.wait, task_group='test-limiter')
+            wait_until(lambda: blocker.status == RUNNING)
+            held = task_service.submit(time.sleep, 0, task_group='test-limiter')
+            for _ in range(50):  # 其他分组的任务反复唤醒分发线程
+                task_service.submit(time.sleep, 0).result(5)
+            assert held.status is None
+            assert task_service.limiter_stats()['test-limiter']['limited_by_concurrency'] == 1
+            release.set()
+            assert held.result(5) is None
+        finally:
+            release.set()
+            task_service.remove_limiter('test-limiter')
+
+
+def echo_kwargs(**kwargs):
+    return kwargs
+
+
+def spin(seconds):
+    end = time.monotonic() + seconds
+    while time.monotonic() < end:
+        checkpoint()
+        time.sleep(0.01)
+
+
+class TestSubmit:
+    def test_target_kwargs_are_not_captured(self):
+        kwargs = dict(timeout=5, deadline='tomorrow', schedule='daily', executor='x', priority=1, group='g',
+                      depends_on=[1], recurring=True, overlap='o')
+        assert task_service.submit(echo_kwargs, **kwargs).result(5) == kwargs
+
+    def test_task_timeout_counts_from_start(self, monkeypatch):
+        gate = ThreadPoolExecutor(1)  # 已分发的任务在执行器中排队，迟迟不能开始
+        gate.submit(time.sleep, 0.3)
+        monkeypatch.setattr(task_service._task_executor, 'submit', gate.submit)
+        task = task_service.submit(pow, 2, 10, task_timeout=0.1)
+        assert task.result(5) == 1024
+        gate.shutdown()
+
+    def test_task_deadline_cancels_unstarted(self):
+        release, blockers = _occupy(task_service.max_workers)
+        try:
+            task = task_service.submit(time.sleep, 0, task_deadline=datetime.now() + timedelta(seconds=0.1))
+            wait_until(lambda: task.done())
+            assert task.status == CANCELED
+        finally:
+            release.set()
+
+    def test_task_timeout_stops_task(self):
+        task = task_service.submit(spin, 5, task_timeout=0.1)
+        with pytest.raises(TaskTerminatedError):
+            task.result(5)
+
+
+class TestStop:
+    def test_process_result_after_stop(self):
+        task = task_service.submit(spin, 30, task_executor=PROCESS)
+        wait_until(lambda: task.status == RUNNING and task.task_handler.pid, 30)
+        task.stop('bye')
+        wait_until(lambda: not task.task_handler._owner)  # 控制器已关闭
+        with pytest.raises(TaskTerminatedError, match='bye'):
+            task.result(5)
+        assert task.status == TERMINATED
+        assert task.stop_reason == 'bye'
+
+    def test_timeout_reason(self):
+        task = task_service.submit(spin, 30, task_executor=PROCESS, task_timeout=0.5)
+        with pytest.raises(TaskTerminatedError, match='timeout'):
+            task.result(30)
+        wait_until(lambda: not task.task_handler._owner)
+        assert isinstance(task.exception(0), TaskTerminatedError)
+
+
+class TestImport:
+    def test_numpy_is_not_imported(self):
+        code = 'import sys, nobody.task; sys.exit("numpy" in sys.modules)'
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        assert subprocess.run([sys.executable, '-c', code], cwd=root).returncode == 0
+
+
+class TestTrace:
+    def test_events_recorded_only_when_tracing(self, tmp_path):
+        untraced = task_service.submit(pow, 2, 10)
+        untraced.result(5)
+        assert untraced.events == ()
+        task_service.enable_trace(str(tmp_path / 'trace.json'))
+        try:
+            traced = task_service.submit(pow, 2, 10)
+            traced.result(5)
+            wait_until(lambda: 'finish' in [event for event, _, _ in traced.events])
+        finally:
+            task_service.disable_trace()
+        assert [event for event, _, _ in traced.events][0] == 'submit'
+        with open(tmp_path / 'trace.json', encoding='utf-8') as f:
+            names = {event['name'] for event in json.load(f)['traceEvents']}
+        assert 'pow' in names
+
+
+class TestTransition:
+    def test_concurrent_terminal_transitions(self, monkeypatch):
+        errors = []
+        monkeypatch.setattr(threading, 'excepthook', errors.append)
+        outcomes = {FINISHED: None, FAILED: RuntimeError('failed'), TERMINATED: TaskTerminatedError('bye')}
+        for _ in range(200):
+            task = _Task(pow, 2, 10)
+            task._result = None
+            future = task._done
+            barrier = threading.Barrier(len(outcomes))
+            threads = [threading.Thread(target=lambda s=status, e=e: (barrier.wait(), task._transition(s, e)))
+                       for status, e in outcomes.items()]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+            assert future.done()
+            assert future.exception() is outcomes[task.status]
+            assert not task._transition(CANCELED)
+        assert not errors
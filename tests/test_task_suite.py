@@ -0,0 +1,34 @@
+# coding=utf-8
+
+"""
+@Author: LiangChao
+@Email: nobody_team@outlook.com
+@File: test_task_suite
+@Created: 2026/10/18
+@Desc: 综合基准结果对比的回归测试
+"""
+import json
+
+from benchmark.task_suite import compare
+
+
+def _write(path, bytes_per_task, listeners_per_task=4):
+    path.write_text(json.dumps({'results': [{
+        'workers': 4,
+        'tasks': 1000,
+        'memory': {'tasks': 1000, 'bytes_per_task': bytes_per_task},
+        'listeners': {'listeners_per_task': listeners_per_task, 'baseline_per_second': 1000.0},
+    }]}), encoding='utf-8')
+    return str(path)
+
+
+class TestCompare:
+    def test_memory_regression_is_reported(self, tmp_path):
+        old = _write(tmp_path / 'old.json', 300)
+        new = _write(tmp_path / 'new.json', 1500)
+        assert compare(old, new) == 1
+
+    def test_parameters_are_not_compared(self, tmp_path):
+        old = _write(tmp_path / 'old.json', 300)
+        new = _write(tmp_path / 'new.json', 300, listeners_per_task=8)
+        assert compare(old, new) == 0
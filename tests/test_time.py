@@ -0,0 +1,80 @@
+# coding=utf-8
+
+"""
+@Author: LiangChao
+@Email: nobody_team@outlook.com
+@File: test_time
+@Created: 2026/10/18
+@Desc: nobody.time 执行计划展开测试：get_during 与逐次 next 的结果一致，timeline 合并与分时段统计
+"""
+from datetime import datetime, timedelta
+
+import pytest
+
+from nobody.time import Schedule, every, cron, timeline
+
+START = datetime(2026, 10, 18, 8, 30)
+
+
+def _iterate(schedule, start, end):
+    """
+    逐次 next 得到 [start, end) 内的执行时间
+    """
+    times = []
+    moment = next(schedule)
+    while moment < end:
+        if moment >= start:
+            times.append(moment)
+        moment = next(schedule)
+    return times
+
+
+class TestGetDuring:
+    @pytest.mark.parametrize('build', [
+        lambda: every(7).minutes,
+        lambda: every(3).hours,
+        lambda: every(1).days.at(hour=9, minute=15),
+        lambda: every(1).hours.at(minute=0),
+        lambda: every(1).friday,
+        lambda: cron('*/20 9-17 * * mon-fri'),
+        lambda: cron('0 0 1,15 * *'),
+    ])
+    def test_matches_iteration(self, build):
+        start, end = START + timedelta(days=2), START + timedelta(days=40)
+        expected = _iterate(build().begin_at(START), start, end)
+        assert build().begin_at(START).get_during(start, end).tolist() == expected
+
+    def test_does_not_change_state(self):
+        schedule = every(2).hours.begin_at(START)
+        schedule.get_during(START, START + timedelta(days=1))
+        assert next(schedule) == START + timedelta(hours=2)
+
+    def test_bounds(self):
+        schedule = every(1).hours.begin_at(START)
+        times = schedule.get_during(START + timedelta(hours=1), START + timedelta(hours=4)).tolist()
+        assert times == [START + timedelta(hours=h) for h in (1, 2, 3)]  # 含起点，不含终点
+
+    def test_once(self):
+        schedule = Schedule().at(year=2026, month=10, day=20, hour=9, minute=0, second=0)
+        assert schedule.get_during(START, START + timedelta(days=7)).tolist() == [datetime(2026, 10, 20, 9)]
+        assert schedule.get_during(START, START + timedelta(days=1)).tolist() == []
+
+
+class TestTimeline:
+    def test_merge_and_load(self):
+        schedules = [every(30).minutes.begin_at(START), cron('0 * * * *'), every(1).days.begin_at(START)]
+        end = START + timedelta(hours=6)
+        result = timeline(schedules, START, end)
+        times = result.times.tolist()
+        assert times == sorted(times)
+        for index, schedule in enumerate(schedules):
+            owned = [t for t, owner in zip(times, result.owners.tolist()) if owner == index]
+            assert owned == schedule.get_during(START, end).tolist()
+        assert result.slots.tolist() == [START + timedelta(hours=h) for h in range(6)]
+        assert result.load.tolist() == [2, 3, 3, 3, 3, 3]  # 首个时段不含 begin_at 本身
+        assert result.load.sum() == len(times)
+
+    def test_empty(self):
+        result = timeline([], START, START + timedelta(hours=2))
+        assert len(result.times) == 0
+        assert result.load.tolist() == [0, 0]